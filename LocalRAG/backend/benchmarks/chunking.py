@@ -0,0 +1,105 @@
+# benchmarks/chunking.py
+"""
+Chunks-per-second and token fill of both chunking modes on a large document.
+
+Run from `backend/`:
+
+    python -m benchmarks.chunking                 # synthetic 3000-page document
+    python -m benchmarks.chunking --pdf file.pdf  # sentences of a real PDF
+
+Only the chunking stages are timed; for a PDF, text extraction and sentence splitting run
+once beforehand. Token counts use the embedding model's tokenizer, and the report shows how
+many chunks would be truncated by, or fill less than half of, the model's window.
+"""
+import time
+import random
+import argparse
+from modules.utils import load_config, embedding_model
+from modules.embedding import chunk_token_budget
+from modules.text_chunking import iter_sentence_chunks, iter_chunks, iter_token_chunks, ChunkReport
+
+WORDS = ("the party agreement shall term contract effective date of and to in section clause "
+         "notice payment lessee lessor obligations termination").split()
+
+
+def synthetic_pages(num_pages: int, sentences_per_page: int = 60, seed: int = 0) -> list[dict]:
+    """
+    Pages of random contract-like sentences, already split like the sentencizer output.
+    """
+    generator = random.Random(seed)
+
+    def sentence():
+        return " ".join(generator.choice(WORDS) for _ in range(generator.randint(8, 30))).capitalize() + "."
+
+    return [{"page_number": page_number, "sentences": [sentence() for _ in range(sentences_per_page)]}
+            for page_number in range(num_pages)]
+
+
+def pdf_pages(pdf_path: str, config: dict) -> list[dict]:
+    """
+    Sentences of every page of a PDF.
+    """
+    from modules.pdf_processing import text_formatter, iter_pdf_pages, iter_sentences
+    pages = iter_pdf_pages(text_formatter(pdf_path), num_workers=config["ingestion_workers"])
+    return list(iter_sentences(pages, batch_size=config["sentencizer_batch_size"], n_process=config["ingestion_workers"]))
+
+
+def iter_mode_chunks(pages, mode: str, config: dict, tokenizer, max_tokens: int):
+    """
+    Chunks of the pages in the given chunking mode, with the ingestion pipeline's settings.
+    """
+    if mode == "tokens":
+        return iter_token_chunks(pages, tokenizer, max_tokens=max_tokens, overlap_tokens=config["chunk_overlap_tokens"])
+    return iter_chunks(iter_sentence_chunks(pages, config["chunk_size"], overlap=config["chunk_overlap"]),
+                       tokenizer=tokenizer)
+
+
+def run_chunking_benchmark(pages: list[dict], mode: str, config: dict, model, repeats: int = 3) -> dict:
+    """
+    Time chunking of the pages, keeping the best of `repeats` runs, and report the token fill.
+
+    Returns:
+        dict: Mode, number of chunks, best time in seconds, chunks per second and the `ChunkReport` summary.
+    """
+    window = chunk_token_budget(model)
+    max_tokens = chunk_token_budget(model, config["chunk_max_tokens"])
+
+    best_seconds = float("inf")
+    for _ in range(repeats):
+        # The chunking stages add keys to the page dictionaries, so work on fresh copies
+        fresh_pages = [{"page_number": page["page_number"], "sentences": page["sentences"]} for page in pages]
+        report = ChunkReport(window)
+        start_time = time.perf_counter()
+        for _ in report.track(iter_mode_chunks(fresh_pages, mode, config, model.tokenizer, max_tokens)):
+            pass
+        best_seconds = min(best_seconds, time.perf_counter() - start_time)
+    return {"mode": mode, "num_chunks": report.num_chunks, "seconds": round(best_seconds, 4),
+            "chunks_per_second": round(report.num_chunks / max(best_seconds, 1e-9)), "report": report.summary()}
+
+
+def print_results(results: list[dict]):
+    print(f"{'mode':<10} {'chunks':>7} {'chunks/sec':>11} {'mean tokens':>12} {'truncated':>10} "
+          f"{'lost tokens':>12} {'underfilled':>12}")
+    for row in results:
+        report = row["report"]
+        print(f"{row['mode']:<10} {row['num_chunks']:>7} {row['chunks_per_second']:>11} "
+              f"{report['mean_tokens']:>8} /{report['max_tokens']:<3} {report['truncated_rate']:>10.1%} "
+              f"{report['truncated_tokens']:>12} {report['underfilled_rate']:>12.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", help="Benchmark the sentences of this PDF instead of a synthetic document.")
+    parser.add_argument("--pages", type=int, default=3000, help="Number of synthetic pages.")
+    parser.add_argument("--repeats", type=int, default=3, help="Number of timed runs; the best one is reported.")
+    args = parser.parse_args()
+
+    config = load_config("config.yaml")
+    model = embedding_model(device="cpu")
+    pages = pdf_pages(args.pdf, config) if args.pdf else synthetic_pages(args.pages)
+
+    print(f"{len(pages)} pages, chunk_size={config['chunk_size']}, chunk_overlap={config['chunk_overlap']}, "
+          f"chunk_max_tokens={chunk_token_budget(model, config['chunk_max_tokens'])}, "
+          f"chunk_overlap_tokens={config['chunk_overlap_tokens']}\n")
+    print_results([run_chunking_benchmark(pages, mode, config, model, repeats=args.repeats)
+                   for mode in ("sentences", "tokens")])
@@ -0,0 +1,306 @@
+# benchmarks/pipeline.py
+"""
+End-to-end benchmark of the ingestion and query stages on a synthetic PDF.
+
+Run from `backend/`:
+
+    python -m benchmarks.pipeline --pages 200 --output results.json
+    python -m benchmarks.pipeline --pages 200 --compare results.json  # exit code 1 on a regression
+
+Each stage runs on the output of the previous one: extraction, sentencizing, chunking,
+entity extraction, embedding, save, load, index build, BM25 index build, dense retrieval, hybrid (dense + BM25)
+retrieval, cross-encoder re-ranking (when `rerank` is enabled), context packing and answer. Answers come from the stub LLM
+backend, so no API key or network is needed. Every stage reports its throughput and peak
+RSS; the per-query stages also report p50/p95 latency. Results are written as JSON.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import resource
+import subprocess
+import fitz
+import torch
+from modules.utils import load_config, embedding_model, EMBEDDING_MODEL_NAME
+from modules.pdf_processing import iter_pdf_pages, iter_sentences
+from modules.embedding import iter_embedded_chunks, chunk_token_budget
+from modules.vector_store import save_vector_store, load_vector_store
+from modules.vector_index import build_index
+from modules.lexical_index import build_lexical_index
+from modules.entities import annotate_entities
+from modules.reranking import Reranker
+from modules.retrieval import retrieve_relevant_resources, format_results
+from modules.context_packing import token_counter, pack_context, unpacked_context
+from modules.query_processing import answer_query
+from benchmarks.chunking import synthetic_pages, iter_mode_chunks
+
+# Metrics compared by --compare, and whether a higher value is better
+COMPARED_METRICS = {"throughput": True, "p95_ms": False}
+
+# Stages faster than this in the baseline are not compared; timer noise dominates them
+MIN_COMPARED_SECONDS = 0.05
+
+
+def make_synthetic_pdf(path: str, num_pages: int, sentences_per_page: int = 25, seed: int = 0):
+    """
+    Write a PDF of contract-like pages. Every tenth page states an effective date, so date
+    questions exercise the function-calling path of the answer stage.
+    """
+    pages = synthetic_pages(num_pages, sentences_per_page=sentences_per_page, seed=seed)
+    with fitz.open() as document:
+        for page in pages:
+            sentences = page["sentences"]
+            if page["page_number"] % 10 == 0:
+                sentences = sentences + [f"This agreement is effective as of January {page['page_number'] % 28 + 1}, 2024."]
+            document.new_page().insert_textbox(fitz.Rect(40, 40, 555, 800), " ".join(sentences), fontsize=8)
+        document.save(path)
+
+
+def sample_queries(pages: list[dict], num_queries: int, seed: int = 0) -> list[str]:
+    """
+    Questions built from the document's sentences, with an effective date question every fourth query.
+    """
+    generator = random.Random(seed)
+    sentences = [sentence for page in pages for sentence in page["sentences"]]
+    return ["What is the effective date of the agreement?" if i % 4 == 3
+            else " ".join(generator.choice(sentences).split()[:8])
+            for i in range(num_queries)]
+
+
+def peak_rss_bytes() -> int:
+    """
+    Peak resident set size of this process since the last `reset_peak_rss`, in bytes.
+    """
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is the lifetime peak, in kilobytes on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def reset_peak_rss():
+    """
+    Reset the peak RSS to the current RSS where the kernel allows it (Linux), so each stage
+    reports its own peak. Elsewhere the peak is the process-wide one.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+    except OSError:
+        pass
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Nearest-rank percentile of a list of values, with q in [0, 100].
+    """
+    ordered = sorted(values)
+    rank = max(int(round(q / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def run_stage(results: dict, name: str, function, count_items=len):
+    """
+    Run one batch stage, record its time, throughput and peak RSS in `results` and return its output.
+    """
+    reset_peak_rss()
+    start_time = time.perf_counter()
+    output = function()
+    seconds = time.perf_counter() - start_time
+    items = count_items(output)
+    results[name] = {"seconds": round(seconds, 4), "items": items,
+                     "throughput": round(items / max(seconds, 1e-9), 2),
+                     "peak_rss_mb": round(peak_rss_bytes() / 2**20, 1)}
+    return output
+
+
+def run_latency_stage(results: dict, name: str, function, inputs: list) -> list:
+    """
+    Run a per-request stage once per input, record its latency percentiles in `results`
+    and return the outputs.
+    """
+    reset_peak_rss()
+    outputs = []
+    latencies = []
+    for item in inputs:
+        start_time = time.perf_counter()
+        outputs.append(function(item))
+        latencies.append(time.perf_counter() - start_time)
+    results[name] = {"seconds": round(sum(latencies), 4), "items": len(inputs),
+                     "throughput": round(len(inputs) / max(sum(latencies), 1e-9), 2),
+                     "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+                     "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+                     "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+                     "peak_rss_mb": round(peak_rss_bytes() / 2**20, 1)}
+    return outputs
+
+
+def run_pipeline_benchmark(pdf_path: str, config: dict, model, num_queries: int, work_dir: str) -> dict:
+    """
+    Measure every stage of ingesting the PDF and answering questions about it.
+
+    Returns:
+        dict: Stage name -> time, items, throughput, peak RSS and, for query stages, latency percentiles.
+    """
+    stages = {}
+    pages = run_stage(stages, "extraction", lambda: list(iter_pdf_pages(pdf_path, num_workers=config["ingestion_workers"])))
+    pages = run_stage(stages, "sentencizing", lambda: list(iter_sentences(pages, batch_size=config["sentencizer_batch_size"],
+                                                                         n_process=config["ingestion_workers"])))
+
+    max_tokens = chunk_token_budget(model, config["chunk_max_tokens"])
+    chunks = run_stage(stages, "chunking", lambda: list(iter_mode_chunks(pages, config["chunking_mode"], config,
+                                                                         model.tokenizer, max_tokens)))
+    chunks = run_stage(stages, "entities", lambda: list(annotate_entities(chunks)))
+
+    # No embedding cache, so every chunk goes through the model
+    embedded = run_stage(stages, "embedding", lambda: [chunk for window in iter_embedded_chunks(
+        chunks, model, batch_size=config["embedding_batch_size"], max_batch_tokens=config["embedding_max_batch_tokens"],
+        window_size=config["embedding_window_size"]) for chunk in window])
+
+    store_dir = os.path.join(work_dir, "store")
+    run_stage(stages, "save", lambda: save_vector_store(embedded, store_dir, dtype=config["embedding_dtype"]),
+              count_items=lambda _: len(embedded))
+    stored_chunks, embeddings = run_stage(stages, "load", lambda: load_vector_store(store_dir),
+                                          count_items=lambda output: len(output[0]))
+    index = run_stage(stages, "index_build", lambda: build_index(embeddings, config), count_items=lambda _: len(embedded))
+    lexical_index = run_stage(stages, "bm25_build", lambda: build_lexical_index(stored_chunks, config), count_items=len)
+
+    # Queries are embedded one at a time, without the query cache, like first-time questions.
+    # Answers are generated from the dense results, so the answer stage is comparable across versions;
+    # effective date calls are answered from the indexed entities when `entity_answers` is on
+    queries = sample_queries(pages, num_queries)
+    n_resources = min(config["top_k"], len(stored_chunks))
+    retrieved = run_latency_stage(stages, "retrieval", lambda query: retrieve_relevant_resources(
+        query, embeddings, model, n_resources_to_return=n_resources,
+        metric=config["similarity_metric"], index=index), queries)
+    # The same queries again, fusing the dense candidates with BM25 ones
+    run_latency_stage(stages, "hybrid_retrieval", lambda query: retrieve_relevant_resources(
+        query, embeddings, model, n_resources_to_return=n_resources,
+        metric=config["similarity_metric"], index=index, lexical_index=lexical_index,
+        num_candidates=config["hybrid_candidates"], rrf_k=config["rrf_k"]), queries)
+
+    # Re-ranking the over-fetched dense candidates, without a latency budget so every pass is timed
+    if config["rerank"]:
+        reranker = Reranker(config["rerank_model"], budget_seconds=None)
+        reranker.model()
+        num_candidates = min(max(config["rerank_candidates"], n_resources), len(stored_chunks))
+        candidates = [retrieve_relevant_resources(query, embeddings, model, n_resources_to_return=num_candidates,
+                                                  metric=config["similarity_metric"], index=index)
+                      for query in queries]
+        run_latency_stage(stages, "rerank", lambda item: reranker.rerank(
+            item[0], format_results(*item[1], stored_chunks), n_resources), list(zip(queries, candidates)))
+
+    stub_config = dict(config, llm_backend="stub")
+    contexts = [format_results(scores, indices, stored_chunks) for scores, indices in retrieved]
+
+    # Packing each answer context under the token budget, and the prompt tokens it saves
+    count_tokens = token_counter(config["model"])
+    reports = run_latency_stage(stages, "context_packing", lambda context: pack_context(
+        context, count_tokens, config["context_max_tokens"])[1], contexts)
+    stages["context_packing"]["context_tokens"] = sum(report["context_tokens"] for report in reports)
+    stages["context_packing"]["unpacked_tokens"] = sum(count_tokens(unpacked_context(context)) for context in contexts)
+    stages["context_packing"]["duplicate_sentences"] = sum(report["duplicate_sentences"] for report in reports)
+
+    run_latency_stage(stages, "answer", lambda item: answer_query(item[0], item[1], stub_config),
+                      list(zip(queries, contexts)))
+    return stages
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(baseline: dict, current: dict, tolerance: float = 0.2) -> list[dict]:
+    """
+    List the stage metrics that got worse than the baseline by more than `tolerance` (a fraction).
+    """
+    regressions = []
+    for stage, metrics in current["stages"].items():
+        baseline_metrics = baseline.get("stages", {}).get(stage, {})
+        if baseline_metrics.get("seconds", 0) < MIN_COMPARED_SECONDS:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            before = baseline_metrics.get(metric)
+            after = metrics.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append({"stage": stage, "metric": metric, "baseline": before,
+                                    "current": after, "change": round(change, 3)})
+    return regressions
+
+
+def print_results(results: dict):
+    document = results["document"]
+    print(f"{document['pages']} pages, {document['chunks']} chunks, {results['queries']} queries "
+          f"({results['config']['chunking_mode']} chunking, {results['config']['index_backend']} index)\n")
+    print(f"{'stage':<16} {'items':>7} {'seconds':>9} {'items/sec':>11} {'p50 ms':>9} {'p95 ms':>9} {'peak RSS MB':>12}")
+    for stage, metrics in results["stages"].items():
+        p50 = f"{metrics['p50_ms']:.2f}" if "p50_ms" in metrics else "-"
+        p95 = f"{metrics['p95_ms']:.2f}" if "p95_ms" in metrics else "-"
+        print(f"{stage:<16} {metrics['items']:>7} {metrics['seconds']:>9.3f} {metrics['throughput']:>11.1f} "
+              f"{p50:>9} {p95:>9} {metrics['peak_rss_mb']:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=100, help="Number of pages of the synthetic PDF.")
+    parser.add_argument("--sentences-per-page", type=int, default=25, help="Sentences on each synthetic page.")
+    parser.add_argument("--queries", type=int, default=50, help="Number of queries for the retrieval and answer stages.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results.")
+    parser.add_argument("--compare", help="JSON results of a previous run to check for regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Relative slowdown of a stage reported as a regression (default 0.2).")
+    args = parser.parse_args()
+
+    config = load_config("config.yaml")
+    model = embedding_model(device="cpu")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        pdf_path = os.path.join(work_dir, "synthetic.pdf")
+        make_synthetic_pdf(pdf_path, args.pages, sentences_per_page=args.sentences_per_page)
+        stages = run_pipeline_benchmark(pdf_path, config, model, args.queries, work_dir)
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_revision": git_revision(),
+        "platform": {"python": platform.python_version(), "torch": torch.__version__,
+                     "machine": platform.machine(), "cpu_count": os.cpu_count()},
+        "config": {key: config[key] for key in ("chunking_mode", "chunk_size", "chunk_overlap", "chunk_max_tokens",
+                                                "embedding_dtype", "embedding_batch_size", "index_backend",
+                                                "similarity_metric", "top_k", "retrieval_mode",
+                                                "hybrid_candidates", "entity_answers", "rerank",
+                                                "rerank_model", "rerank_candidates", "context_max_tokens")},
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "document": {"pages": stages["extraction"]["items"], "chunks": stages["chunking"]["items"]},
+        "queries": args.queries,
+        "stages": stages
+    }
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print_results(results)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare_results(json.load(file), results, tolerance=args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression['stage']} {regression['metric']}: {regression['baseline']} -> "
+                  f"{regression['current']} ({regression['change']:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No stage regressed by more than {args.tolerance:.0%} against {args.compare}")
@@ -0,0 +1,122 @@
+# benchmarks/quantization.py
+"""
+Memory and recall@k of the quantized index backends against exact float32 search.
+
+Run from `backend/`:
+
+    python -m benchmarks.quantization                    # embeddings of the documents in the corpus
+    python -m benchmarks.quantization --synthetic 100000 # random clustered 768-dim embeddings
+
+Queries are stored chunks with a little noise added, so no embedding model is needed.
+"""
+import os
+import time
+import argparse
+import statistics
+import torch
+from modules.utils import load_config
+from modules.corpus import Corpus
+from modules.vector_store import load_vector_store
+from modules.vector_index import ExactIndex, QUANTIZED_INDEXES, recall_at_k
+
+
+def synthetic_embeddings(num_rows: int, dim: int = 768, num_clusters: int = 200, seed: int = 0) -> torch.Tensor:
+    """
+    Unit vectors drawn around random cluster centres, a rough stand-in for chunk embeddings.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    centres = torch.randn(num_clusters, dim, generator=generator)
+    assignments = torch.randint(0, num_clusters, (num_rows,), generator=generator)
+    vectors = centres[assignments] + 0.9 * torch.randn(num_rows, dim, generator=generator)
+    return torch.nn.functional.normalize(vectors, dim=1)
+
+
+def corpus_embeddings(config: dict) -> torch.Tensor:
+    """
+    Embeddings of every document in the corpus, stacked into one matrix.
+    """
+    corpus = Corpus(config["corpus_dir"])
+    tensors = [load_vector_store(os.path.join(corpus.corpus_dir, entry["store"]))[1]
+               for entry in corpus.documents().values()]
+    tensors = [tensor for tensor in tensors if tensor.shape[0] > 0]
+    if not tensors:
+        raise SystemExit("The corpus is empty; upload a document or pass --synthetic N.")
+    return torch.cat(tensors)
+
+
+def sample_queries(embeddings: torch.Tensor, num_queries: int, noise: float = 0.05, seed: int = 0) -> torch.Tensor:
+    """
+    Stored rows, slightly perturbed, standing in for real queries.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    rows = embeddings[torch.randperm(embeddings.shape[0], generator=generator)[:num_queries]].float()
+    return torch.nn.functional.normalize(rows + noise * torch.randn(rows.shape, generator=generator), dim=1)
+
+
+def query_latency_ms(index, queries: torch.Tensor, k: int) -> float:
+    """
+    Median latency of one query at a time, in milliseconds.
+    """
+    timings = []
+    for query in queries:
+        start_time = time.perf_counter()
+        index.search(query, k)
+        timings.append(time.perf_counter() - start_time)
+    return statistics.median(timings) * 1000
+
+
+def run_quantization_benchmark(embeddings: torch.Tensor, queries: torch.Tensor, k: int = 10,
+                               rescore_multipliers: tuple = (1, 4, 8, 16)) -> list[dict]:
+    """
+    Measure memory, recall@k and latency of exact search and every quantized backend.
+
+    Returns:
+        list[dict]: One row per backend and rescore multiplier.
+    """
+    exact = ExactIndex(embeddings)
+    float_bytes = embeddings.shape[0] * embeddings.shape[1] * 4
+    results = [{"backend": "exact", "rescore_multiplier": None, "resident_bytes": float_bytes,
+                "compression": 1.0, "recall_at_k": 1.0, "median_query_ms": round(query_latency_ms(exact, queries, k), 3)}]
+
+    for backend, index_class in QUANTIZED_INDEXES.items():
+        start_time = time.perf_counter()
+        index = index_class.build(embeddings)
+        build_seconds = time.perf_counter() - start_time
+
+        for multiplier in rescore_multipliers:
+            index.rescore_multiplier = multiplier
+            results.append({
+                "backend": backend,
+                "rescore_multiplier": multiplier,
+                "resident_bytes": index.nbytes,
+                "compression": round(float_bytes / index.nbytes, 1),
+                "recall_at_k": round(recall_at_k(index, exact, queries, k=k), 4),
+                "median_query_ms": round(query_latency_ms(index, queries, k), 3),
+                "build_seconds": round(build_seconds, 3)
+            })
+    return results
+
+
+def print_results(results: list[dict], num_rows: int, dim: int, k: int):
+    print(f"{num_rows} embeddings x {dim} dims, recall@{k} against exact float32 search\n")
+    print(f"{'backend':<8} {'rescore':>7} {'resident MB':>12} {'smaller':>8} {'recall':>7} {'ms/query':>9}")
+    for row in results:
+        multiplier = f"x{row['rescore_multiplier']}" if row["rescore_multiplier"] else "-"
+        print(f"{row['backend']:<8} {multiplier:>7} {row['resident_bytes'] / 2**20:>12.1f} "
+              f"{row['compression']:>7.1f}x {row['recall_at_k']:>7.3f} {row['median_query_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=0, help="Benchmark N random embeddings instead of the corpus.")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries.")
+    parser.add_argument("--k", type=int, default=10, help="Number of results compared per query.")
+    parser.add_argument("--multipliers", default="1,4,8,16", help="Comma-separated rescore multipliers.")
+    args = parser.parse_args()
+
+    embeddings = synthetic_embeddings(args.synthetic) if args.synthetic else corpus_embeddings(load_config("config.yaml"))
+    queries = sample_queries(embeddings, args.queries)
+    multipliers = tuple(int(value) for value in args.multipliers.split(","))
+
+    results = run_quantization_benchmark(embeddings, queries, k=args.k, rescore_multipliers=multipliers)
+    print_results(results, embeddings.shape[0], embeddings.shape[1], args.k)
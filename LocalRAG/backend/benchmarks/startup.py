@@ -0,0 +1,194 @@
+# benchmarks/startup.py
+"""
+Cold start of the API server: import time, time until the health check answers, and memory.
+
+Run from `backend/`:
+
+    python -m benchmarks.startup --runs 5 --output startup_results.json
+    python -m benchmarks.startup --warmup       # also time the background model warmup
+    python -m benchmarks.startup --with-corpus  # load the documents in the corpus at startup
+
+Every run uses a fresh interpreter. The import of the app is timed in its own process, which
+also lists the heavy libraries the import pulled in. Then `uvicorn main:app` is started and
+`/health/` is polled until it answers; with `--warmup`, polling goes on until the background
+warmup has finished. The server runs in a scratch directory holding a copy of config.yaml, so
+it starts with an empty corpus unless `--with-corpus` is given. The medians of all runs are
+written as JSON.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import urllib.request
+import yaml
+from modules.utils import load_config
+from benchmarks.pipeline import git_revision
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Libraries that take seconds to import; none of them should be needed before the first request
+HEAVY_MODULES = ("torch", "transformers", "sentence_transformers", "spacy", "pandas", "openai")
+
+# Prints the import time of the app and the heavy libraries it imported, as JSON
+IMPORT_SCRIPT = f"""
+import sys, time, json
+sys.path.insert(0, {BACKEND_DIR!r})
+start_time = time.perf_counter()
+import main
+seconds = time.perf_counter() - start_time
+print(json.dumps({{"seconds": seconds, "modules": [name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))
+"""
+
+
+def write_scratch_config(work_dir: str, config: dict, warmup: bool, with_corpus: bool):
+    """
+    Write the config.yaml the server reads in its scratch working directory.
+    """
+    config = dict(config, warmup_models=warmup)
+    if with_corpus:
+        # Point back at the stored documents instead of the scratch directory
+        for key in ("corpus_dir", "embedding_cache_path"):
+            config[key] = os.path.join(BACKEND_DIR, config[key])
+    with open(os.path.join(work_dir, "config.yaml"), "w") as file:
+        yaml.safe_dump(config, file)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def resident_memory_mb(pid: int) -> float:
+    """
+    Current resident memory of a process in MB, or None where /proc is not available.
+    """
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def get_health(url: str):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return json.load(response)
+    except OSError:
+        return None
+
+
+def time_import(work_dir: str) -> dict:
+    """
+    Import the app in a fresh interpreter and return its import time and heavy libraries.
+    """
+    output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd=work_dir, capture_output=True,
+                            text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def time_server_start(work_dir: str, warmup: bool, timeout: float = 600) -> dict:
+    """
+    Start the server in a fresh process and time how long it takes to answer its health check,
+    and, with `warmup`, to finish loading its models.
+    """
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/health/"
+    start_time = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR,
+                               "--port", str(port), "--log-level", "warning"],
+                              cwd=work_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        sample = {}
+        while "ready_seconds" not in sample or (warmup and "warm_seconds" not in sample):
+            if server.poll() is not None:
+                raise RuntimeError(f"The server exited with status {server.returncode} before it was ready")
+            if time.perf_counter() - start_time > timeout:
+                raise TimeoutError(f"The server was not ready after {timeout} seconds")
+
+            health = get_health(url)
+            if health is not None and "ready_seconds" not in sample:
+                sample["ready_seconds"] = time.perf_counter() - start_time
+                sample["ready_rss_mb"] = resident_memory_mb(server.pid)
+            if health is not None and warmup and health["warmup"] in ("done", "failed"):
+                sample["warm_seconds"] = time.perf_counter() - start_time
+                sample["warm_rss_mb"] = resident_memory_mb(server.pid)
+                sample["warmup"] = health["warmup"]
+            time.sleep(0.02)
+        return sample
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run_startup_benchmark(config: dict, runs: int, warmup: bool = False, with_corpus: bool = False) -> dict:
+    """
+    Measure the cold start of the app `runs` times.
+
+    Returns:
+        dict: Median and range of each measurement over the runs, and the heavy libraries imported
+              by the app itself.
+    """
+    samples = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        write_scratch_config(work_dir, config, warmup, with_corpus)
+        for _ in range(runs):
+            imported = time_import(work_dir)
+            sample = time_server_start(work_dir, warmup)
+            sample["import_seconds"] = imported["seconds"]
+            samples.append(sample)
+
+    measurements = {}
+    for name in ("import_seconds", "ready_seconds", "ready_rss_mb", "warm_seconds", "warm_rss_mb"):
+        values = [sample[name] for sample in samples if sample.get(name) is not None]
+        if values:
+            measurements[name] = {"median": round(statistics.median(values), 3),
+                                  "min": round(min(values), 3), "max": round(max(values), 3)}
+    return {"measurements": measurements, "imported_modules": imported["modules"],
+            "warmup": [sample["warmup"] for sample in samples if "warmup" in sample]}
+
+
+def print_results(results: dict):
+    print(f"{results['runs']} cold starts ({'warmup' if results['config']['warmup_models'] else 'no warmup'}, "
+          f"{'stored corpus' if results['config']['with_corpus'] else 'empty corpus'})\n")
+    print(f"{'measurement':<16} {'median':>9} {'min':>9} {'max':>9}")
+    for name, values in results["measurements"].items():
+        print(f"{name:<16} {values['median']:>9.2f} {values['min']:>9.2f} {values['max']:>9.2f}")
+    print(f"\nHeavy libraries imported with the app: {', '.join(results['imported_modules']) or 'none'}")
+    if results["warmup"]:
+        print(f"Warmup of each run: {', '.join(results['warmup'])}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Number of cold starts to measure.")
+    parser.add_argument("--warmup", action="store_true", help="Start with `warmup_models` on and time the warmup.")
+    parser.add_argument("--with-corpus", action="store_true", help="Load the documents in the corpus at startup.")
+    parser.add_argument("--output", default="startup_results.json", help="Where to write the JSON results.")
+    args = parser.parse_args()
+
+    config = load_config("config.yaml")
+    benchmark = run_startup_benchmark(config, args.runs, warmup=args.warmup, with_corpus=args.with_corpus)
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_revision": git_revision(),
+        "platform": {"python": platform.python_version(), "machine": platform.machine(), "cpu_count": os.cpu_count()},
+        "config": {"warmup_models": args.warmup, "with_corpus": args.with_corpus,
+                   "rerank": config["rerank"], "llm_backend": config["llm_backend"]},
+        "runs": args.runs,
+        **benchmark
+    }
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print_results(results)
+    print(f"\nResults written to {args.output}")
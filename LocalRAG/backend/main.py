@@ -1,12 +1,155 @@
-from fastapi import FastAPI, UploadFile, File, Form, status, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, status, HTTPException, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from contextlib import asynccontextmanager
 import os
+import json
+import time
 import shutil
+import logging
+import asyncio
 from modules.utils import load_embeddings, load_config
-from modules.main import process_pdf_and_create_embeddings, load_saved_embeddings, query_contract
+from modules.main import process_pdf_and_create_embeddings, load_saved_embeddings, retrieve_contract_batch, corpus, embedding_cache
+from modules.main import query_embedding_cache, answer_cache, answer_cache_key, invalidate_document_answers, rerank_cache
+from modules.main import query_contract_async, retrieve_contract, run_in_cpu_executor, ingestion_jobs
+from modules.main import warmup_models, model_status
+from modules.query_processing import open_llm_session, close_llm_session, stream_answer_query
+from modules.corpus import document_id_from_filename
+from modules.index_registry import IndexRegistry
+from modules.metrics import metrics, traces, trace, span, record_span, configure_tracing
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel
+
+# Directory for uploaded PDF files
+UPLOAD_DIR = "data"
+os.makedirs(UPLOAD_DIR, exist_ok=True)  # Create directory if it doesn't exist
+
+# Legacy embeddings CSV, migrated to the vector store on first load
+CSV_PATH = os.path.join(UPLOAD_DIR, "embeddings.csv")
+
+# Load configuration from a YAML file
+config = load_config('config.yaml')
+
+# Progress and warnings of the backend go through logging, alongside uvicorn's own logs.
+# `log_level` applies to the backend's loggers; other libraries keep logging warnings only
+logging.basicConfig(format="%(levelname)s:     %(name)s - %(message)s")
+for logger_name in ("main", "modules"):
+    logging.getLogger(logger_name).setLevel(config["log_level"])
+logger = logging.getLogger(__name__)
+
+# Resident index shared by all requests, loaded once and hot-swapped after uploads
+index_registry = IndexRegistry()
+
+# Background model warmup started at startup when `warmup_models` is on
+warmup_task = None
+
+
+def reload_index():
+    """
+    Load the embeddings of every saved document into the resident index.
+    """
+    with span("index.reload"):
+        index_registry.load(load_saved_embeddings, CSV_PATH)
+
+
+def save_upload(source, file_path):
+    """
+    Copy an uploaded file to disk in blocks, without reading it into memory.
+    """
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(source, buffer, 1 << 20)
+
+
+def ingest_upload(file_path, document_id):
+    """
+    Background job of an upload: embed the saved PDF, then swap it into the resident index.
+    """
+    with trace("ingest", document_id=document_id) as ingest_trace:
+        chunks, embeddings = process_pdf_and_create_embeddings(file_path, config, document_id=document_id)
+
+        # Swap the freshly saved embeddings into the resident index and forget answers from the old version
+        reload_index()
+        invalidate_document_answers(document_id)
+    return {"document_id": document_id, "num_chunks": len(chunks),
+            "chunk_report": corpus.documents()[document_id].get("chunk_report"),
+            "trace_id": ingest_trace["trace_id"]}
+
+
+def service_metrics():
+    """
+    Metrics collector for the state other objects already track: cache counters, index size and jobs.
+    """
+    caches = {"embedding": embedding_cache, "query_embedding": query_embedding_cache, "answer": answer_cache,
+              "rerank": rerank_cache}
+    for name, cache in caches.items():
+        stats = cache.stats()
+        yield "localrag_cache_hits_total", "counter", "Cache lookups that found an entry.", {"cache": name}, stats["hits"]
+        yield "localrag_cache_misses_total", "counter", "Cache lookups that missed.", {"cache": name}, stats["misses"]
+        yield "localrag_cache_entries", "gauge", "Entries currently held by each cache.", {"cache": name}, stats["entries"]
+
+    index = index_registry.status()
+    yield "localrag_index_loaded", "gauge", "Whether a resident index is being served.", {}, int(index["loaded"])
+    if index["loaded"]:
+        yield "localrag_index_documents", "gauge", "Documents in the resident index.", {}, index["num_documents"]
+        yield "localrag_index_chunks", "gauge", "Chunks in the resident index.", {}, index["num_chunks"]
+        yield ("localrag_index_bytes", "gauge", "Memory held by the resident index.",
+               {"part": "embeddings"}, index["embeddings_bytes"])
+        yield "localrag_index_bytes", "gauge", "Memory held by the resident index.", {"part": "index"}, index["index_bytes"]
+        yield ("localrag_index_bytes", "gauge", "Memory held by the resident index.",
+               {"part": "lexical"}, index["lexical_index_bytes"])
+
+    job_counts = {"queued": 0, "running": 0, "succeeded": 0, "failed": 0}
+    for job in ingestion_jobs.list():
+        job_counts[job["status"]] = job_counts.get(job["status"], 0) + 1
+    for job_status, count in job_counts.items():
+        yield "localrag_jobs", "gauge", "Known background jobs by status.", {"status": job_status}, count
+
+    for model, loaded in model_status().items():
+        if loaded is not None:
+            yield "localrag_model_loaded", "gauge", "Whether each lazily loaded model is loaded.", {"model": model}, int(loaded)
+
+
+async def warm_up():
+    """
+    Load the models in the background, so the server is ready at once and its first requests
+    do not pay for the loads. Returns whether every model loaded.
+    """
+    try:
+        await run_in_cpu_executor(warmup_models)
+        return True
+    except Exception as error:
+        # Models still load on first use
+        logger.warning("Model warmup failed: %s: %s", type(error).__name__, error)
+        return False
+
+
+metrics.describe("localrag_http_requests_total", "counter", "HTTP requests by route and status code.")
+metrics.describe("localrag_http_request_duration_seconds", "histogram",
+                 "Time to the response start of each HTTP request; streamed bodies are not included.")
+metrics.register_collector(service_metrics)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global warmup_task
+    # Keep recent traces in memory and export them through OpenTelemetry if configured
+    configure_tracing(config)
+    # Stores written by an older version are upgraded once here, so loading them never writes
+    corpus.upgrade_stores()
+    # Load the index once at startup instead of on every query
+    reload_index()
+    # One pooled HTTP session for every LLM call
+    open_llm_session(config)
+    # Models load on first use, or in the background from now on
+    if config["warmup_models"]:
+        warmup_task = asyncio.create_task(warm_up())
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+    await close_llm_session()
+
 
 # Initialize the FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Enable Cross-Origin Resource Sharing (CORS) to allow requests from different origins
 app.add_middleware(
@@ -15,54 +158,275 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow all HTTP methods (GET, POST, etc.)
     allow_headers=["*"],  # Allow all headers (including Authorization, Content-Type, etc.)
+    expose_headers=["X-Trace-Id"],
 )
 
-# Directory for uploaded PDF files
-UPLOAD_DIR = "data"
-os.makedirs(UPLOAD_DIR, exist_ok=True)  # Create directory if it doesn't exist
+# Trace every request and record its latency per route
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Scrapes and health probes would otherwise push every real request out of the trace history
+    if request.url.path in ("/metrics", "/health/"):
+        return await call_next(request)
 
-# Load configuration from a YAML file
-config = load_config('config.yaml')
+    start_time = time.perf_counter()
+    with trace(f"{request.method} {request.url.path}") as request_trace:
+        response = await call_next(request)
+
+        # Label by route template rather than raw path, so IDs in paths do not explode the label set
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        request_trace["name"] = f"{request.method} {route_path}"
+        request_trace["attributes"]["status_code"] = response.status_code
+    seconds = time.perf_counter() - start_time
+
+    labels = {"method": request.method, "route": route_path, "status": str(response.status_code)}
+    metrics.inc("localrag_http_requests_total", **labels)
+    metrics.observe("localrag_http_request_duration_seconds", seconds, **labels)
+    response.headers["X-Trace-Id"] = request_trace["trace_id"]
+    return response
 
 # Endpoint to upload a PDF file
-@app.post("/upload/", status_code=status.HTTP_201_CREATED)
+@app.post("/upload/", status_code=status.HTTP_202_ACCEPTED)
 async def upload_file(file: UploadFile = File(...)):
     """
-    Upload a PDF file, save it locally, and process it to generate embeddings.
+    Upload a PDF file, save it locally, and queue a background job that generates its embeddings.
+
+    The document is added to the corpus once the job succeeds; uploading a file with the same
+    name replaces it. Poll `/jobs/{job_id}` for progress.
     """
     # Ensure the uploaded file is a PDF
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Invalid file type. Only PDFs are allowed.")
 
-    # Save the file to the UPLOAD_DIR
+    # Save the file to the UPLOAD_DIR, off the event loop
     file_path = os.path.join(UPLOAD_DIR, file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    await run_in_cpu_executor(save_upload, file.file, file_path)
 
-    # Process the PDF to create text chunks and embeddings
-    chunks, embeddings = process_pdf_and_create_embeddings(file_path, config)
+    # Process the PDF in the background, so queries keep being served while it is embedded
+    document_id = document_id_from_filename(file.filename)
+    job = ingestion_jobs.submit("ingest", ingest_upload, file_path, document_id)
 
-    # Return a response indicating successful upload and embedding creation
-    return {"filename": file.filename, "status": "Embeddings created successfully"}
+    # Return a response indicating the upload was accepted and where to follow its progress
+    return {"filename": file.filename, "document_id": document_id, "job_id": job["job_id"],
+            "status": job["status"], "status_url": f"/jobs/{job['job_id']}"}
+
+# Endpoint to follow a background job
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """
+    Return the status of a background job: queued, running, succeeded or failed.
+    """
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'.")
+    return job
+
+# Endpoint to list recent background jobs
+@app.get("/jobs/")
+async def list_jobs():
+    """
+    List queued, running and recently finished background jobs.
+    """
+    return {"jobs": ingestion_jobs.list()}
 
 # Endpoint to handle chatbot queries based on saved embeddings
 @app.post("/chatbot/")
-async def chatbot(query: str = Form(...)):
+async def chatbot(query: str = Form(...), document_id: str = Form(None)):
     """
-    Process a query using pre-saved embeddings from a previously uploaded PDF.
+    Process a query using pre-saved embeddings from previously uploaded PDFs.
+
+    Retrieval covers every document unless `document_id` restricts it to one.
+    Answers to repeated questions about an unchanged document are served from the answer cache.
     """
-    # Path to the embeddings CSV file
-    csv_path = os.path.join(UPLOAD_DIR, "embeddings.csv")
+    # Take the current snapshot of the resident index; it stays valid even if a reload swaps it out
+    snapshot = index_registry.get()
 
     # Check if embeddings exist; if not, return an error
-    if not os.path.exists(csv_path):
+    if snapshot is None or not snapshot.pages_and_chunks:
         return {"error": "Could not find the file, please upload it again."}
+    if document_id is not None and document_id not in snapshot.document_ranges:
+        raise HTTPException(status_code=404, detail=f"Unknown document '{document_id}'.")
 
-    # Load pre-saved embeddings
-    pages_and_chunks, tensor_embeddings = load_saved_embeddings(csv_path)
-
-    # Query the contract using the embeddings
-    answer = query_contract(query, tensor_embeddings, pages_and_chunks)
+    # Serve a repeated question about the same document version from the answer cache
+    cache_key = answer_cache_key(query, document_id, snapshot.document_version(document_id))
+    answer = answer_cache.get(cache_key)
+    if answer is None:
+        # Query the contract using the embeddings of the selected document(s)
+        pages_and_chunks, tensor_embeddings, index = snapshot.scope(document_id)
+        answer = await query_contract_async(query, tensor_embeddings, pages_and_chunks, index=index,
+                                            lexical_index=snapshot.lexical_scope(document_id),
+                                            document_version=snapshot.document_version(document_id))
+        answer_cache.put(cache_key, answer)
 
     # Return the query and the generated answer
-    return {"query": query, "answer": answer}
+    return {"query": query, "document_id": document_id, "answer": answer}
+
+def sse_event(event, data):
+    """
+    Format one server-sent event with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Endpoint to stream the answer of a chatbot query as server-sent events
+@app.post("/chatbot/stream/")
+async def chatbot_stream(query: str = Form(...), document_id: str = Form(None)):
+    """
+    Like `/chatbot/`, but streams the answer as server-sent events while it is generated.
+
+    A `citations` event with the retrieved chunks is sent before generation starts, then one
+    `token` event per piece of text, and a final `done` event with the full answer.
+    """
+    snapshot = index_registry.get()
+    if snapshot is None or not snapshot.pages_and_chunks:
+        raise HTTPException(status_code=404, detail="Could not find the file, please upload it again.")
+    if document_id is not None and document_id not in snapshot.document_ranges:
+        raise HTTPException(status_code=404, detail=f"Unknown document '{document_id}'.")
+
+    # Retrieve before streaming starts, so the citations lead the response
+    pages_and_chunks, tensor_embeddings, index = snapshot.scope(document_id)
+    retrieved_data = await run_in_cpu_executor(retrieve_contract, query, tensor_embeddings,
+                                               pages_and_chunks, index=index,
+                                               lexical_index=snapshot.lexical_scope(document_id),
+                                               document_version=snapshot.document_version(document_id))
+    cache_key = answer_cache_key(query, document_id, snapshot.document_version(document_id))
+
+    async def events():
+        start_time = time.perf_counter()
+        yield sse_event("citations", {"query": query, "document_id": document_id, "citations": retrieved_data})
+
+        # A repeated question is answered from the cache in a single token event
+        answer = answer_cache.get(cache_key)
+        if answer is not None:
+            yield sse_event("token", {"text": answer})
+        else:
+            pieces = []
+            try:
+                async for text in stream_answer_query(query, retrieved_data, config):
+                    if not pieces:
+                        record_span("answer.first_token", time.perf_counter() - start_time)
+                    pieces.append(text)
+                    yield sse_event("token", {"text": text})
+            except Exception as error:
+                yield sse_event("error", {"detail": f"{type(error).__name__}: {error}"})
+                return
+            answer = "".join(pieces)
+            answer_cache.put(cache_key, answer)
+            record_span("answer.stream", time.perf_counter() - start_time, tokens=len(pieces))
+
+        yield sse_event("done", {"answer": answer})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Request body of the batch retrieval endpoint
+class BatchQuery(BaseModel):
+    queries: list[str]
+    document_id: str | None = None
+    top_k: int | None = None
+
+# Endpoint to retrieve the top chunks of many queries in one call
+@app.post("/chatbot/batch/")
+async def chatbot_batch(request: BatchQuery):
+    """
+    Retrieve the most relevant chunks for many queries at once.
+
+    All queries are embedded in one model call and scored with one matrix product.
+    """
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="Provide at least one query.")
+    if len(request.queries) > config["max_batch_queries"]:
+        raise HTTPException(status_code=400, detail=f"At most {config['max_batch_queries']} queries per batch.")
+
+    snapshot = index_registry.get()
+    if snapshot is None or not snapshot.pages_and_chunks:
+        return {"error": "Could not find the file, please upload it again."}
+    if request.document_id is not None and request.document_id not in snapshot.document_ranges:
+        raise HTTPException(status_code=404, detail=f"Unknown document '{request.document_id}'.")
+
+    pages_and_chunks, tensor_embeddings, index = snapshot.scope(request.document_id)
+    results = await run_in_cpu_executor(retrieve_contract_batch, request.queries, tensor_embeddings,
+                                        pages_and_chunks, n_resources_to_return=request.top_k or config["top_k"],
+                                        index=index, lexical_index=snapshot.lexical_scope(request.document_id))
+
+    return {
+        "document_id": request.document_id,
+        "results": [{"query": query, "results": result} for query, result in zip(request.queries, results)]
+    }
+
+# Endpoint to list the documents in the corpus
+@app.get("/documents/")
+async def list_documents():
+    """
+    List every uploaded document with its chunk count and upload time.
+    """
+    return {"documents": corpus.documents()}
+
+# Endpoint to delete a document from the corpus
+@app.delete("/documents/{document_id}")
+async def delete_document(document_id: str):
+    """
+    Remove one document from the corpus without re-embedding the others.
+    """
+    if not await run_in_cpu_executor(corpus.remove_document, document_id):
+        raise HTTPException(status_code=404, detail=f"Unknown document '{document_id}'.")
+
+    # Swap the remaining documents into the resident index
+    await run_in_cpu_executor(reload_index)
+    invalidate_document_answers(document_id)
+    return {"document_id": document_id, "status": "Document deleted successfully"}
+
+# Endpoint for health checks
+@app.get("/health/")
+async def health():
+    """
+    Return as soon as the server accepts requests, with the models already loaded and the
+    state of the background warmup ('off', 'running', 'done' or 'failed').
+    """
+    if warmup_task is None:
+        warmup = "off"
+    elif not warmup_task.done():
+        warmup = "running"
+    else:
+        warmup = "done" if not warmup_task.cancelled() and warmup_task.result() else "failed"
+    return {"status": "ok", "index_loaded": index_registry.status()["loaded"], "warmup": warmup, "models": model_status()}
+
+# Endpoint to report what the resident index is serving
+@app.get("/status/")
+async def index_status():
+    """
+    Return the size and load time of the resident index and the hit rates of every cache.
+    """
+    return {
+        **index_registry.status(),
+        "embedding_cache": embedding_cache.stats(),
+        "query_embedding_cache": query_embedding_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "rerank_cache": rerank_cache.stats()
+    }
+
+# Endpoint exposing every metric in the Prometheus text format
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Return request, stage, cache, index and job metrics for a Prometheus scraper.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Endpoint to list recent traces
+@app.get("/traces/")
+async def list_traces(limit: int = 20):
+    """
+    List the most recent request and ingestion traces, newest first, with their spans.
+    """
+    return {"traces": traces.recent(limit)}
+
+# Endpoint to inspect one trace
+@app.get("/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """
+    Return one trace by the ID sent in the `X-Trace-Id` response header or an ingestion job result.
+    """
+    trace_record = traces.get(trace_id)
+    if trace_record is None:
+        raise HTTPException(status_code=404, detail=f"Unknown trace '{trace_id}'.")
+    return trace_record
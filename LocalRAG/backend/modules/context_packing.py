@@ -0,0 +1,126 @@
+# modules/context_packing.py
+import re
+import logging
+import functools
+from modules.metrics import metrics, span
+
+logger = logging.getLogger(__name__)
+
+# Sentence ends, as joined back together by the chunkers
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+# Encoding of models tiktoken does not know, e.g. a local or OpenAI-compatible model
+DEFAULT_ENCODING = "cl100k_base"
+
+metrics.describe("localrag_prompt_context_tokens_total", "counter",
+                 "Context tokens sent to the LLM (packed), and what the raw retrieval results would have cost (unpacked).")
+
+
+@functools.lru_cache(maxsize=None)
+def token_counter(model: str):
+    """
+    Return a function counting the tokens of a text with the tiktoken encoding of `model`.
+
+    tiktoken downloads an encoding's BPE file on first use; if it cannot be loaded (e.g. offline
+    without a cache), tokens are approximated as 4 characters each rather than failing queries.
+    """
+    try:
+        import tiktoken
+    except ImportError as error:
+        raise ImportError("Context packing requires tiktoken: pip install tiktoken") from error
+
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as error:
+        logger.warning("Could not load the tiktoken encoding of '%s' (%s), approximating 4 characters per token",
+                       model, type(error).__name__)
+        return lambda text: (len(text) + 3) // 4
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def pack_context(relevant_chunks: dict, count_tokens, max_tokens: int):
+    """
+    Build the context of the prompt from retrieval results under a token budget.
+
+    Results are taken best first. Sentences already included by a better result are dropped,
+    which removes the sentences consecutive chunks share through their overlap. Each result's
+    remaining sentences are added in order while they fit; the first one that does not fit
+    ends that result, and later, shorter results can still use the rest of the budget.
+
+    Args:
+        relevant_chunks (dict): Results as returned by `format_results`, best first.
+        count_tokens (callable): Token counter, see `token_counter`.
+        max_tokens (int): Budget of the context in tokens.
+
+    Returns:
+        context (str): One block per result used, headed by its rank and page number.
+        report (dict): Tokens of the packed context, results used, and sentences dropped as
+                       duplicates or for lack of budget.
+    """
+    seen = set()
+    blocks = []
+    used_tokens = 0
+    duplicate_sentences = 0
+    dropped_sentences = 0
+
+    for result in relevant_chunks.values():
+        page = str(result["page_number"]).removeprefix("Page number: ")
+        header = f"[{len(blocks) + 1}] Page {page}\n"
+        tokens = used_tokens + count_tokens(header) + (2 if blocks else 0)  # Blank line between blocks
+
+        sentences = []
+        remaining = SENTENCE_BOUNDARY.split(result["sentence_chunk"].strip())
+        for position, sentence in enumerate(remaining):
+            key = " ".join(sentence.split())
+            if not key:
+                continue
+            if key in seen:
+                duplicate_sentences += 1
+                continue
+            sentence_tokens = count_tokens(sentence) + (1 if sentences else 0)
+            if tokens + sentence_tokens > max_tokens:
+                dropped_sentences += sum(1 for rest in remaining[position:] if " ".join(rest.split()) not in seen)
+                break
+            seen.add(key)
+            sentences.append(sentence)
+            tokens += sentence_tokens
+
+        if sentences:
+            blocks.append(header + " ".join(sentences))
+            used_tokens = tokens
+
+    context = "\n\n".join(blocks)
+    report = {"context_tokens": count_tokens(context), "results": len(relevant_chunks), "results_used": len(blocks),
+              "duplicate_sentences": duplicate_sentences, "dropped_sentences": dropped_sentences}
+    return context, report
+
+
+def unpacked_context(relevant_chunks: dict) -> str:
+    """
+    The context as sent before packing: the repr of the result dictionaries, without entities.
+    """
+    return str({key: {field: value for field, value in result.items() if field != "entities"}
+                for key, result in relevant_chunks.items()})
+
+
+def build_context(relevant_chunks: dict, config: dict) -> str:
+    """
+    Pack the retrieval results into the prompt context under `config['context_max_tokens']`,
+    and report how many prompt tokens that saved over sending the raw results.
+    """
+    count_tokens = token_counter(config["model"])
+    with span("prompt.pack", max_tokens=config["context_max_tokens"]) as attributes:
+        context, report = pack_context(relevant_chunks, count_tokens, config["context_max_tokens"])
+        report["unpacked_tokens"] = count_tokens(unpacked_context(relevant_chunks))
+        report["saved_tokens"] = report["unpacked_tokens"] - report["context_tokens"]
+        attributes.update(report)
+
+    metrics.inc("localrag_prompt_context_tokens_total", report["context_tokens"], kind="packed")
+    metrics.inc("localrag_prompt_context_tokens_total", report["unpacked_tokens"], kind="unpacked")
+    logger.debug("Prompt context: %d tokens instead of %d, %d/%d results, %d duplicate and %d over-budget "
+                 "sentences dropped", report["context_tokens"], report["unpacked_tokens"], report["results_used"],
+                 report["results"], report["duplicate_sentences"], report["dropped_sentences"])
+    return context
@@ -0,0 +1,305 @@
+# modules/corpus.py
+import os
+import re
+import json
+import time
+import shutil
+import logging
+import weakref
+import threading
+from collections import Counter
+from contextlib import contextmanager
+import torch
+from modules.vector_store import EMBEDDINGS_FILENAME, read_header, load_vector_store, upgrade_store
+from modules.vector_index import load_or_build_index, QUANTIZED_BACKENDS
+from modules.lexical_index import load_or_build_lexical_index
+
+MANIFEST_FILENAME = "manifest.json"
+
+logger = logging.getLogger(__name__)
+
+
+def document_id_from_filename(filename: str) -> str:
+    """
+    Derive a stable, filesystem-safe document id from an uploaded file name.
+
+    Args:
+        filename (str): The uploaded file name, e.g. 'Master Services Agreement.pdf'.
+
+    Returns:
+        str: The document id, e.g. 'Master_Services_Agreement'.
+    """
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", stem).strip("._") or "document"
+
+
+class StoreLease:
+    """
+    Keeps the store directories of some documents from being deleted while they are read.
+
+    The lease ends with `release()`, at the end of a `with` block, or when the lease is
+    garbage collected, e.g. together with the index snapshot holding it.
+    """
+
+    def __init__(self, corpus: "Corpus", stores: list[str]):
+        self.stores = tuple(stores)
+        self._finalizer = weakref.finalize(self, corpus._release_stores, self.stores)
+
+    def release(self):
+        self._finalizer()  # Runs at most once
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class Corpus:
+    """
+    A collection of documents, each stored in its own vector store under `corpus_dir`.
+
+    The manifest file lists the documents and points at the store directory of each one.
+    Adding, replacing or deleting a document only touches that document's store and then
+    rewrites the manifest atomically, so other documents are never re-embedded.
+
+    A store replaced or removed from the manifest is deleted once nobody reads it anymore:
+    readers lease the stores they use (see `lease_documents`), and a store still leased is
+    only deleted when its last lease ends.
+    """
+
+    def __init__(self, corpus_dir: str):
+        self.corpus_dir = corpus_dir
+        self.manifest_path = os.path.join(corpus_dir, MANIFEST_FILENAME)
+        # Serialises manifest updates and lease bookkeeping. Reentrant, because a lease can be
+        # garbage collected, and so released, while this thread holds it
+        self._lock = threading.RLock()
+        self._leases = Counter()  # Store name -> number of leases held on it
+        self._retired = set()  # Stores out of the manifest, deleted when their last lease ends
+        self._document_locks = {}
+        os.makedirs(corpus_dir, exist_ok=True)
+
+    def read_manifest(self) -> dict:
+        """
+        Return the manifest, or an empty one if no document has been added yet.
+        """
+        if not os.path.exists(self.manifest_path):
+            return {"documents": {}}
+        with open(self.manifest_path, "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def _write_manifest(self, manifest: dict):
+        with open(self.manifest_path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(manifest, file, indent=2)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+    def documents(self) -> dict:
+        """
+        Return the manifest entry of every document, keyed by document id.
+        """
+        return self.read_manifest()["documents"]
+
+    def is_empty(self) -> bool:
+        return not self.documents()
+
+    def new_store_dir(self, document_id: str) -> str:
+        """
+        Return a fresh directory for a new version of a document's store.
+
+        Each version gets its own directory, so the version currently being served stays
+        intact until `commit_document` switches the manifest over to the new one.
+        """
+        return os.path.join(self.corpus_dir, f"{document_id}-{time.time_ns()}")
+
+    @contextmanager
+    def document_lock(self, document_id: str):
+        """
+        Hold the lock of one document, so two ingestions of the same document never run at
+        once and the second one starts from the version the first one committed.
+        """
+        with self._lock:
+            lock = self._document_locks.setdefault(document_id, threading.Lock())
+        with lock:
+            yield
+
+    def lease_documents(self, document_ids=None) -> tuple[dict, StoreLease]:
+        """
+        Read the manifest entries of some documents (all by default) and lease their stores,
+        in one step, so none of them can be deleted before the caller is done reading it.
+
+        Returns:
+            entries (dict): Manifest entry of every listed document that exists, by document id.
+            lease (StoreLease): The lease on their stores.
+        """
+        with self._lock:
+            documents = self.documents()
+            if document_ids is not None:
+                documents = {document_id: documents[document_id] for document_id in document_ids
+                             if document_id in documents}
+            stores = [entry["store"] for entry in documents.values()]
+            self._leases.update(stores)
+            return documents, StoreLease(self, stores)
+
+    def _release_stores(self, stores: tuple):
+        unused = []
+        with self._lock:
+            for store in stores:
+                self._leases[store] -= 1
+                if self._leases[store] <= 0:
+                    del self._leases[store]
+                    if store in self._retired:
+                        self._retired.discard(store)
+                        unused.append(store)
+        for store in unused:
+            self._delete_store(store)
+
+    def _retire_store(self, store: str):
+        """
+        Delete a store that left the manifest now, or when its last lease ends.
+        """
+        with self._lock:
+            if self._leases[store] > 0:
+                self._retired.add(store)
+                return
+            del self._leases[store]
+        self._delete_store(store)
+
+    def _delete_store(self, store: str):
+        shutil.rmtree(os.path.join(self.corpus_dir, store), ignore_errors=True)
+
+    def commit_document(self, document_id: str, store_dir: str, **info):
+        """
+        Point the manifest at a completed document store, replacing any previous version.
+
+        Args:
+            document_id (str): The document id.
+            store_dir (str): The store directory returned by `new_store_dir`, fully written.
+            **info: Extra fields recorded in the manifest entry (e.g. filename).
+        """
+        store_name = os.path.basename(store_dir)
+        _, num_chunks, _, _ = read_header(os.path.join(store_dir, EMBEDDINGS_FILENAME))
+
+        with self._lock:
+            manifest = self.read_manifest()
+            previous = manifest["documents"].get(document_id)
+            manifest["documents"][document_id] = {
+                "store": store_name,
+                "num_chunks": num_chunks,
+                "added_at": time.time(),
+                **info
+            }
+            self._write_manifest(manifest)
+
+        # The old store may still be read by a served snapshot or a concurrent ingestion
+        if previous and previous["store"] != store_name:
+            self._retire_store(previous["store"])
+
+    def remove_document(self, document_id: str) -> bool:
+        """
+        Delete a document from the corpus without touching the others.
+
+        Returns:
+            bool: True if the document existed.
+        """
+        with self._lock:
+            manifest = self.read_manifest()
+            entry = manifest["documents"].pop(document_id, None)
+            if entry is None:
+                return False
+            self._write_manifest(manifest)
+
+        self._retire_store(entry["store"])
+        return True
+
+    def upgrade_stores(self) -> int:
+        """
+        Rewrite the stores written in an older store version in the current one, so loading
+        them never has to. Run once when the corpus is opened, before it is served.
+
+        A store that cannot be rewritten (e.g. a read-only corpus) is left as it is; it is
+        normalized in memory whenever it is loaded.
+
+        Returns:
+            int: Number of stores rewritten.
+        """
+        upgraded = 0
+        for entry in self.documents().values():
+            store_dir = os.path.join(self.corpus_dir, entry["store"])
+            try:
+                upgraded += upgrade_store(store_dir)
+            except OSError as error:
+                logger.warning("Could not upgrade the store %s: %s", store_dir, error)
+        return upgraded
+
+    def load(self, index_config: dict = None, device: str = "cpu"):
+        """
+        Load every document into one index.
+
+        Args:
+            index_config (dict, optional): Config selecting the ANN backend and retrieval mode. Its
+                                           persisted per-document indexes, and BM25 indexes in
+                                           hybrid mode, are loaded (or built) as well.
+            device (str): Device to move the embeddings to.
+
+        Returns:
+            dict: The fields of an index snapshot:
+                - pages_and_chunks (list of dict): Chunk metadata of all documents, each tagged with 'document_id'.
+                - embeddings (torch.Tensor): Embeddings of all documents, stacked in the same order.
+                  None with a quantized backend, whose indexes read each document's memory-mapped rows.
+                - document_ranges (dict): Maps each document id to its (start, stop) row range.
+                - document_indexes (dict): Maps each document id to its ANN index (empty for exact search).
+                - document_lexical_indexes (dict): Maps each document id to its BM25 index (empty unless hybrid).
+                - document_versions (dict): Maps each document id to the store version being served.
+                - store_lease (StoreLease): Lease keeping the served stores on disk while the snapshot lives.
+        """
+        entries, lease = self.lease_documents()
+        try:
+            return self._load_entries(entries, lease, index_config, device)
+        except BaseException:
+            lease.release()
+            raise
+
+    def _load_entries(self, entries: dict, lease: StoreLease, index_config: dict, device: str):
+        pages_and_chunks = []
+        tensors = []
+        document_ranges = {}
+        document_indexes = {}
+        document_lexical_indexes = {}
+        document_versions = {}
+
+        for document_id, entry in sorted(entries.items()):
+            store_dir = os.path.join(self.corpus_dir, entry["store"])
+            chunks, embeddings = load_vector_store(store_dir, device=device)
+            for chunk in chunks:
+                chunk["document_id"] = document_id
+
+            if index_config and index_config.get("index_backend", "exact") != "exact":
+                document_indexes[document_id] = load_or_build_index(store_dir, embeddings, index_config)
+            if index_config and index_config.get("retrieval_mode") == "hybrid":
+                document_lexical_indexes[document_id] = load_or_build_lexical_index(store_dir, chunks, index_config)
+
+            document_ranges[document_id] = (len(pages_and_chunks), len(pages_and_chunks) + len(chunks))
+            document_versions[document_id] = entry["store"]
+            pages_and_chunks.extend(chunks)
+            tensors.append(embeddings)
+
+        # A single document keeps its zero-copy memory map; several are stacked into one matrix,
+        # unless quantized indexes make a resident float copy unnecessary
+        if index_config and index_config.get("index_backend") in QUANTIZED_BACKENDS:
+            embeddings = None
+        elif not tensors:
+            embeddings = torch.empty((0, 0), dtype=torch.float32)
+        elif len(tensors) == 1:
+            embeddings = tensors[0]
+        else:
+            embeddings = torch.cat([tensor for tensor in tensors if tensor.shape[0] > 0] or tensors[:1])
+
+        return {
+            "pages_and_chunks": pages_and_chunks,
+            "embeddings": embeddings,
+            "document_ranges": document_ranges,
+            "document_indexes": document_indexes,
+            "document_lexical_indexes": document_lexical_indexes,
+            "document_versions": document_versions,
+            "store_lease": lease
+        }
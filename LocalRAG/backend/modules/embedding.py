@@ -1,19 +1,162 @@
-from sentence_transformers import SentenceTransformer
+from typing import TYPE_CHECKING
 from tqdm.auto import tqdm
+from modules.embedding_cache import EmbeddingCache
 
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
 
-# Function to process embeddings one by one (non-batched)
-def create_embeddings(pages_and_chunks: list[dict], model: SentenceTransformer) -> list[dict]:
+
+def token_lengths(texts: list[str], model: "SentenceTransformer") -> list[int]:
+    """
+    Counts the tokens the model will actually see for each text, in one batched tokenizer call.
+
+    Args:
+        texts (list[str]): The texts to measure.
+        model (SentenceTransformer): The embedding model whose tokenizer is used.
+
+    Returns:
+        list[int]: Token count of each text, capped at the model's maximum sequence length.
+    """
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is None:
+        # Fall back to the usual ~4 characters per token estimate
+        return [len(text) // 4 + 1 for text in texts]
+
+    encoded = tokenizer(texts, add_special_tokens=True, truncation=True, max_length=model.max_seq_length)
+    return [len(input_ids) for input_ids in encoded["input_ids"]]
+
+
+def chunk_token_budget(model: "SentenceTransformer", max_tokens: int = None) -> int:
+    """
+    Number of text tokens the model embeds without truncation, excluding its special tokens.
+
+    Args:
+        model (SentenceTransformer): The embedding model.
+        max_tokens (int, optional): A smaller budget to use instead, e.g. for shorter chunks.
+
+    Returns:
+        int: The token budget of a chunk.
+    """
+    window = model.max_seq_length - model.tokenizer.num_special_tokens_to_add()
+    return min(max_tokens, window) if max_tokens else window
+
+
+def make_length_buckets(lengths: list[int], batch_size: int, max_batch_tokens: int) -> list[list[int]]:
     """
-    Creates embeddings for each sentence chunk in the dataset one by one.
+    Groups item indices into batches of similar token length.
+
+    Items are sorted by length so each batch pads to a near-uniform size. A batch is closed
+    when it holds `batch_size` items or when its padded size (items x longest item) would
+    exceed `max_batch_tokens`, which caps the peak memory of a single forward pass.
+
+    Args:
+        lengths (list[int]): Token length of each item.
+        batch_size (int): Maximum number of items per batch.
+        max_batch_tokens (int): Maximum padded tokens per batch.
+
+    Returns:
+        list[list[int]]: Batches of indices into the original list.
+    """
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+
+    batches = []
+    current_batch = []
+    for index in order:
+        # Lengths are ascending, so the current item is the longest in the batch so far
+        padded_tokens = (len(current_batch) + 1) * lengths[index]
+        if current_batch and (len(current_batch) >= batch_size or padded_tokens > max_batch_tokens):
+            batches.append(current_batch)
+            current_batch = []
+        current_batch.append(index)
+
+    if current_batch:
+        batches.append(current_batch)
+
+    return batches
+
+
+def create_embeddings(pages_and_chunks: list[dict],
+                      model: "SentenceTransformer",
+                      batch_size: int = 32,
+                      max_batch_tokens: int = 8192,
+                      cache: EmbeddingCache = None) -> list[dict]:
+    """
+    Creates embeddings for the sentence chunks in length-bucketed batches.
 
     Args:
         pages_and_chunks (list[dict]): List of dictionaries with 'sentence_chunk'.
         model (SentenceTransformer): The embedding model to use.
+        batch_size (int): Maximum number of chunks per forward pass.
+        max_batch_tokens (int): Maximum padded tokens per forward pass.
+        cache (EmbeddingCache, optional): Content-hash cache; only cache misses are encoded.
 
     Returns:
-        list[dict]: Updated list with 'embedding' for each chunk.
+        list[dict]: Updated list with 'embedding' for each chunk, in the original order.
     """
-    for item in tqdm(pages_and_chunks, desc="Creating embeddings:"):
-        item["embedding"] = model.encode(item["sentence_chunk"])
+    texts = [item["sentence_chunk"] for item in pages_and_chunks]
+
+    # Reuse cached embeddings and only encode the misses
+    cached = cache.get_many(texts) if cache is not None else {}
+    for position, vector in cached.items():
+        pages_and_chunks[position]["embedding"] = vector
+
+    # Identical chunk texts within the batch are encoded once
+    missing = {}
+    for position, text in enumerate(texts):
+        if position not in cached:
+            missing.setdefault(text, []).append(position)
+    unique_texts = list(missing)
+    if not unique_texts:
+        return pages_and_chunks
+
+    lengths = token_lengths(unique_texts, model)
+
+    for batch in tqdm(make_length_buckets(lengths, batch_size, max_batch_tokens), desc="Creating embeddings:", leave=False):
+        batch_texts = [unique_texts[index] for index in batch]
+        vectors = model.encode(batch_texts,
+                               batch_size=len(batch),
+                               convert_to_numpy=True,
+                               show_progress_bar=False)
+
+        # Write each embedding back to every chunk it came from
+        for text, vector in zip(batch_texts, vectors):
+            for position in missing[text]:
+                pages_and_chunks[position]["embedding"] = vector
+
+        if cache is not None:
+            cache.put_many(batch_texts, vectors)
+
     return pages_and_chunks
+
+
+def iter_embedded_chunks(chunks, model: "SentenceTransformer",
+                         batch_size: int = 32,
+                         max_batch_tokens: int = 8192,
+                         window_size: int = 256,
+                         cache: EmbeddingCache = None):
+    """
+    Lazily embeds a stream of chunks, holding at most `window_size` chunks in memory.
+
+    Chunks are length-bucketed within each window, so peak memory depends on the window
+    and batch sizes rather than on the size of the document.
+
+    Args:
+        chunks (iterable of dict): Chunk dictionaries with 'sentence_chunk'.
+        model (SentenceTransformer): The embedding model to use.
+        batch_size (int): Maximum number of chunks per forward pass.
+        max_batch_tokens (int): Maximum padded tokens per forward pass.
+        window_size (int): Number of chunks buffered and embedded together.
+        cache (EmbeddingCache, optional): Content-hash cache; only cache misses are encoded.
+
+    Yields:
+        list[dict]: Consecutive windows of chunks with 'embedding' added, in input order.
+    """
+    window = []
+    for chunk in chunks:
+        window.append(chunk)
+        if len(window) >= window_size:
+            yield create_embeddings(window, model, batch_size=batch_size, max_batch_tokens=max_batch_tokens, cache=cache)
+            window = []
+
+    if window:
+        yield create_embeddings(window, model, batch_size=batch_size, max_batch_tokens=max_batch_tokens, cache=cache)
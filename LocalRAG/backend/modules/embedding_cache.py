@@ -0,0 +1,139 @@
+# modules/embedding_cache.py
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+import numpy as np
+
+
+def normalize_chunk_text(text: str) -> str:
+    """
+    Normalizes chunk text before hashing so trivially different copies of a clause share an entry.
+
+    Args:
+        text (str): The chunk text.
+
+    Returns:
+        str: NFC-normalized text with non-breaking spaces and runs of whitespace collapsed.
+    """
+    text = unicodedata.normalize("NFC", text).replace(u"\xa0", u" ")
+    return " ".join(text.split())
+
+
+def file_sha256(path: str) -> str:
+    """
+    Hash a file's content in blocks, without reading it into memory at once.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent, size-bounded cache of chunk embeddings keyed by content hash.
+
+    Keys hash the model name together with the normalized chunk text, so re-uploaded
+    documents and boilerplate shared between contracts are only embedded once per model.
+    When the cache grows past `max_entries`, the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str, model_name: str, max_entries: int = 200_000):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+        self._connection.commit()
+
+    def key(self, text: str) -> str:
+        """
+        Return the cache key of a chunk text for this cache's model.
+        """
+        payload = f"{self.model_name}\0{normalize_chunk_text(text)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_many(self, texts: list[str]) -> dict:
+        """
+        Look up the embeddings of several chunk texts.
+
+        Args:
+            texts (list[str]): The chunk texts.
+
+        Returns:
+            dict: Maps the position of every cached text in `texts` to its embedding.
+        """
+        keys = [self.key(text) for text in texts]
+        found = {}
+        with self._lock:
+            unique_keys = list(set(keys))
+            # Stay well below SQLite's limit on bound parameters per statement
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update({key: np.frombuffer(vector, dtype=np.float32) for key, vector in rows})
+
+            if found:
+                now = time.time()
+                self._connection.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?",
+                                             [(now, key) for key in found])
+                self._connection.commit()
+
+            result = {position: found[key] for position, key in enumerate(keys) if key in found}
+            self.hits += len(result)
+            self.misses += len(texts) - len(result)
+        return result
+
+    def put_many(self, texts: list[str], embeddings):
+        """
+        Store the embeddings of several chunk texts, then evict old entries if over capacity.
+        """
+        now = time.time()
+        rows = [(self.key(text), np.asarray(embedding, dtype=np.float32).tobytes(), now)
+                for text, embedding in zip(texts, embeddings)]
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)", rows
+            )
+            self._evict()
+            self._connection.commit()
+
+    def _evict(self):
+        (count,) = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._connection.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)", (excess,)
+            )
+
+    def stats(self) -> dict:
+        """
+        Return lookup counters and the current number of entries.
+        """
+        with self._lock:
+            (entries,) = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0
+        }
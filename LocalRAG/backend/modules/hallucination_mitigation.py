@@ -1,11 +1,22 @@
 import re
+from modules.entities import find_entity
+
+# Questions asking for the effective date and nothing else, e.g. "What is the effective date of the
+# agreement?" or "When does this contract take effect?"; anything more is left to the model
+EFFECTIVE_DATE_ONLY_QUERY = re.compile(
+    r"^\s*(?:(?:what|which)(?:'s|\s+is|\s+was)|when\s+is|give\s+me|tell\s+me)\s+the\s+effective\s+date"
+    r"(?:\s+of\s+(?:the|this)(?:\s+\w+){1,2})?\s*[?.]?\s*$"
+    r"|^\s*when\s+(?:does|did|will)\s+(?:the|this)(?:\s+\w+){1,2}\s+(?:become\s+effective|take\s+effect|commence|start)"
+    r"\s*[?.]?\s*$",
+    re.IGNORECASE)
 
 def generate_system_prompt():
     """
     Generate the system prompt for the assistant.
     """
     prompt = (
-        "You are a helpful assistant that answers questions based on the provided context. "
+        "You are a helpful assistant that answers questions about legal contracts based on the provided context, "
+        "given as numbered excerpts with their page numbers. "
         "Break down the question into small parts and answer each part separately. "
         "Do not use any external knowledge or make up information. "
         "If the answer is not in the context, say 'The answer is not found in the provided document.'."
@@ -15,24 +26,31 @@ def generate_system_prompt():
 def extract_information_from_context(context, query):
     """
     Extract specific information (e.g., dates) from the context based on the query.
+
+    Dates are looked up in the entities extracted from each chunk at ingestion, preferring
+    a date stated as the effective date, in the order the chunks were retrieved.
     """
     # Check if the query mentions "date"
     if "date" in query.lower():
-        # Patterns to match different date formats
-        date_patterns = [
-            r'(\b\w+\s\d{1,2},\s\d{4}\b)',  # e.g., January 1, 2023
-            r'(\b\d{1,2}/\d{1,2}/\d{4}\b)',  # e.g., 01/01/2023
-            r'(\b\d{1,2}-\d{1,2}-\d{4}\b)',  # e.g., 01-01-2023
-            r'(\b\d{4}-\d{1,2}-\d{1,2}\b)',  # e.g., 2023-01-01
-            r'(\b\d{1,2}\s\w+\s\d{4}\b)'     # e.g., 1 January 2023
-        ]
-
-        # Loop through the context to find a date match
-        for key, value in context.items():
-            for pattern in date_patterns:
-                match = re.search(pattern, str(value), re.IGNORECASE)  # Match date patterns in context value
-                if match:
-                    return match.group(1)  # Return the matched date
+        match = find_entity(context, "effective_dates") or find_entity(context, "dates")
+        if match:
+            return match[0]  # Return the matched date
         return "Date not found in the provided context."  # If no date is found
     else:
         return "Information not found."  # If the query doesn't mention a date
+
+def answer_from_entities(context, query):
+    """
+    Answer a question asking only for the effective date straight from the indexed entities
+    of the context. Only a date the contract states as effective is used.
+
+    Returns:
+        str: The answer, or None if the question or the context does not allow one.
+    """
+    if not EFFECTIVE_DATE_ONLY_QUERY.match(query):
+        return None
+    match = find_entity(context, "effective_dates")
+    if match is None:
+        return None
+    effective_date, result = match
+    return f"According to the contract, the effective date is {effective_date} ({result['page_number']})."
@@ -0,0 +1,151 @@
+# modules/index_registry.py
+import threading
+import time
+from dataclasses import dataclass, field
+import torch
+from modules.vector_index import ExactIndex, ShardedIndex
+from modules.lexical_index import ShardedLexicalIndex
+
+
+@dataclass(frozen=True)
+class IndexSnapshot:
+    """
+    An immutable, fully loaded view of the document index.
+
+    It holds a lease on the stores it reads, so they stay on disk until the snapshot is
+    replaced and its last reader drops it.
+    """
+    pages_and_chunks: list[dict]
+    embeddings: torch.Tensor
+    document_ranges: dict
+    document_indexes: dict
+    document_lexical_indexes: dict
+    document_versions: dict
+    version: int
+    loaded_at: float
+    load_seconds: float
+    store_lease: object = field(default=None, repr=False, compare=False)
+
+    def scope(self, document_id=None):
+        """
+        Restrict the index to one document, or return the whole corpus when no id is given.
+
+        Args:
+            document_id (str, optional): The document to scope to.
+
+        Returns:
+            pages_and_chunks (list of dict), embeddings (torch.Tensor): Views over the selected rows
+                (embeddings is None when only quantized indexes are resident).
+            index (VectorIndex): Index to search them with, whose results are positions in those rows.
+        """
+        if document_id is None:
+            if self.document_indexes:
+                shards = [(self.document_ranges[doc_id][0], index) for doc_id, index in self.document_indexes.items()]
+                return self.pages_and_chunks, self.embeddings, ShardedIndex(shards)
+            return self.pages_and_chunks, self.embeddings, ExactIndex(self.embeddings)
+
+        start, stop = self.document_ranges[document_id]
+        embeddings = self.embeddings[start:stop] if self.embeddings is not None else None
+        index = self.document_indexes.get(document_id)
+        if index is None:
+            index = ExactIndex(embeddings)
+        return self.pages_and_chunks[start:stop], embeddings, index
+
+    def lexical_scope(self, document_id=None):
+        """
+        The BM25 index matching `scope(document_id)`, or None when hybrid retrieval is off.
+        """
+        if not self.document_lexical_indexes:
+            return None
+        if document_id is None:
+            return ShardedLexicalIndex([(self.document_ranges[doc_id][0], index)
+                                        for doc_id, index in self.document_lexical_indexes.items()])
+        return self.document_lexical_indexes.get(document_id)
+
+    def embedding_dim(self) -> int:
+        """
+        Dimension of the served embeddings, or 0 when nothing is loaded.
+        """
+        if self.embeddings is not None:
+            return self.embeddings.shape[1] if self.embeddings.dim() == 2 else 0
+        index = next(iter(self.document_indexes.values()), None)
+        return index.embeddings.shape[1] if index is not None else 0
+
+    def document_version(self, document_id=None) -> str:
+        """
+        Identify the ingested version of one document, or of the whole corpus when no id is given.
+        A document's version changes every time it is re-ingested.
+        """
+        if document_id is None:
+            return "|".join(f"{doc_id}={store}" for doc_id, store in sorted(self.document_versions.items()))
+        return self.document_versions[document_id]
+
+
+class IndexRegistry:
+    """
+    Holds the resident index of the running app and hot-swaps it when a document is ingested.
+
+    Readers call `get()` and keep using the snapshot they received; a reload builds a complete
+    new snapshot off to the side and replaces the reference in one assignment, so readers never
+    wait on a lock and never see a partially loaded index.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._version = 0
+        self._write_lock = threading.Lock()  # Serialises reloads only, never taken by readers
+
+    def get(self):
+        """
+        Return the current snapshot, or None if nothing has been loaded yet.
+        """
+        return self._snapshot
+
+    def load(self, loader, *args, **kwargs) -> IndexSnapshot:
+        """
+        Build a new snapshot with `loader` and swap it in atomically.
+
+        Args:
+            loader (callable): Function returning the data fields of an IndexSnapshot as a dict.
+            *args, **kwargs: Arguments passed through to the loader.
+
+        Returns:
+            IndexSnapshot: The snapshot that is now being served.
+        """
+        with self._write_lock:
+            start_time = time.perf_counter()
+            fields = loader(*args, **kwargs)
+            load_seconds = time.perf_counter() - start_time
+
+            snapshot = IndexSnapshot(
+                **fields,
+                version=self._version + 1,
+                loaded_at=time.time(),
+                load_seconds=load_seconds
+            )
+            self._version = snapshot.version
+            self._snapshot = snapshot  # Single reference assignment is the atomic swap
+            return snapshot
+
+    def status(self) -> dict:
+        """
+        Describe the snapshot currently being served.
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {"loaded": False}
+
+        return {
+            "loaded": True,
+            "version": snapshot.version,
+            "num_documents": len(snapshot.document_ranges),
+            "num_chunks": len(snapshot.pages_and_chunks),
+            "index_backend": next(iter(snapshot.document_indexes.values())).backend if snapshot.document_indexes else "exact",
+            "embedding_dim": snapshot.embedding_dim(),
+            "embeddings_bytes": snapshot.embeddings.element_size() * snapshot.embeddings.nelement()
+                                if snapshot.embeddings is not None else 0,
+            "index_bytes": sum(index.nbytes for index in snapshot.document_indexes.values()),
+            "lexical_index_bytes": sum(index.nbytes for index in snapshot.document_lexical_indexes.values()),
+            "loaded_at": snapshot.loaded_at,
+            "load_seconds": round(snapshot.load_seconds, 4)
+        }
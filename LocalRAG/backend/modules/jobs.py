@@ -0,0 +1,78 @@
+# modules/jobs.py
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobRegistry:
+    """
+    Runs long tasks such as PDF ingestion on a bounded pool of worker threads and
+    records their progress, so a request can return immediately and be polled later.
+
+    Args:
+        max_workers (int): Number of jobs that may run at the same time; others wait queued.
+        max_history (int): Number of finished jobs kept for status lookups.
+    """
+
+    def __init__(self, max_workers: int = 1, max_history: int = 256):
+        self.max_history = max_history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()  # job id -> job record, oldest first
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, function, *args, **kwargs) -> dict:
+        """
+        Queue `function(*args, **kwargs)` as a background job.
+
+        Returns:
+            dict: A copy of the new job record, including its `job_id`.
+        """
+        job_id = uuid.uuid4().hex
+        job = {"job_id": job_id, "kind": kind, "status": "queued", "created_at": time.time(),
+               "started_at": None, "finished_at": None, "result": None, "error": None}
+        with self._lock:
+            self._jobs[job_id] = job
+            self._forget_finished()
+            queued = dict(job)
+
+        self._executor.submit(self._run, job_id, function, args, kwargs)
+        return queued
+
+    def _run(self, job_id, function, args, kwargs):
+        self._update(job_id, status="running", started_at=time.time())
+        try:
+            result = function(*args, **kwargs)
+        except Exception as error:
+            self._update(job_id, status="failed", finished_at=time.time(), error=f"{type(error).__name__}: {error}")
+        else:
+            self._update(job_id, status="succeeded", finished_at=time.time(), result=result)
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _forget_finished(self):
+        # Drop the oldest finished jobs once the history is full; queued and running jobs are kept
+        finished = [job_id for job_id, job in self._jobs.items() if job["finished_at"] is not None]
+        for job_id in finished[:max(len(self._jobs) - self.max_history, 0)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str):
+        """
+        Return a copy of a job record, or None if the job is unknown.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def list(self) -> list[dict]:
+        """
+        Return copies of every known job record, oldest first.
+        """
+        with self._lock:
+            return [dict(job) for job in self._jobs.values()]
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,37 @@
+# modules/lazy.py
+import threading
+from modules.metrics import span
+
+
+class LazySingleton:
+    """
+    A model or pipeline built on first use instead of at import time, so a server process
+    starts and answers health checks without paying for models it has not needed yet.
+
+    The value is built once even when several threads ask for it at the same time; they
+    wait for the first build instead of each loading their own copy.
+    """
+
+    def __init__(self, name: str, factory):
+        self.name = name
+        self.factory = factory
+        self._value = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._value is not None
+
+    def get(self):
+        """
+        Return the value, building it first if this is the first use.
+        """
+        value = self._value
+        if value is None:
+            with self._lock:
+                if self._value is None:
+                    # The load shows up in the trace of the request that paid for it
+                    with span("model.load", model=self.name):
+                        self._value = self.factory()
+                value = self._value
+        return value
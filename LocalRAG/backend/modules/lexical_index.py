@@ -0,0 +1,226 @@
+# modules/lexical_index.py
+import os
+import re
+import numpy as np
+
+LEXICAL_INDEX_FILENAME = "lexical.npz"
+
+# Words, plus dotted numbers kept whole so clause references like '4.2.1' match exactly
+TOKEN_PATTERN = re.compile(r"\d+(?:\.\d+)+|\w+")
+
+# Function words that match almost every chunk and only add noise to the lexical ranking
+STOPWORDS = frozenset(
+    "a an and are as at be by do does for from has have how in is it its of on or shall that the "
+    "their there this to was were what when where which who will with".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercase terms of a text for the lexical index, without stopwords.
+    """
+    return [term for term in TOKEN_PATTERN.findall(text.lower()) if term not in STOPWORDS]
+
+
+def bm25_idf(num_chunks: int, document_frequencies):
+    """
+    Inverse document frequency of terms found in `document_frequencies` of `num_chunks` chunks.
+    """
+    document_frequencies = np.asarray(document_frequencies)
+    return np.log1p((num_chunks - document_frequencies + 0.5) / (document_frequencies + 0.5)).astype(np.float32)
+
+
+def bm25_weights(frequencies: np.ndarray, lengths: np.ndarray, average_length: float, k1: float, b: float):
+    """
+    Length-normalised BM25 weight of postings with the given term frequencies and chunk lengths.
+    """
+    tf = frequencies.astype(np.float32)
+    return tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths.astype(np.float32) / average_length))
+
+
+class BM25Index:
+    """
+    Inverted index over the chunks of one document, scored with Okapi BM25.
+
+    Postings are stored as flat arrays (compressed sparse rows by term): the chunks of term t
+    are `postings[offsets[t]:offsets[t + 1]]`, in chunk order, with their term frequencies.
+    Only term frequencies and chunk lengths are persisted; the BM25 weight of every posting is
+    precomputed at load time for the configured k1 and b, so a query is one vectorised
+    scatter-add per query term.
+    """
+
+    def __init__(self, terms: list[str], offsets: np.ndarray, postings: np.ndarray,
+                 frequencies: np.ndarray, lengths: np.ndarray, k1: float = 1.2, b: float = 0.75):
+        self.terms = terms
+        self.vocabulary = {term: term_id for term_id, term in enumerate(terms)}
+        self.offsets = offsets
+        self.postings = postings
+        self.frequencies = frequencies
+        self.lengths = lengths
+        self.k1 = k1
+        self.b = b
+        self.total_length = int(lengths.sum())
+
+        # Inverse document frequency of every term, and the length-normalised weight of every posting
+        num_chunks = len(lengths)
+        self.idf = bm25_idf(num_chunks, np.diff(offsets))
+        average_length = max(self.total_length / num_chunks, 1.0) if num_chunks else 1.0
+        self.weights = bm25_weights(frequencies, lengths[postings], average_length, k1, b)
+
+    @classmethod
+    def build(cls, texts: list[str], k1: float = 1.2, b: float = 0.75):
+        """
+        Build the index of a list of chunk texts; results are positions in that list.
+        """
+        vocabulary = {}
+        term_ids, chunk_ids, frequencies = [], [], []
+        lengths = np.zeros(len(texts), dtype=np.int32)
+        for chunk_id, text in enumerate(texts):
+            counts = {}
+            for term in tokenize(text):
+                counts[term] = counts.get(term, 0) + 1
+            lengths[chunk_id] = sum(counts.values())
+            for term, count in counts.items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                chunk_ids.append(chunk_id)
+                frequencies.append(count)
+
+        # Group postings by term; a stable sort keeps each term's chunks in ascending order
+        term_ids = np.asarray(term_ids, dtype=np.int32)
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)), out=offsets[1:])
+        postings = np.asarray(chunk_ids, dtype=np.int32)[order]
+        frequencies = np.minimum(np.asarray(frequencies, dtype=np.int64), np.iinfo(np.uint16).max).astype(np.uint16)[order]
+        return cls(list(vocabulary), offsets, postings, frequencies, lengths, k1=k1, b=b)
+
+    @classmethod
+    def load(cls, path: str, k1: float = 1.2, b: float = 0.75):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["terms"].tolist(), data["offsets"], data["postings"], data["frequencies"],
+                       data["lengths"], k1=k1, b=b)
+
+    def save(self, path: str):
+        with open(path + ".tmp", "wb") as file:
+            np.savez(file, terms=np.asarray(self.terms, dtype=str), offsets=self.offsets, postings=self.postings,
+                     frequencies=self.frequencies, lengths=self.lengths)
+        os.replace(path + ".tmp", path)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (self.offsets, self.postings, self.frequencies,
+                                              self.lengths, self.idf, self.weights))
+
+    def document_frequency(self, term: str) -> int:
+        """
+        Number of chunks containing a term.
+        """
+        term_id = self.vocabulary.get(term)
+        return 0 if term_id is None else int(self.offsets[term_id + 1] - self.offsets[term_id])
+
+    def scores(self, query: str, idf: dict = None, average_length: float = None) -> np.ndarray:
+        """
+        BM25 score of every chunk for a query; chunks sharing no term with it score 0.
+
+        `idf` (by query term) and `average_length` replace the statistics of this index by those
+        of a larger collection it is part of, so its scores are comparable with the other parts'.
+        """
+        scores = np.zeros(len(self), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, stop = self.offsets[term_id], self.offsets[term_id + 1]
+            if idf is None:
+                term_scores = self.idf[term_id] * self.weights[start:stop]
+            else:
+                term_scores = idf[term] * bm25_weights(self.frequencies[start:stop], self.lengths[self.postings[start:stop]],
+                                                       average_length, self.k1, self.b)
+            # A term's postings hold each chunk once, so plain fancy-index addition is safe
+            scores[self.postings[start:stop]] += term_scores
+        return scores
+
+    def search(self, query: str, k: int, idf: dict = None, average_length: float = None):
+        """
+        Find the k best-scoring chunks that share at least one term with the query.
+
+        Args:
+            idf, average_length: Collection statistics to score with instead of this index's own (see `scores`).
+
+        Returns:
+            scores (np.ndarray), indices (np.ndarray): Best first; fewer than k if fewer chunks match.
+        """
+        scores = self.scores(query, idf=idf, average_length=average_length)
+        matches = np.flatnonzero(scores)
+        if len(matches) > k:
+            matches = matches[np.argpartition(-scores[matches], k - 1)[:k]]
+        matches = matches[np.argsort(-scores[matches], kind="stable")]
+        return scores[matches], matches
+
+
+class ShardedLexicalIndex:
+    """
+    Searches the lexical indexes of several documents over consecutive row ranges and merges
+    their results by score, like `ShardedIndex` does for vector indexes.
+
+    BM25 scores depend on the inverse document frequencies and average chunk length of the
+    collection, so every shard is scored with those of all shards together; the merged
+    ranking is the one a single index over every chunk would give.
+    """
+
+    def __init__(self, shards: list[tuple[int, BM25Index]]):
+        self.shards = shards  # (row offset, index) pairs
+
+    def __len__(self):
+        return sum(len(index) for _, index in self.shards)
+
+    @property
+    def nbytes(self):
+        return sum(index.nbytes for _, index in self.shards)
+
+    def search(self, query: str, k: int):
+        idf, average_length = None, None
+        if len(self.shards) > 1:
+            num_chunks = len(self)
+            terms = list(set(tokenize(query)))
+            document_frequencies = [sum(index.document_frequency(term) for _, index in self.shards) for term in terms]
+            idf = dict(zip(terms, bm25_idf(num_chunks, document_frequencies).tolist()))
+            total_length = sum(index.total_length for _, index in self.shards)
+            average_length = max(total_length / num_chunks, 1.0) if num_chunks else 1.0
+
+        all_scores, all_indices = [], []
+        for offset, index in self.shards:
+            scores, indices = index.search(query, k, idf=idf, average_length=average_length)
+            all_scores.append(scores)
+            all_indices.append(indices.astype(np.int64) + offset)
+        if not all_scores:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+
+        scores = np.concatenate(all_scores)
+        indices = np.concatenate(all_indices)
+        order = np.argsort(-scores, kind="stable")[:k]
+        return scores[order], indices[order]
+
+
+def build_lexical_index(chunks: list[dict], config: dict) -> BM25Index:
+    """
+    Build the BM25 index of a document's chunk records.
+    """
+    return BM25Index.build([chunk["sentence_chunk"] for chunk in chunks], k1=config["bm25_k1"], b=config["bm25_b"])
+
+
+def load_or_build_lexical_index(store_dir: str, chunks: list[dict], config: dict) -> BM25Index:
+    """
+    Load the persisted lexical index of a store, building and saving it first if it is missing
+    (e.g. for stores written before hybrid retrieval existed).
+    """
+    path = os.path.join(store_dir, LEXICAL_INDEX_FILENAME)
+    if os.path.exists(path):
+        return BM25Index.load(path, k1=config["bm25_k1"], b=config["bm25_b"])
+
+    index = build_lexical_index(chunks, config)
+    index.save(path)
+    return index
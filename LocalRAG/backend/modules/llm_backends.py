@@ -0,0 +1,318 @@
+# modules/llm_backends.py
+import os
+import re
+import json
+import asyncio
+import threading
+import openai
+import aiohttp
+
+# API key sent to an `llm_api_base` server when OPENAI_API_KEY is not set
+LOCAL_SERVER_API_KEY = "not-needed"
+
+
+class LLMBackend:
+    """
+    Interface of a chat model that answers with OpenAI-style assistant messages.
+
+    `complete` returns a message dict holding either `content` or a `function_call` with
+    `name` and `arguments`; `astream` yields the same message as deltas. Subclasses only
+    need `complete`: the async methods fall back to running it on a worker thread.
+    """
+    name = None
+
+    def open(self):
+        """
+        Acquire resources shared between requests (connection pools). Called once at startup.
+        """
+
+    async def close(self):
+        """
+        Release what `open` acquired.
+        """
+
+    def warmup(self):
+        """
+        Load what the first request would otherwise wait for (in-process models). Optional.
+        """
+
+    def complete(self, messages: list[dict], functions: list[dict] = None) -> dict:
+        raise NotImplementedError
+
+    async def acomplete(self, messages: list[dict], functions: list[dict] = None) -> dict:
+        return await asyncio.to_thread(self.complete, messages, functions)
+
+    async def astream(self, messages: list[dict], functions: list[dict] = None):
+        """
+        Yield the answer as deltas: `{"content": text}` pieces, or `{"function_call": {...}}`
+        fragments whose `name` and `arguments` concatenate to the full call.
+        """
+        message = await self.acomplete(messages, functions)
+        if message.get("function_call"):
+            yield {"function_call": message["function_call"]}
+        elif message.get("content"):
+            yield {"content": message["content"]}
+
+
+class OpenAIBackend(LLMBackend):
+    """
+    OpenAI chat completions, or any OpenAI-compatible server when `api_base` is set
+    (vLLM, llama.cpp server, Ollama, the stub server in `modules.stub_llm_server`).
+    """
+    name = "openai"
+
+    def __init__(self, model: str, api_key: str = None, api_base: str = None,
+                 timeout: float = 60, max_connections: int = 20):
+        self.model = model
+        # Local OpenAI-compatible servers (vLLM, llama.cpp, Ollama, the stub server) ignore the key,
+        # but the openai client refuses to send a request without one
+        self.api_key = api_key or (LOCAL_SERVER_API_KEY if api_base else None)
+        self.api_base = api_base
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._session = None  # Pooled HTTP session shared by all async calls
+
+    def open(self):
+        connector = aiohttp.TCPConnector(limit=self.max_connections)
+        self._session = aiohttp.ClientSession(connector=connector)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _request(self, messages, functions, stream=False):
+        openai.api_key = self.api_key
+        if self.api_base:
+            openai.api_base = self.api_base
+        request = {"model": self.model, "messages": messages, "request_timeout": self.timeout}
+        if functions:
+            request.update(functions=functions, function_call="auto")  # Let the model decide
+        if stream:
+            request["stream"] = True
+        return request
+
+    def _use_session(self):
+        if self._session is not None:
+            # Reuse pooled connections instead of opening a session per request
+            openai.aiosession.set(self._session)
+
+    def complete(self, messages, functions=None):
+        response = openai.ChatCompletion.create(**self._request(messages, functions))
+        return response['choices'][0]['message']
+
+    async def acomplete(self, messages, functions=None):
+        self._use_session()
+        response = await openai.ChatCompletion.acreate(**self._request(messages, functions))
+        return response['choices'][0]['message']
+
+    async def astream(self, messages, functions=None):
+        self._use_session()
+        response = await openai.ChatCompletion.acreate(**self._request(messages, functions, stream=True))
+        async for chunk in response:
+            delta = chunk['choices'][0].get('delta', {})
+            if delta.get('function_call'):
+                yield {"function_call": {"name": delta['function_call'].get('name') or "",
+                                         "arguments": delta['function_call'].get('arguments') or ""}}
+            elif delta.get('content'):
+                yield {"content": delta['content']}
+
+
+def describe_functions(functions: list[dict]) -> str:
+    """
+    Describe callable functions in a system prompt for models without native function calling.
+    """
+    return (
+        "You can call these functions: " + json.dumps(functions) + "\n"
+        "To call one, reply with only a JSON object like "
+        '{"function_call": {"name": "<function name>", "arguments": {}}} and nothing else. '
+        "Otherwise answer normally."
+    )
+
+
+def parse_function_call(text: str, functions: list[dict]):
+    """
+    Return the function call written by a prompted model, or None if the text is a normal answer.
+    """
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not functions or match is None:
+        return None
+    try:
+        call = json.loads(match.group(0)).get("function_call")
+    except (json.JSONDecodeError, AttributeError):
+        return None
+    if not isinstance(call, dict) or call.get("name") not in {function["name"] for function in functions}:
+        return None
+    return {"name": call["name"], "arguments": json.dumps(call.get("arguments") or {})}
+
+
+def plain_chat_messages(messages: list[dict], functions: list[dict] = None) -> list[dict]:
+    """
+    Rewrite OpenAI function-calling messages into plain system/user/assistant turns.
+    """
+    plain = []
+    for message in messages:
+        if message["role"] == "function":
+            plain.append({"role": "user", "content": f"Result of {message['name']}: {message['content']}"})
+        elif message.get("function_call"):
+            plain.append({"role": "assistant", "content": json.dumps({"function_call": message["function_call"]})})
+        else:
+            plain.append({"role": message["role"], "content": message["content"]})
+    if functions:
+        # Many chat templates accept a single leading system message only
+        if plain and plain[0]["role"] == "system":
+            plain[0] = {"role": "system", "content": plain[0]["content"] + "\n\n" + describe_functions(functions)}
+        else:
+            plain.insert(0, {"role": "system", "content": describe_functions(functions)})
+    return plain
+
+
+class LocalTransformersBackend(LLMBackend):
+    """
+    Instruction-tuned causal language model run in-process with transformers, so answers
+    need no remote service. Function calls are prompted and parsed from the model's JSON reply.
+    The model is loaded on first use and generation is greedy, so answers are repeatable.
+    """
+    name = "local"
+
+    def __init__(self, model_name: str, max_new_tokens: int = 256, device: str = "cpu"):
+        self.model_name = model_name
+        self.max_new_tokens = max_new_tokens
+        self.device = device
+        self._model = None
+        self._tokenizer = None
+        self._lock = threading.RLock()  # One load or generation at a time; each already uses every core
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                from transformers import AutoModelForCausalLM, AutoTokenizer
+                self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                self._model = AutoModelForCausalLM.from_pretrained(self.model_name).to(self.device).eval()
+            return self._model, self._tokenizer
+
+    def warmup(self):
+        self._load()
+
+    def _inputs(self, messages, functions):
+        model, tokenizer = self._load()
+        inputs = tokenizer.apply_chat_template(plain_chat_messages(messages, functions), add_generation_prompt=True,
+                                               return_tensors="pt", return_dict=True)
+        # Only the ids and mask are generation inputs; some tokenizers also return token type ids
+        inputs = {key: inputs[key].to(self.device) for key in ("input_ids", "attention_mask")}
+        return model, tokenizer, inputs
+
+    def _message(self, text, functions):
+        function_call = parse_function_call(text, functions)
+        if function_call:
+            return {"role": "assistant", "content": None, "function_call": function_call}
+        return {"role": "assistant", "content": text.strip()}
+
+    def complete(self, messages, functions=None):
+        with self._lock:
+            model, tokenizer, inputs = self._inputs(messages, functions)
+            output = model.generate(**inputs, max_new_tokens=self.max_new_tokens, do_sample=False,
+                                    pad_token_id=tokenizer.pad_token_id or tokenizer.eos_token_id)
+        text = tokenizer.decode(output[0, inputs["input_ids"].shape[1]:], skip_special_tokens=True)
+        return self._message(text, functions)
+
+    async def astream(self, messages, functions=None):
+        from transformers import TextIteratorStreamer
+
+        def generate(streamer):
+            try:
+                with self._lock:
+                    model, tokenizer, inputs = self._inputs(messages, functions)
+                    model.generate(**inputs, max_new_tokens=self.max_new_tokens, do_sample=False,
+                                   pad_token_id=tokenizer.pad_token_id or tokenizer.eos_token_id,
+                                   streamer=streamer)
+            except Exception:
+                streamer.end()  # Unblock the reader; the error is raised when the task is awaited
+                raise
+
+        await asyncio.to_thread(self._load)
+        streamer = TextIteratorStreamer(self._tokenizer, skip_prompt=True, skip_special_tokens=True)
+        generation = asyncio.create_task(asyncio.to_thread(generate, streamer))
+
+        # A reply starting with '{' may be a function call, so hold it back until it is complete
+        pieces = []
+        held_back = None
+        while (piece := await asyncio.to_thread(next, streamer, None)) is not None:
+            pieces.append(piece)
+            if held_back is None and "".join(pieces).strip():
+                held_back = bool(functions) and "".join(pieces).lstrip().startswith("{")
+                if not held_back:
+                    yield {"content": "".join(pieces)}
+            elif held_back is False:
+                yield {"content": piece}
+        await generation
+
+        if held_back:
+            message = self._message("".join(pieces), functions)
+            yield {"function_call": message["function_call"]} if message.get("function_call") \
+                else {"content": message["content"]}
+
+
+class StubBackend(LLMBackend):
+    """
+    Deterministic answers without any model, for offline load tests and benchmarks.
+
+    The stub repeats the question and the first cited page, and calls the first function
+    whenever the question mentions a date, like the real model usually does.
+    """
+    name = "stub"
+
+    def __init__(self, token_delay: float = 0.0):
+        self.token_delay = token_delay
+
+    def complete(self, messages, functions=None):
+        last = messages[-1]
+        if last["role"] == "function":
+            return {"role": "assistant", "content": f"According to the contract, the answer is {last['content']}"}
+
+        question = last["content"].rsplit("Question:", 1)[-1].strip()
+        if functions and "date" in question.lower():
+            return {"role": "assistant", "content": None,
+                    "function_call": {"name": functions[0]["name"], "arguments": "{}"}}
+
+        page = re.search(r"\bPage(?: number:)? (\d+)", last["content"])
+        source = f" (see page {page.group(1)})" if page else ""
+        return {"role": "assistant", "content": f"Stub answer to '{question}'{source}."}
+
+    async def acomplete(self, messages, functions=None):
+        return self.complete(messages, functions)
+
+    async def astream(self, messages, functions=None):
+        for delta in message_deltas(self.complete(messages, functions)):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield delta
+
+
+def message_deltas(message: dict) -> list[dict]:
+    """
+    Split an assistant message into streaming deltas, one per word of its content.
+    """
+    if message.get("function_call"):
+        return [{"function_call": {"name": message["function_call"]["name"], "arguments": ""}},
+                {"function_call": {"name": "", "arguments": message["function_call"]["arguments"]}}]
+    words = message["content"].split(" ")
+    return [{"content": word if i == 0 else " " + word} for i, word in enumerate(words)]
+
+
+def create_llm_backend(config: dict) -> LLMBackend:
+    """
+    Create the backend selected by `config['llm_backend']` ('openai', 'local' or 'stub').
+    """
+    backend = config.get("llm_backend", "openai")
+    if backend == "openai":
+        return OpenAIBackend(config["model"], api_key=os.getenv("OPENAI_API_KEY"),
+                             api_base=config.get("llm_api_base"), timeout=config["llm_timeout_seconds"],
+                             max_connections=config["llm_max_connections"])
+    if backend == "local":
+        return LocalTransformersBackend(config["local_llm_model"],
+                                        max_new_tokens=config["local_llm_max_new_tokens"],
+                                        device=config["local_llm_device"])
+    if backend == "stub":
+        return StubBackend(token_delay=config.get("stub_llm_token_delay", 0.0))
+    raise ValueError(f"Unknown LLM backend '{backend}'. Choose from 'openai', 'local' or 'stub'.")
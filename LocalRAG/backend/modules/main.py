@@ -1,68 +1,487 @@
 
 import sys
 import os
+import json
 import time
-from modules.pdf_processing import text_formatter, open_and_read_pdf, text_to_sentences
-from modules.text_chunking import process_sentence_chunks, process_chunks
-from modules.embedding import create_embeddings
-from modules.retrieval import retrieve_relevant_resources, print_top_results_and_scores
-from modules.query_processing import answer_query
-from modules.utils import load_config, embedding_model, save_embeddings, load_embeddings, clean_text
+import logging
+import asyncio
+import contextvars
+from collections import deque
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from tqdm.auto import tqdm
+from modules.pdf_processing import text_formatter, iter_pdf_pages, iter_sentences, sentencizer
+from modules.text_chunking import iter_sentence_chunks, iter_chunks, iter_token_chunks, ChunkReport
+from modules.embedding import iter_embedded_chunks, chunk_token_budget
+from modules.retrieval import retrieve_relevant_resources, retrieve_relevant_resources_batch, print_top_results_and_scores, format_results
+from modules.query_processing import answer_query, answer_query_async, get_llm_backend
+from modules.context_packing import token_counter
+from modules.utils import load_config, embedding_model, clean_text, EMBEDDING_MODEL_NAME
+from modules.vector_store import VectorStoreWriter, load_vector_store, migrate_csv_to_vector_store
+from modules.vector_store import save_page_index, load_page_index
+from modules.corpus import Corpus, document_id_from_filename
+from modules.vector_index import build_index, save_index
+from modules.lexical_index import build_lexical_index, LEXICAL_INDEX_FILENAME
+from modules.entities import annotate_entities
+from modules.reranking import Reranker
+from modules.embedding_cache import EmbeddingCache, file_sha256
+from modules.query_cache import TTLCache, normalize_query
+from modules.jobs import JobRegistry
+from modules.metrics import metrics, span, StageClock
+from modules.lazy import LazySingleton
 
 # Add the root directory of the project to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
+logger = logging.getLogger(__name__)
+
 
 # Load configuration
 config = load_config('config.yaml')
 
-# Load the embedding model globally to avoid loading it multiple times
-embed_model = embedding_model(device="cpu")
+# Documents uploaded so far, each with its own vector store
+corpus = Corpus(config["corpus_dir"])
+
+# The embedding model, shared by every request and loaded once, on first use (see `warmup_models`)
+embed_model = LazySingleton("embedding_model", lambda: embedding_model(device="cpu"))
+
+# Chunk embeddings already computed, keyed by content hash, shared by all documents
+embedding_cache = EmbeddingCache(config["embedding_cache_path"], EMBEDDING_MODEL_NAME,
+                                  max_entries=config["embedding_cache_max_entries"])
 
-def process_pdf_and_create_embeddings(pdf_path, config):
+# Query embeddings and final answers of recent questions, so repeated FAQ-style questions
+# skip the embedding model and the LLM round-trips
+query_embedding_cache = TTLCache(max_entries=config["query_cache_max_entries"],
+                                 ttl_seconds=config["query_cache_ttl_seconds"])
+answer_cache = TTLCache(max_entries=config["answer_cache_max_entries"],
+                        ttl_seconds=config["answer_cache_ttl_seconds"])
+
+# Optional cross-encoder re-ranking of retrieval candidates, with its results cached per
+# question and document version; the model is loaded on the first reranked query
+rerank_cache = TTLCache(max_entries=config["rerank_cache_max_entries"],
+                        ttl_seconds=config["rerank_cache_ttl_seconds"])
+reranker = Reranker(config["rerank_model"], device="cpu", budget_seconds=config["rerank_budget_ms"] / 1000,
+                    cache=rerank_cache) if config["rerank"] else None
+
+def warmup_models():
     """
-    This function processes the PDF, chunks the text, and creates embeddings.
+    Load every model the first queries and uploads would otherwise wait for, and run one input
+    through the embedding model and the cross-encoder so their first real pass is not the slow one.
+    Requests arriving meanwhile wait for the loads in progress instead of starting their own.
+    """
+    start_time = time.perf_counter()
+    with span("warmup"):
+        embed_model.get().encode(["warmup"], show_progress_bar=False)
+        sentencizer.get()
+        if reranker is not None:
+            reranker.score("warmup", ["warmup"])
+        token_counter(config["model"])
+        get_llm_backend(config).warmup()
+    logger.info("Models warmed up in %.2f seconds", time.perf_counter() - start_time)
+
+def model_status():
+    """
+    Report which models are loaded; the others load on first use.
+    """
+    return {
+        "embedding_model": embed_model.loaded,
+        "sentencizer": sentencizer.loaded,
+        "reranker": reranker.loaded if reranker is not None else None
+    }
+
+def ingest_signature(config):
+    """
+    Describe the settings that shape a document's stored chunks, vectors and index.
+    """
+    return json.dumps({
+        "model": EMBEDDING_MODEL_NAME,
+        "chunk_size": config["chunk_size"],
+        "chunk_overlap": config["chunk_overlap"],
+        "chunking_mode": config["chunking_mode"],
+        "chunk_max_tokens": config["chunk_max_tokens"],
+        "chunk_overlap_tokens": config["chunk_overlap_tokens"],
+        "embedding_dtype": config["embedding_dtype"],
+        "index_backend": config["index_backend"]
+    }, sort_keys=True)
+
+# Bounded pool for CPU-bound request work (query embedding, search, index reloads),
+# so it never runs on the event loop
+cpu_executor = ThreadPoolExecutor(max_workers=config["cpu_workers"], thread_name_prefix="cpu")
+
+# Uploads are ingested as background jobs, at most `ingestion_jobs` at a time
+ingestion_jobs = JobRegistry(max_workers=config["ingestion_jobs"])
+
+async def run_in_cpu_executor(function, *args, **kwargs):
+    """
+    Run a blocking function on the CPU executor and await its result.
+
+    The function runs in a copy of the caller's context, so its spans join the request's trace.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(cpu_executor, partial(context.run, function, *args, **kwargs))
+
+metrics.describe("localrag_ingested_documents_total", "counter",
+                 "Documents ingested, by outcome (new, revised or unchanged).")
+metrics.describe("localrag_ingested_pages_total", "counter", "Pages of ingested documents, by whether they were reused.")
+metrics.describe("localrag_ingested_chunks_total", "counter", "Chunks written by ingestion.")
+metrics.describe("localrag_ingested_tokens_total", "counter", "Tokens of the chunks written by ingestion.")
+
+def answer_cache_key(query, document_id, document_version):
     """
+    Key a cached answer by the normalized query, the version of the documents it was
+    retrieved from and the settings that shape retrieval and generation.
+    """
+    return (normalize_query(query), document_id, document_version, json.dumps({
+        "llm_backend": config["llm_backend"],
+        "model": config["local_llm_model"] if config["llm_backend"] == "local" else config["model"],
+        "top_k": config["top_k"],
+        "similarity_metric": config["similarity_metric"],
+        "index_backend": config["index_backend"],
+        "retrieval_mode": config["retrieval_mode"],
+        "entity_answers": config["entity_answers"],
+        "context_max_tokens": config["context_max_tokens"],
+        "rerank_model": config["rerank_model"] if config["rerank"] else None,
+        "rerank_candidates": config["rerank_candidates"] if config["rerank"] else None
+    }, sort_keys=True))
+
+def invalidate_document_answers(document_id):
+    """
+    Drop the cached answers of a re-ingested or deleted document, and of corpus-wide queries.
+    """
+    return answer_cache.invalidate(lambda key: key[1] in (document_id, None))
+
+def iter_page_chunks(pages, config, clock=None):
+    """
+    Splits a stream of pages into sentences, chunks them with the configured chunking mode
+    and extracts the entities of every chunk.
+
+    Chunks are either a fixed number of sentences (`chunking_mode: 'sentences'`) or packed up
+    to the embedding model's token budget (`chunking_mode: 'tokens'`). Chunks never span pages.
+    If a `StageClock` is given, it times sentencizing, chunking and entity extraction separately.
+    """
+    clock = clock or StageClock()
+    pages = clock.wrap(iter_sentences(pages, batch_size=config["sentencizer_batch_size"],
+                                      n_process=config["ingestion_workers"]), "sentencizing")
+    if config["chunking_mode"] == "tokens":
+        chunks = clock.wrap(iter_token_chunks(pages, embed_model.get().tokenizer,
+                                              max_tokens=chunk_token_budget(embed_model.get(), config["chunk_max_tokens"]),
+                                              overlap_tokens=config["chunk_overlap_tokens"]), "chunking")
+    elif config["chunking_mode"] == "sentences":
+        pages = iter_sentence_chunks(pages, config["chunk_size"], overlap=config["chunk_overlap"])
+        chunks = clock.wrap(iter_chunks(pages, tokenizer=embed_model.get().tokenizer), "chunking")
+    else:
+        raise ValueError(f"Unknown chunking mode '{config['chunking_mode']}'. Choose 'sentences' or 'tokens'.")
+
+    # Dates, parties, amounts and clauses are extracted once here and stored with each chunk
+    return clock.wrap(annotate_entities(chunks), "entities")
+
+def previous_page_chunks(entry, signature):
+    """
+    Index the pages of a document's stored version by fingerprint, so a revision can reuse them.
+
+    Returns:
+        dict: Page fingerprint -> (chunk records, embedding rows) of that page. Empty if there is
+              no stored version, it predates page fingerprints or it was ingested with other settings.
+    """
+    if not entry or entry.get("ingest_signature") != signature:
+        return {}
+    store_dir = os.path.join(corpus.corpus_dir, entry["store"])
+    page_index = load_page_index(store_dir)
+    if page_index is None:
+        return {}
+
+    # Rows stay memory-mapped; only the pages that are reused are ever read
+    chunks, embeddings = load_vector_store(store_dir)
+    return {page["sha256"]: (chunks[page["start"]:page["stop"]], embeddings[page["start"]:page["stop"]].numpy())
+            for page in page_index}
+
+def iter_pdf_embeddings(pdf_path, config, report=None, previous=None, page_index=None, clock=None):
+    """
+    Streams a PDF through extraction, sentence splitting, chunking and embedding.
+
+    Pages flow through every stage as generators, so only the current embedding window
+    is held in memory at any time. Pages whose fingerprint is in `previous` (see
+    `previous_page_chunks`) reuse their stored chunks and embeddings; only the other pages
+    are split, chunked and embedded, so a revision costs roughly the size of the edit.
+
+    Args:
+        pdf_path (str): The PDF to ingest.
+        config (dict): The configuration.
+        report (ChunkReport, optional): Records every chunk's token count.
+        previous (dict, optional): Chunks and embeddings of the previous version by page fingerprint.
+        page_index (list, optional): Filled with the fingerprint and chunk rows of every page.
+        clock (StageClock, optional): Times extraction, sentencizing, chunking and embedding.
+
+    Yields:
+        list: Consecutive windows of chunks with 'embedding' set, in page order.
+    """
+    previous = previous or {}
+    page_index = page_index if page_index is not None else []
+    clock = clock or StageClock()
+    pending = deque()  # Pages extracted but not written yet: (page number, fingerprint, reused chunks)
+    num_rows = 0
+
+    def changed_pages(pages):
+        for page in pages:
+            reused = previous.get(page["page_sha256"])
+            pending.append((page["page_number"], page["page_sha256"], reused))
+            if reused is None:
+                yield page
+
+    def write_pages_before(page_number):
+        # Reused pages are written in place; changed pages reaching this point had no chunks
+        nonlocal num_rows
+        while pending and (page_number is None or pending[0][0] < page_number):
+            number, fingerprint, reused = pending.popleft()
+            records, embeddings = reused or ([], [])
+            page_index.append({"page_number": number, "sha256": fingerprint,
+                               "start": num_rows, "stop": num_rows + len(records)})
+            num_rows += len(records)
+            if records:
+                if report is not None:
+                    for record in records:
+                        report.add(record["chunk_token_count"])
+                yield [{**record, "page_number": number, "embedding": embedding}
+                       for record, embedding in zip(records, embeddings)]
+
     # Extract text from PDF
     raw_text = text_formatter(pdf_path)
 
-    # Preprocess and chunk text
-    preprocessed_text = open_and_read_pdf(raw_text)
-    processed_text = text_to_sentences(preprocessed_text)
-    chunks_list = process_sentence_chunks(processed_text, config["chunk_size"])
-    chunks = process_chunks(chunks_list)
-    
-    print(f"Total number of chunks: {len(chunks)}")
+    # Preprocess and chunk the pages that changed
+    pages = changed_pages(clock.wrap(iter_pdf_pages(raw_text, num_workers=config["ingestion_workers"]), "extraction"))
+    chunks = iter_page_chunks(pages, config, clock=clock)
+    if report is not None:
+        chunks = report.track(chunks)
 
-    # Creating embeddings on CPU
-    start_time = time.time()
-    embeddings = create_embeddings(chunks, embed_model)
-    print(f"Time taken to create embeddings: {time.time() - start_time:.2f} seconds")
-    
-    # Save embeddings for later use
-    save_embeddings(embeddings, 'data/embeddings.csv')
+    # Creating embeddings on CPU in length-bucketed batches
+    windows = clock.wrap(iter_embedded_chunks(chunks, embed_model.get(),
+                                              batch_size=config["embedding_batch_size"],
+                                              max_batch_tokens=config["embedding_max_batch_tokens"],
+                                              window_size=config["embedding_window_size"],
+                                              cache=embedding_cache), "embedding")
+
+    # Splice the new chunks between the reused pages, keeping page order
+    for window in windows:
+        batch = []
+        for chunk in window:
+            page_number = chunk["page_number"]
+            if pending and pending[0][0] < page_number:
+                if batch:
+                    yield batch
+                    batch = []
+                yield from write_pages_before(page_number)
+            if pending and pending[0][0] == page_number:
+                _, fingerprint, _ = pending.popleft()
+                page_index.append({"page_number": page_number, "sha256": fingerprint,
+                                   "start": num_rows, "stop": num_rows})
+            page_index[-1]["stop"] += 1
+            num_rows += 1
+            batch.append(chunk)
+        if batch:
+            yield batch
+    yield from write_pages_before(None)
+
+def process_pdf_and_create_embeddings(pdf_path, config, document_id=None):
+    """
+    This function processes the PDF, chunks the text, and creates embeddings.
+
+    The document is added to the corpus under `document_id` (derived from the file name by
+    default), replacing any previous version of the same document. If the same file was
+    already ingested with the same settings, processing is skipped entirely; if a revision
+    of it was, only its added or changed pages are processed and embedded.
+
+    Jobs ingesting the same document run one after the other, and the store of the previous
+    version is leased until the new one is committed, since its pages are read meanwhile.
+    """
+    document_id = document_id or document_id_from_filename(pdf_path)
+    with corpus.document_lock(document_id):
+        entries, lease = corpus.lease_documents([document_id])
+        with lease:
+            return ingest_document(pdf_path, config, document_id, entries.get(document_id))
+
+def ingest_document(pdf_path, config, document_id, entry):
+    """
+    Ingest a PDF as `document_id`, given the manifest entry of its previous version (or None).
+    """
+    # Whole-file fast path: an unchanged PDF keeps its existing store
+    file_hash = file_sha256(pdf_path)
+    signature = ingest_signature(config)
+    if entry and entry.get("file_sha256") == file_hash and entry.get("ingest_signature") == signature:
+        logger.info("%s is unchanged, skipping ingestion", os.path.basename(pdf_path))
+        metrics.inc("localrag_ingested_documents_total", outcome="unchanged")
+        return load_vector_store(os.path.join(corpus.corpus_dir, entry["store"]))
+
+    # Pages of the previous version, reused when a revision leaves them unchanged
+    previous = previous_page_chunks(entry, signature)
+    page_index = []
+
+    store_dir = corpus.new_store_dir(document_id)
+    start_time = time.perf_counter()
+    num_chunks = 0
+    cache_stats_before = embedding_cache.stats()
+    # Token counts are compared with the model's full window, which is where truncation happens
+    chunk_report = ChunkReport(chunk_token_budget(embed_model.get()))
+    # Time spent in each streaming stage, recorded as spans once the document is written
+    clock = StageClock()
+
+    # Save embeddings for later use, one window at a time
+    with VectorStoreWriter(store_dir, dtype=config["embedding_dtype"]) as writer:
+        for embedded_chunks in tqdm(iter_pdf_embeddings(pdf_path, config, report=chunk_report, previous=previous,
+                                                        page_index=page_index, clock=clock),
+                                    desc="Embedding chunk windows"):
+            with clock.measure("write"):
+                writer.append(embedded_chunks)
+            num_chunks += len(embedded_chunks)
+    clock.record("ingest")
+
+    # Build the configured ANN index once and persist it next to the embeddings
+    with span("ingest.index_build", backend=config["index_backend"], chunks=num_chunks):
+        chunks, embeddings = load_vector_store(store_dir)
+        save_index(build_index(embeddings, config), store_dir)
+    # The lexical index only depends on the chunk texts, so it is built whatever the retrieval mode
+    with span("ingest.lexical_index", chunks=num_chunks):
+        build_lexical_index(chunks, config).save(os.path.join(store_dir, LEXICAL_INDEX_FILENAME))
+    save_page_index(store_dir, page_index)
+    reused_pages = sum(1 for page in page_index if page["sha256"] in previous)
+
+    with span("ingest.commit"):
+        corpus.commit_document(document_id, store_dir, filename=os.path.basename(pdf_path),
+                               file_sha256=file_hash, ingest_signature=signature,
+                               chunk_report=chunk_report.summary(), num_pages=len(page_index),
+                               reused_pages=reused_pages)
+
+    metrics.inc("localrag_ingested_documents_total", outcome="revised" if previous else "new")
+    metrics.inc("localrag_ingested_pages_total", len(page_index) - reused_pages, reused="false")
+    metrics.inc("localrag_ingested_pages_total", reused_pages, reused="true")
+    metrics.inc("localrag_ingested_chunks_total", num_chunks)
+    metrics.inc("localrag_ingested_tokens_total", chunk_report.total_tokens)
+
+    elapsed = time.perf_counter() - start_time
+    logger.info("Total number of chunks: %d", num_chunks)
+    if previous:
+        logger.info("Revision: %d of %d pages changed and re-embedded, %d reused from the previous version",
+                    len(page_index) - reused_pages, len(page_index), reused_pages)
+    logger.info("Ingestion throughput: %.1f chunks/sec (%d chunks in %.2f seconds)",
+                num_chunks / max(elapsed, 1e-9), num_chunks, elapsed)
 
+    # Report how well chunks fit the embedding model's window
+    report = chunk_report.summary()
+    logger.info("Chunk tokens: %s of %s on average, %.0f%% truncated (%d tokens never embedded), %.0f%% under half full",
+                report["mean_tokens"], report["max_tokens"], report["truncated_rate"] * 100,
+                report["truncated_tokens"], report["underfilled_rate"] * 100)
+
+    # Report how many chunks were served from the embedding cache for this document
+    cache_stats = embedding_cache.stats()
+    hits = cache_stats["hits"] - cache_stats_before["hits"]
+    lookups = hits + cache_stats["misses"] - cache_stats_before["misses"]
+    logger.info("Embedding cache: %d/%d chunks reused (%.0f%% hit rate), %d entries cached",
+                hits, lookups, hits / max(lookups, 1) * 100, cache_stats["entries"])
+
+    # Hand back the saved store, memory-mapped rather than kept from the pipeline
     return chunks, embeddings
 
-def load_saved_embeddings(csv_path):
+def load_saved_embeddings(csv_path=None):
     """
-    Load pre-saved embeddings from a CSV file.
+    Load the embeddings of every document in the corpus, migrating a legacy CSV first if needed.
     """
-    return load_embeddings(csv_path)
+    if corpus.is_empty() and csv_path and os.path.exists(csv_path):
+        document_id = document_id_from_filename(csv_path)
+        store_dir = corpus.new_store_dir(document_id)
+        migrate_csv_to_vector_store(csv_path, store_dir, dtype=config["embedding_dtype"])
+        corpus.commit_document(document_id, store_dir, filename=os.path.basename(csv_path))
+    return corpus.load(index_config=config)
 
-def query_contract(query, tensor_embeddings, pages_and_chunks, n_resources_to_return=3):
+def retrieve_contract(query, tensor_embeddings, pages_and_chunks, n_resources_to_return=3, index=None,
+                      lexical_index=None, document_version=None):
     """
-    Process the query and retrieve answers based on embeddings.
+    Retrieve the top results of a query, without generating an answer.
+
+    With a lexical index (see `IndexSnapshot.lexical_scope`), dense and BM25 results are fused.
+    With `rerank` enabled, `rerank_candidates` results are over-fetched and re-ranked by the
+    cross-encoder; the reranked results are cached per question and `document_version`.
     """
+    # Never ask for more results than there are chunks
+    n_resources_to_return = min(n_resources_to_return, len(pages_and_chunks))
+
+    # A repeated question about the same documents reuses its reranked results
+    cache_key = None
+    if reranker is not None and document_version is not None:
+        cache_key = (normalize_query(query), document_version, n_resources_to_return)
+        cached = reranker.cached(cache_key)
+        if cached is not None:
+            return cached
+
+    # Over-fetch the candidates the cross-encoder chooses from
+    num_candidates = n_resources_to_return
+    if reranker is not None:
+        num_candidates = min(max(config["rerank_candidates"], n_resources_to_return), len(pages_and_chunks))
+
     # Retrieve and print top results
-    retrieved_data = print_top_results_and_scores(query=query,
-                                embeddings=tensor_embeddings,
-                                pages_and_chunks=pages_and_chunks,
-                                embed_model=embed_model,
-                                n_resources_to_return=n_resources_to_return)
+    with span("query.retrieve", k=n_resources_to_return, candidates=num_candidates):
+        results = print_top_results_and_scores(query=query,
+                                               embeddings=tensor_embeddings,
+                                               pages_and_chunks=pages_and_chunks,
+                                               embed_model=embed_model.get(),
+                                               n_resources_to_return=num_candidates,
+                                               index=index,
+                                               metric=config["similarity_metric"],
+                                               query_cache=query_embedding_cache,
+                                               lexical_index=lexical_index,
+                                               num_candidates=config["hybrid_candidates"],
+                                               rrf_k=config["rrf_k"])
+        if reranker is None:
+            return results
+        return reranker.rerank(query, results, n_resources_to_return, cache_key=cache_key)
+
+def query_contract(query, tensor_embeddings, pages_and_chunks, n_resources_to_return=3, index=None,
+                   lexical_index=None, document_version=None):
+    """
+    Process the query and retrieve answers based on embeddings.
+    """
+    retrieved_data = retrieve_contract(query, tensor_embeddings, pages_and_chunks,
+                                       n_resources_to_return=n_resources_to_return, index=index,
+                                       lexical_index=lexical_index, document_version=document_version)
     
     # Answer the query
-    answer = answer_query(query, retrieved_data, config)
+    with span("query.answer"):
+        answer = answer_query(query, retrieved_data, config)
 
     return answer
+
+async def query_contract_async(query, tensor_embeddings, pages_and_chunks, n_resources_to_return=3, index=None,
+                               lexical_index=None, document_version=None):
+    """
+    Process the query like `query_contract` without blocking the event loop: retrieval runs
+    on the CPU executor and the LLM is called through the async client.
+    """
+    retrieved_data = await run_in_cpu_executor(retrieve_contract, query, tensor_embeddings, pages_and_chunks,
+                                               n_resources_to_return=n_resources_to_return, index=index,
+                                               lexical_index=lexical_index, document_version=document_version)
+
+    # Answer the query
+    with span("query.answer"):
+        return await answer_query_async(query, retrieved_data, config)
+
+def retrieve_contract_batch(queries, tensor_embeddings, pages_and_chunks, n_resources_to_return=3, index=None,
+                            lexical_index=None):
+    """
+    Retrieve the top results of many queries at once, without generating answers.
+    """
+    # Never ask for more results than there are chunks
+    n_resources_to_return = min(n_resources_to_return, len(pages_and_chunks))
+
+    scores, indices = retrieve_relevant_resources_batch(queries=queries,
+                                                        embeddings=tensor_embeddings,
+                                                        model=embed_model.get(),
+                                                        n_resources_to_return=n_resources_to_return,
+                                                        metric=config["similarity_metric"],
+                                                        index=index,
+                                                        query_cache=query_embedding_cache,
+                                                        lexical_index=lexical_index,
+                                                        num_candidates=config["hybrid_candidates"],
+                                                        rrf_k=config["rrf_k"])
+
+    return [format_results(query_scores, query_indices, pages_and_chunks)
+            for query_scores, query_indices in zip(scores, indices)]
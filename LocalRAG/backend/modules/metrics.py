@@ -0,0 +1,337 @@
+# modules/metrics.py
+"""
+Lightweight instrumentation: counters and histograms rendered in the Prometheus text format,
+and request-scoped traces made of timed spans.
+
+    with trace("query", query=query):
+        with span("retrieval.search", chunks=len(index)):
+            ...
+
+Every span also feeds the `localrag_stage_duration_seconds` histogram. Traces are kept in
+memory for inspection and can additionally be exported through OpenTelemetry
+(see `configure_tracing`).
+"""
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Histogram buckets in seconds, from a cache hit to a slow LLM call or a large upload
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def format_labels(labels: dict) -> str:
+    """
+    Format labels as `{key="value",...}`, escaping values as the text format requires.
+    """
+    if not labels:
+        return ""
+    escaped = (key + '="' + str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') + '"'
+               for key, value in sorted(labels.items()))
+    return "{" + ",".join(escaped) + "}"
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and histograms, rendered in the Prometheus text exposition format.
+
+    Values that other objects already track (cache hit counters, index size) are exported
+    through collectors: callables returning `(name, kind, help, labels, value)` samples at
+    render time, so nothing is counted twice.
+    """
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help = {}  # metric name -> (kind, help text)
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts, sum, count]
+        self._collectors = []
+
+    def describe(self, name: str, kind: str, help_text: str):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            position = bisect.bisect_left(self.buckets, value)
+            if position < len(self.buckets):
+                histogram[0][position] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        Return every metric in the Prometheus text format (version 0.0.4).
+        """
+        samples = {}  # metric name -> list of lines
+
+        with self._lock:
+            counters = list(self._counters.items())
+            histograms = [(key, (list(buckets), total, count)) for key, (buckets, total, count) in self._histograms.items()]
+
+        for (name, labels), value in counters:
+            samples.setdefault(name, []).append(f"{name}{format_labels(dict(labels))} {value}")
+
+        for (name, labels), (buckets, total, count) in histograms:
+            labels = dict(labels)
+            lines = samples.setdefault(name, [])
+            cumulative = 0
+            for upper_bound, bucket_count in zip(self.buckets, buckets):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{format_labels({**labels, 'le': upper_bound})} {cumulative}")
+            lines.append(f"{name}_bucket{format_labels({**labels, 'le': '+Inf'})} {count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+
+        for collector in self._collectors:
+            for name, kind, help_text, labels, value in collector():
+                self._help.setdefault(name, (kind, help_text))
+                samples.setdefault(name, []).append(f"{name}{format_labels(labels)} {value}")
+
+        output = []
+        for name in sorted(samples):
+            kind, help_text = self._help.get(name, ("untyped", ""))
+            output.append(f"# HELP {name} {help_text}")
+            output.append(f"# TYPE {name} {kind}")
+            output.extend(samples[name])
+        return "\n".join(output) + "\n"
+
+
+# Process-wide registry served by /metrics
+metrics = MetricsRegistry()
+metrics.describe("localrag_stage_duration_seconds", "histogram", "Time spent in each pipeline stage.")
+
+
+class TraceStore:
+    """
+    The most recent finished traces, oldest evicted first.
+    """
+
+    def __init__(self, max_traces: int = 100):
+        self.max_traces = max_traces
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, trace: dict):
+        with self._lock:
+            self._traces[trace["trace_id"]] = trace
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+
+    def get(self, trace_id: str):
+        with self._lock:
+            return self._traces.get(trace_id)
+
+    def recent(self, limit: int = 20) -> list[dict]:
+        with self._lock:
+            return list(self._traces.values())[-limit:][::-1]
+
+
+traces = TraceStore()
+
+# Trace and span of the current request or job; copied into worker threads with the context
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# OpenTelemetry tracer, when an exporter is configured
+_otel_tracer = None
+
+
+def current_trace_id():
+    trace = _current_trace.get()
+    return trace["trace_id"] if trace else None
+
+
+@contextmanager
+def trace(name: str, **attributes):
+    """
+    Start a request- or job-scoped trace. Spans opened inside it, including on worker threads
+    that received a copy of the context, are recorded in it.
+    """
+    record = {"trace_id": uuid.uuid4().hex, "name": name, "start_time": time.time(),
+              "duration_ms": None, "status": "ok", "attributes": attributes, "spans": []}
+    trace_token = _current_trace.set(record)
+    span_token = _current_span.set(None)
+    start = time.perf_counter()
+    try:
+        with _otel_span(name, attributes):
+            yield record
+    except BaseException as error:
+        record["status"] = f"error: {type(error).__name__}"
+        raise
+    finally:
+        record["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        traces.add(record)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time one stage. The duration goes to the stage histogram and, inside a trace, into the trace.
+    Attributes can be added to the yielded dict before the span ends (e.g. result counts).
+    """
+    record = {"span_id": uuid.uuid4().hex[:16], "parent_id": _current_span.get(), "name": name,
+              "start_time": time.time(), "duration_ms": None, "attributes": attributes}
+    token = _current_span.set(record["span_id"])
+    start = time.perf_counter()
+    try:
+        with _otel_span(name, attributes):
+            yield attributes
+    except BaseException as error:
+        attributes["error"] = type(error).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        _current_span.reset(token)
+        _finish_span(record, seconds)
+
+
+def record_span(name: str, seconds: float, **attributes):
+    """
+    Record a stage whose time was measured elsewhere, e.g. accumulated across a streaming pipeline.
+    """
+    record = {"span_id": uuid.uuid4().hex[:16], "parent_id": _current_span.get(), "name": name,
+              "start_time": time.time() - seconds, "duration_ms": None, "attributes": attributes}
+    _finish_span(record, seconds)
+    if _otel_tracer is not None:
+        end_ns = time.time_ns()
+        otel_span = _otel_tracer.start_span(name, start_time=end_ns - int(seconds * 1e9), attributes=_otel_attributes(attributes))
+        otel_span.end(end_time=end_ns)
+
+
+def _finish_span(record, seconds):
+    record["duration_ms"] = round(seconds * 1000, 3)
+    metrics.observe("localrag_stage_duration_seconds", seconds, stage=record["name"])
+    trace = _current_trace.get()
+    if trace is not None:
+        trace["spans"].append(record)
+
+
+class StageClock:
+    """
+    Exclusive time spent in each stage of a chain of generators.
+
+    Each stage pulls from the one before it, so timing a stage's `next()` would include its
+    upstream stages too; the clock charges every moment to the innermost stage running.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.items = {}
+        self._stack = []
+        self._last = None
+
+    def _switch(self):
+        now = time.perf_counter()
+        if self._stack:
+            stage = self._stack[-1]
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + now - self._last
+        self._last = now
+
+    def wrap(self, iterable, stage: str):
+        """
+        Pass `iterable` through, charging the time spent producing each item to `stage`.
+        """
+        iterator = iter(iterable)
+        while True:
+            self._switch()
+            self._stack.append(stage)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._switch()
+                self._stack.pop()
+            self.items[stage] = self.items.get(stage, 0) + 1
+            yield item
+
+    @contextmanager
+    def measure(self, stage: str):
+        """
+        Charge the time spent in the block to `stage`, e.g. writing a window between two pulls.
+        """
+        self._switch()
+        self._stack.append(stage)
+        try:
+            yield
+        finally:
+            self._switch()
+            self._stack.pop()
+
+    def record(self, prefix: str):
+        """
+        Record every stage as a span named `<prefix>.<stage>`.
+        """
+        for stage, seconds in self.seconds.items():
+            record_span(f"{prefix}.{stage}", seconds, items=self.items.get(stage, 0), accumulated=True)
+
+
+def configure_tracing(config: dict):
+    """
+    Also export spans through OpenTelemetry when `config['otel_exporter']` is 'otlp' or 'console'.
+
+    The OTLP exporter sends to `config['otel_endpoint']` (or the OTEL_EXPORTER_OTLP_ENDPOINT
+    environment variable) over gRPC.
+    """
+    global _otel_tracer
+    traces.max_traces = config.get("trace_history", traces.max_traces)
+    exporter_name = config.get("otel_exporter")
+    if not exporter_name:
+        return
+
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    except ImportError as error:
+        raise ImportError("otel_exporter requires opentelemetry-sdk: pip install opentelemetry-sdk "
+                          "opentelemetry-exporter-otlp-proto-grpc") from error
+
+    if exporter_name == "otlp":
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter(endpoint=config.get("otel_endpoint"))
+    elif exporter_name == "console":
+        exporter = ConsoleSpanExporter()
+    else:
+        raise ValueError(f"Unknown otel_exporter '{exporter_name}'. Choose 'otlp' or 'console'.")
+
+    provider = TracerProvider(resource=Resource.create({"service.name": "localrag-backend"}))
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    _otel_tracer = provider.get_tracer("localrag")
+
+
+def _otel_attributes(attributes):
+    # OpenTelemetry only accepts primitive attribute values
+    return {key: value if isinstance(value, (str, bool, int, float)) else str(value)
+            for key, value in attributes.items() if value is not None}
+
+
+@contextmanager
+def _otel_span(name, attributes):
+    if _otel_tracer is None:
+        yield
+        return
+    with _otel_tracer.start_as_current_span(name) as otel_span:
+        try:
+            yield
+        finally:
+            # Attributes may have been added while the span was open
+            otel_span.set_attributes(_otel_attributes(attributes))
@@ -1,10 +1,29 @@
 import fitz
+import hashlib
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from tqdm.auto import tqdm
-from spacy.lang.en import English
+from modules.lazy import LazySingleton
 
-# Initialize the SpaCy NLP model and add the sentencizer to the pipeline
-nlp = English()
-nlp.add_pipe("sentencizer")
+
+def build_sentencizer():
+    """
+    Build the SpaCy pipeline splitting page text into sentences.
+    """
+    # Imported here: spaCy takes seconds to import and is only needed to ingest documents
+    from spacy.lang.en import English
+
+    # Initialize the SpaCy NLP model and add the sentencizer to the pipeline
+    nlp = English()
+    nlp.add_pipe("sentencizer")
+    return nlp
+
+
+# Built on the first ingestion, or by the warmup at startup
+sentencizer = LazySingleton("sentencizer", build_sentencizer)
 
 def text_formatter(text: str) -> str:
     """
@@ -22,59 +41,253 @@ def text_formatter(text: str) -> str:
 
 
 
-def open_and_read_pdf(pdf_path: str) -> list[dict]:
+def page_record(page_number: int, text: str) -> dict:
+    """
+    Builds the dictionary describing one page from its raw extracted text.
+
+    Args:
+        page_number (int): Zero-based page number.
+        text (str): Raw text extracted from the page.
+
+    Returns:
+        dict: Page number, text, a fingerprint of the text and character, word, sentence and token counts.
+    """
+    formatted_text = text_formatter(text)
+    return {
+        "page_number": page_number,
+        "page_sha256": hashlib.sha256(formatted_text.encode("utf-8")).hexdigest(),
+        "page_char_count": len(formatted_text),
+        "page_word_count": len(formatted_text.split(" ")),
+        "page_sentence_count_raw": len(formatted_text.split(". ")),
+        "page_token_count": len(formatted_text) // 4,
+        "text": formatted_text
+    }
+
+
+def read_page_range(pdf_path: str, start: int, stop: int) -> list[dict]:
+    """
+    Extracts the pages in [start, stop). Runs in a worker process, so it opens its own document.
+
+    Args:
+        pdf_path (str): The file path to the PDF document.
+        start (int): First page number to read.
+        stop (int): Page number to stop before.
+
+    Returns:
+        list[dict]: Page dictionaries for the range, in page order.
+    """
+    with fitz.open(pdf_path) as doc:
+        return [page_record(page_number, doc[page_number].get_text()) for page_number in range(start, stop)]
+
+
+def page_ranges(num_pages: int, num_shards: int) -> list[tuple[int, int]]:
+    """
+    Splits page numbers 0..num_pages into contiguous, near-equal (start, stop) ranges.
+    """
+    shard_size = -(-num_pages // max(num_shards, 1))  # Ceiling division
+    return [(start, min(start + shard_size, num_pages)) for start in range(0, num_pages, shard_size)]
+
+
+# Process pools of ingestion workers by size, started on first use and kept for later documents
+_worker_pools = {}
+_worker_pools_lock = threading.Lock()
+
+
+def worker_pool(num_workers: int) -> ProcessPoolExecutor:
+    """
+    The process pool shared by PDF extraction and sentence splitting.
+
+    Workers are spawned rather than forked: ingestion runs on a job thread of a multithreaded
+    server (uvicorn, torch), and a fork could copy locks held by other threads into the worker.
+    The pool outlives the document, so each worker imports PyMuPDF and builds its
+    sentencizer once rather than for every upload.
+    """
+    with _worker_pools_lock:
+        pool = _worker_pools.get(num_workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context("spawn"))
+            _worker_pools[num_workers] = pool
+        return pool
+
+
+def discard_worker_pool(pool: ProcessPoolExecutor):
+    """
+    Forget a pool that can no longer run tasks, so the next document starts a new one.
+    """
+    with _worker_pools_lock:
+        for num_workers, known in list(_worker_pools.items()):
+            if known is pool:
+                del _worker_pools[num_workers]
+    pool.shutdown(wait=False)
+
+
+def iter_pool_results(executor: ProcessPoolExecutor, function, tasks, max_in_flight: int):
+    """
+    Lazily runs `function(*task)` for each task on a process pool, yielding results in task order.
+
+    At most `max_in_flight` tasks are queued at once, so results do not pile up ahead of the consumer.
+    """
+    in_flight = deque()
+    try:
+        for task in tasks:
+            in_flight.append(executor.submit(function, *task))
+            if len(in_flight) >= max_in_flight:
+                # Waiting on the oldest future first preserves task order
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); the pool cannot be reused
+        discard_worker_pool(executor)
+        raise
+    finally:
+        # Drop queued work nobody will read, e.g. when the consumer stopped early
+        for future in in_flight:
+            future.cancel()
+
+
+def iter_pdf_pages(pdf_path: str, num_workers: int = 1):
+    """
+    Lazily extracts the pages of a PDF file, yielding one page dictionary at a time.
+
+    With more than one worker, page ranges are extracted in parallel by a process pool.
+    Only a bounded number of ranges is in flight at once, and ranges are yielded in page order.
+
+    Args:
+        pdf_path (str): The file path to the PDF document.
+        num_workers (int): Number of worker processes. 1 (default) reads serially.
+
+    Yields:
+        dict: Page number, text content and statistics of each page, in page order.
+    """
+    doc = fitz.open(pdf_path)  # Open the PDF document
+
+    if num_workers <= 1 or doc.page_count < 2:
+        try:
+            for page_number, page in enumerate(doc):
+                text = page.get_text()  # Extract text from the page
+                yield page_record(page_number, text)
+        finally:
+            doc.close()
+        return
+
+    num_pages = doc.page_count
+    doc.close()
+
+    # Several small shards per worker keep the pool busy when some pages are much heavier than others.
+    # Each worker reopens the document by path
+    ranges = [(pdf_path, start, stop) for start, stop in page_ranges(num_pages, num_workers * 4)]
+    # Keep at most two ranges per worker queued so extracted pages do not pile up
+    for pages in iter_pool_results(worker_pool(num_workers), read_page_range, ranges, max_in_flight=num_workers * 2):
+        yield from pages
+
+
+def open_and_read_pdf(pdf_path: str, num_workers: int = 1) -> list[dict]:
     """
     Opens a PDF file, extracts text content page by page, and collects statistics.
 
+    With more than one worker, page ranges are extracted in parallel by a process pool
+    and the results are concatenated back in page order.
+
     Args:
         pdf_path (str): The file path to the PDF document.
+        num_workers (int): Number of worker processes. 1 (default) reads serially.
 
     Returns:
         list[dict]: A list of dictionaries for each page with its text content and relevant statistics.
                     Includes page number, character count, word count, sentence count, and token count.
     """
-    doc = fitz.open(pdf_path)  # Open the PDF document
-    pages_and_texts = []
+    return list(tqdm(iter_pdf_pages(pdf_path, num_workers=num_workers), desc="Reading PDF pages"))
 
-    for page_number, page in tqdm(enumerate(doc), desc="Reading PDF pages"):  
-        text = page.get_text()  # Extract text from the page
-        formatted_text = text_formatter(text)
 
-        # Append page details including text and various counts
-        pages_and_texts.append({
-            "page_number": page_number,
-            "page_char_count": len(formatted_text),
-            "page_word_count": len(formatted_text.split(" ")),
-            "page_sentence_count_raw": len(formatted_text.split(". ")),
-            "page_token_count": len(formatted_text) // 4,
-            "text": formatted_text
-        })
+def split_sentences(texts: list[str], batch_size: int = 64) -> list[list[str]]:
+    """
+    Splits each text into sentences. In a worker process, the worker builds its own
+    sentencizer on first use.
 
-    return pages_and_texts
+    Args:
+        texts (list[str]): Page texts.
+        batch_size (int): Number of texts SpaCy processes per batch.
 
+    Returns:
+        list[list[str]]: The sentences of each text.
+    """
+    return [[str(sentence) for sentence in doc.sents] for doc in sentencizer.get().pipe(texts, batch_size=batch_size)]
 
 
+def iter_page_batches(pages_and_texts, batch_size: int):
+    """
+    Groups a stream of pages into lists of at most `batch_size` pages.
+    """
+    batch = []
+    for item in pages_and_texts:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 
-def text_to_sentences(pages_and_texts: list[dict]) -> list[dict]:
+def add_sentences(results):
+    """
+    Adds the sentences of each batch of pages to its page dictionaries and yields the pages.
+    """
+    for batch, batch_sentences in results:
+        for item, sentences in zip(batch, batch_sentences):
+            item["sentences"] = sentences
+
+            # Add the sentence count to the dictionary
+            item["page_sentence_count_spacy"] = len(sentences)
+            yield item
+
+
+def iter_sentences(pages_and_texts, batch_size: int = 64, n_process: int = 1):
+    """
+    Lazily splits the text of each page into sentences using the SpaCy NLP pipeline.
+
+    With more than one process, batches of pages are split in parallel by the worker pool
+    that extracts them (see `worker_pool`); SpaCy's own `n_process` would fork the server.
+
+    Args:
+        pages_and_texts (iterable of dict): Page dictionaries, each having a 'text' key.
+        batch_size (int): Number of pages SpaCy processes per batch.
+        n_process (int): Number of worker processes. 1 (default) splits in this process.
+
+    Yields:
+        dict: Each page dictionary, with 'sentences' and 'page_sentence_count_spacy' added, in input order.
+    """
+    batches = iter_page_batches(pages_and_texts, batch_size)
+
+    if n_process <= 1:
+        results = ((batch, split_sentences([item["text"] for item in batch], batch_size)) for batch in batches)
+        yield from add_sentences(results)
+        return
+
+    # Only the texts are sent to the workers; the page dictionaries stay here, queued with their batch
+    queued = deque()
+
+    def tasks():
+        for batch in batches:
+            queued.append(batch)
+            yield [item["text"] for item in batch], batch_size
+
+    results = iter_pool_results(worker_pool(n_process), split_sentences, tasks(), max_in_flight=n_process * 2)
+    yield from add_sentences((queued.popleft(), sentences) for sentences in results)
+
+
+def text_to_sentences(pages_and_texts: list[dict], batch_size: int = 64, n_process: int = 1) -> list[dict]:
     """
     Processes a list of dictionaries, each containing page text. Splits the text into sentences
     using the SpaCy NLP pipeline and counts the sentences.
 
     Args:
         pages_and_texts (list[dict]): A list of dictionaries, each having a 'text' key.
-    
+        batch_size (int): Number of pages SpaCy processes per batch.
+        n_process (int): Number of worker processes.
+
     Returns:
         list[dict]: The updated list of dictionaries, with sentences and SpaCy-based sentence counts added.
     """
-    for item in tqdm(pages_and_texts, desc="Processing text into sentences"):
-        # Use SpaCy's NLP pipeline to split the text into sentences
-        item["sentences"] = list(nlp(item["text"]).sents)
-
-        # Convert the sentences to strings
-        item["sentences"] = [str(sentence) for sentence in item["sentences"]]
-
-        # Add the sentence count to the dictionary
-        item["page_sentence_count_spacy"] = len(item["sentences"])
-
-    return pages_and_texts
+    return list(tqdm(iter_sentences(pages_and_texts, batch_size=batch_size, n_process=n_process),
+                     total=len(pages_and_texts), desc="Processing text into sentences"))
@@ -1,81 +1,227 @@
 # modules/query_processing.py
 
-import openai
-import os 
+from modules.llm_backends import LLMBackend, create_llm_backend
+from modules.metrics import metrics, span
+from modules.context_packing import build_context
 from modules.hallucination_mitigation import (
     generate_system_prompt,
-    extract_information_from_context
+    extract_information_from_context,
+    answer_from_entities
 )
 
-def answer_query(query, relevant_chunks, config):
+# Define functions for function calling
+FUNCTIONS = [
+    {
+        "name": "extract_effective_date",
+        "description": "Extract the effective date from the contract text",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "effective_date": {
+                    "type": "string",
+                    "description": "The effective date of the contract"
+                }
+            },
+            "required": ["effective_date"]
+        }
+    }
+]
+
+# Backend generating the answers, created from the config on first use
+_llm_backend = None
+
+metrics.describe("localrag_llm_requests_total", "counter", "LLM completions requested, by backend and mode.")
+metrics.describe("localrag_llm_function_calls_total", "counter", "Function calls requested by the LLM.")
+metrics.describe("localrag_entity_answers_total", "counter",
+                 "Function calls answered from indexed entities without the follow-up LLM request.")
+
+
+def get_llm_backend(config) -> LLMBackend:
+    """
+    Return the LLM backend selected by `config['llm_backend']`, creating it once.
+    """
+    global _llm_backend
+    if _llm_backend is None:
+        _llm_backend = create_llm_backend(config)
+    return _llm_backend
+
+
+def open_llm_session(config):
+    """
+    Open the resources the LLM backend shares between requests, such as a pooled HTTP session.
+    """
+    backend = get_llm_backend(config)
+    backend.open()
+    return backend
+
+
+async def close_llm_session():
+    """
+    Release the resources opened by `open_llm_session`.
+    """
+    if _llm_backend is not None:
+        await _llm_backend.close()
+
+
+def build_messages(query, relevant_chunks, config):
+    """
+    Build the chat messages holding the retrieved context and the user's question.
+
+    The context is packed under `config['context_max_tokens']`: best results first, without
+    the sentences chunks share through their overlap, scores or indexed entities.
     """
-    Answer the user's query using the language model and function calling.
-    """    
     # Hallucination Mitigation Technique 1: System prompt
-    system_prompt = generate_system_prompt()
-    
-    # User prompt including context and question
-    messages = [
-        {"role": "system", "content": "You are a helpful assistant that answers questions about legal contracts based on the provided context. Always strive for accuracy and only use information from the given context."},
-        {"role": "user", "content": f"Context: {relevant_chunks}\n\nQuestion: {query}"}
+    return [
+        {"role": "system", "content": generate_system_prompt()},
+        {"role": "user", "content": f"Context:\n{build_context(relevant_chunks, config)}\n\nQuestion: {query}"}
     ]
 
 
-    # Define functions for function calling
-    functions = [
-        {
-            "name": "extract_effective_date",
-            "description": "Extract the effective date from the contract text",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "effective_date": {
-                        "type": "string",
-                        "description": "The effective date of the contract"
-                    }
-                },
-                "required": ["effective_date"]
-            }
-        }
-    ]
-    
-    openai.api_key = os.getenv("OPENAI_API_KEY")
-    
-    # Initial API call
-    response = openai.ChatCompletion.create(
-        model=config['model'],
-        messages=messages,
-        functions=functions,
-        function_call="auto"  # Let the model decide
-    )
-    # print(response.choices[0].message.content)
-    message = response['choices'][0]['message']
-    # print(message)
-    
+def function_call_messages(message, messages, relevant_chunks, query):
+    """
+    Answer a function call requested by the model.
+
+    Returns:
+        list: The messages for the follow-up request, or None if the function is unknown.
+    """
+    function_call = message['function_call']
+    if function_call['name'] != 'extract_effective_date':
+        return None
+
+    # Hallucination Mitigation Technique 2: Function calling
+    effective_date = extract_information_from_context(relevant_chunks, query)
+    # Append function response to messages
+    return messages + [message, {
+        "role": "function",
+        "name": "extract_effective_date",
+        "content": effective_date
+    }]
+
+
+def entity_answer(message, query, relevant_chunks, config):
+    """
+    Answer the model's `extract_effective_date` call as the final answer, from the entities
+    indexed with the retrieved chunks, when `config['entity_answers']` is set and the question
+    asks only for the effective date. This spares the follow-up LLM request; any other question
+    gets the looked-up date as a function result and is answered by the model.
+
+    Returns:
+        str: The answer, or None if the model has to answer.
+    """
+    if not config.get("entity_answers") or message['function_call']['name'] != 'extract_effective_date':
+        return None
+    answer = answer_from_entities(relevant_chunks, query)
+    if answer is not None:
+        metrics.inc("localrag_entity_answers_total")
+    return answer
+
+
+def count_llm_request(backend, mode, message=None):
+    """
+    Count one LLM request, and the function call it returned if any.
+    """
+    metrics.inc("localrag_llm_requests_total", backend=backend.name, mode=mode)
+    if message is not None and message.get('function_call'):
+        metrics.inc("localrag_llm_function_calls_total", backend=backend.name,
+                    function=message['function_call']['name'])
+
+
+def answer_steps(query, relevant_chunks, config, backend, mode):
+    """
+    The steps of answering the user's query with function calling, shared by `answer_query`,
+    `answer_query_async` and `stream_answer_query`, which only differ in how they send each
+    LLM request.
+
+    Yields the messages and functions of each LLM request and is sent the model's reply
+    message in return.
+
+    Returns:
+        str: The answer, or None if the answer is the content of the model's last reply.
+    """
+    # System prompt and user prompt including context and question
+    messages = build_messages(query, relevant_chunks, config)
+
+    # Initial call, letting the model decide whether to call a function
+    message = yield messages, FUNCTIONS
+    count_llm_request(backend, mode, message)
+
     # Check if the model wants to call a function
-    if message.get('function_call'):
-        function_call = message['function_call']
-        if function_call['name'] == 'extract_effective_date':
-            # Hallucination Mitigation Technique 2: Function calling
-            effective_date = extract_information_from_context(relevant_chunks, query)
-            # Append function response to messages
-            messages.append(message)
-            messages.append({
-                "role": "function",
-                "name": "extract_effective_date",
-                "content": effective_date
-            })
-            # Final response
-            final_response = openai.ChatCompletion.create(
-                model=config['model'],
-                messages=messages
-            )
-            final_message = final_response['choices'][0]['message']
-            answer = final_message['content']
-        else:
-            answer = "The assistant tried to call an unknown function."
-    else:
+    if not message.get('function_call'):
         # Direct answer without function call
-        answer = message['content']
-    
-    return answer
+        return None
+
+    # Hallucination Mitigation Technique 3: Answers looked up in the indexed entities
+    answer = entity_answer(message, query, relevant_chunks, config)
+    if answer is not None:
+        return answer
+
+    messages = function_call_messages(message, messages, relevant_chunks, query)
+    if messages is None:
+        return "The assistant tried to call an unknown function."
+
+    # Final response
+    yield messages, None
+    count_llm_request(backend, mode)
+    return None
+
+
+def answer_query(query, relevant_chunks, config):
+    """
+    Answer the user's query using the language model and function calling.
+    """
+    backend = get_llm_backend(config)
+    steps = answer_steps(query, relevant_chunks, config, backend, "complete")
+    message = None
+    try:
+        messages, functions = next(steps)
+        while True:
+            with span("llm.complete", backend=backend.name, follow_up=functions is None):
+                message = backend.complete(messages, functions=functions)
+            messages, functions = steps.send(message)
+    except StopIteration as finished:
+        return finished.value if finished.value is not None else message['content']
+
+
+async def answer_query_async(query, relevant_chunks, config):
+    """
+    Answer the user's query like `answer_query`, without blocking the event loop.
+    """
+    backend = get_llm_backend(config)
+    steps = answer_steps(query, relevant_chunks, config, backend, "complete")
+    message = None
+    try:
+        messages, functions = next(steps)
+        while True:
+            with span("llm.complete", backend=backend.name, follow_up=functions is None):
+                message = await backend.acomplete(messages, functions=functions)
+            messages, functions = steps.send(message)
+    except StopIteration as finished:
+        return finished.value if finished.value is not None else message['content']
+
+
+async def stream_answer_query(query, relevant_chunks, config):
+    """
+    Answer the user's query like `answer_query_async`, yielding the answer text as it is generated.
+
+    If the model asks for a function call, the call is collected from the stream, answered
+    locally and the follow-up completion is streamed instead, unless the indexed entities
+    answer it (see `entity_answer`).
+    """
+    backend = get_llm_backend(config)
+    steps = answer_steps(query, relevant_chunks, config, backend, "stream")
+    try:
+        messages, functions = next(steps)
+        while True:
+            function_call = None
+            async for delta in backend.astream(messages, functions=functions):
+                if delta.get('function_call'):
+                    # Function call names and arguments arrive in fragments
+                    function_call = function_call or {"name": "", "arguments": ""}
+                    function_call["name"] += delta['function_call'].get('name') or ""
+                    function_call["arguments"] += delta['function_call'].get('arguments') or ""
+                elif delta.get('content'):
+                    yield delta['content']
+            messages, functions = steps.send({"role": "assistant", "content": None, "function_call": function_call})
+    except StopIteration as finished:
+        if finished.value is not None:
+            yield finished.value
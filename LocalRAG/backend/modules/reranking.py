@@ -0,0 +1,135 @@
+# modules/reranking.py
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from modules.query_cache import TTLCache
+from modules.lazy import LazySingleton
+from modules.metrics import metrics, span
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("localrag_rerank_total", "counter",
+                 "Re-ranking attempts by outcome (reranked, cached, timeout, busy or error).")
+
+
+def renumber_results(results: list[dict], scores: list[float] = None) -> dict:
+    """
+    Turn an ordered list of results back into the numbered dictionary of `format_results`,
+    optionally replacing their scores.
+    """
+    renumbered = {}
+    for rank, result in enumerate(results):
+        result = {**result, "result_number": rank}
+        if scores is not None:
+            result["score"] = f"Score: {scores[rank]:.4f}"
+        renumbered[rank] = result
+    return renumbered
+
+
+class Reranker:
+    """
+    Re-scores over-fetched retrieval candidates with a cross-encoder, which reads the query
+    and each chunk together and ranks more precisely than embedding similarity.
+
+    All candidates of a query are scored in one batched forward pass on a dedicated worker
+    thread. The caller waits at most `budget_seconds`; past that it keeps the candidates'
+    retrieval order, so a slow or cold model never stalls a request. A pass that finishes after
+    its deadline still fills the cache, so the next identical question gets the reranked order.
+    """
+
+    def __init__(self, model_name: str, device: str = "cpu", budget_seconds: float = 0.2, cache: TTLCache = None):
+        self.model_name = model_name
+        self.device = device
+        self.budget_seconds = budget_seconds
+        self.cache = cache
+        self._model = LazySingleton("reranker", self._load_model)
+        # One pass at a time: concurrent passes would only compete for the same CPU cores
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+
+    def _load_model(self):
+        # Imported here: sentence_transformers takes seconds to import
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(self.model_name, device=self.device)
+
+    @property
+    def loaded(self) -> bool:
+        return self._model.loaded
+
+    def model(self):
+        """
+        Return the cross-encoder, loading it on first use.
+        """
+        return self._model.get()
+
+    def score(self, query: str, texts: list[str]) -> list[float]:
+        """
+        Relevance score of each text for the query, in one batched forward pass.
+        """
+        with span("rerank.score", candidates=len(texts)):
+            scores = self.model().predict([(query, text) for text in texts],
+                                          batch_size=max(len(texts), 1), show_progress_bar=False)
+        return [float(score) for score in scores]
+
+    def cached(self, cache_key):
+        """
+        Return the cached reranked results of a key, or None.
+        """
+        if self.cache is None:
+            return None
+        results = self.cache.get(cache_key)
+        if results is not None:
+            metrics.inc("localrag_rerank_total", outcome="cached")
+        return results
+
+    def rerank(self, query: str, results: dict, k: int, cache_key=None) -> dict:
+        """
+        Keep the k best candidates by cross-encoder score, or the first k in retrieval order
+        if scoring does not finish within the latency budget.
+
+        Args:
+            query (str): The question.
+            results (dict): Over-fetched candidates as returned by `format_results`, best first.
+            k (int): Number of results to keep.
+            cache_key (optional): Key under which the reranked results are cached (see `cached`),
+                                  e.g. the normalized query and the version of the documents searched.
+
+        Returns:
+            dict: The k kept results, numbered like `format_results`.
+        """
+        candidates = list(results.values())
+        if len(candidates) <= 1:
+            return renumber_results(candidates[:k])
+
+        def reranked(scores):
+            order = sorted(range(len(candidates)), key=lambda position: -scores[position])[:k]
+            return renumber_results([candidates[position] for position in order],
+                                    [scores[position] for position in order])
+
+        def cache_result(future):
+            if cache_key is not None and self.cache is not None and not future.cancelled() and future.exception() is None:
+                self.cache.put(cache_key, reranked(future.result()))
+
+        # The pass runs in a copy of the caller's context, so its span joins the request's trace
+        context = contextvars.copy_context()
+        with span("retrieval.rerank", candidates=len(candidates), k=k) as attributes:
+            future = self._executor.submit(context.run, self.score, query,
+                                           [candidate["sentence_chunk"] for candidate in candidates])
+            future.add_done_callback(cache_result)
+            try:
+                scores = future.result(timeout=self.budget_seconds)
+            except FutureTimeoutError:
+                # A pass still queued behind an earlier one is dropped rather than run late
+                outcome = "busy" if future.cancel() else "timeout"
+                attributes["outcome"] = outcome
+                metrics.inc("localrag_rerank_total", outcome=outcome)
+                return renumber_results(candidates[:k])
+            except Exception as error:
+                # Retrieval still answers if the model cannot be loaded or fails
+                logger.warning("Re-ranking failed, keeping retrieval order: %s: %s", type(error).__name__, error)
+                attributes["outcome"] = "error"
+                metrics.inc("localrag_rerank_total", outcome="error")
+                return renumber_results(candidates[:k])
+            attributes["outcome"] = "reranked"
+
+        metrics.inc("localrag_rerank_total", outcome="reranked")
+        return reranked(scores)
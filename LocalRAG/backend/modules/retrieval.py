@@ -1,60 +1,273 @@
 import torch
-from sentence_transformers import SentenceTransformer, util
-from timeit import default_timer as timer
-from modules.utils import cosine_similarity_tensor
+import logging
+from typing import TYPE_CHECKING
+from modules.vector_index import VectorIndex, ExactIndex
+from modules.lexical_index import BM25Index
+from modules.query_cache import TTLCache
+from modules.metrics import span
+
+logger = logging.getLogger(__name__)
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+# Embeddings are stored L2-normalized, so every metric derives from one inner-product pass:
+# cosine and dot product are the inner product itself, and Euclidean distance between unit
+# vectors is sqrt(2 - 2 * cosine), which ranks results in the same order.
+SIMILARITY_METRICS = ("cosine", "dot", "euclidean")
+
+
+def convert_scores(inner_products: torch.Tensor, metric: str) -> torch.Tensor:
+    """
+    Converts inner products between unit vectors into scores of the requested metric.
+
+    Args:
+    - inner_products: Inner products returned by the index search.
+    - metric: One of 'cosine', 'dot' or 'euclidean'.
+
+    Returns:
+    - Scores where higher is better ('euclidean' is the negative distance, like util.euclidean_sim).
+    """
+    if metric in ("cosine", "dot"):
+        return inner_products
+    if metric == "euclidean":
+        return -torch.sqrt(torch.clamp(2 - 2 * inner_products, min=0))
+    raise ValueError(f"Unknown similarity metric '{metric}'. Choose from {SIMILARITY_METRICS}.")
+
+
+def reciprocal_rank_fusion(rankings: list, k: int, rrf_k: int = 60):
+    """
+    Fuses several rankings of the same items with reciprocal rank fusion: each item scores
+    the sum of 1 / (rrf_k + rank) over the rankings it appears in, with ranks starting at 1.
+
+    Only ranks are used, so scores on different scales (BM25 and cosine) combine without tuning.
+
+    Args:
+    - rankings: Sequences of item indices, best first.
+    - k: Number of fused results to return.
+    - rrf_k: Damping constant; larger values flatten the advantage of top ranks.
+
+    Returns:
+    - scores, indices: Tensors of the k best fused scores and their item indices.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            fused[item] = fused.get(item, 0.0) + 1.0 / (rrf_k + rank)
+
+    best = sorted(fused.items(), key=lambda pair: -pair[1])[:k]
+    return (torch.tensor([score for _, score in best], dtype=torch.float32),
+            torch.tensor([item for item, _ in best], dtype=torch.long))
+
+
+def hybrid_search(query: str, dense_indices: torch.Tensor, lexical_index: BM25Index,
+                  k: int, num_candidates: int, rrf_k: int = 60):
+    """
+    Fuses the dense candidates of one query with its BM25 candidates before the top-k cut.
+
+    Args:
+    - query: The search query.
+    - dense_indices: Dense candidate indices of the query, best first.
+    - lexical_index: BM25 index over the same rows.
+    - k: Number of results to return.
+    - num_candidates: Number of lexical candidates fused with the dense ones.
+    - rrf_k: Reciprocal rank fusion constant.
+
+    Returns:
+    - scores, indices: Fused scores and indices of the k best results.
+    """
+    with span("retrieval.lexical_search", chunks=len(lexical_index), k=num_candidates) as attributes:
+        _, lexical_indices = lexical_index.search(query, num_candidates)
+        attributes["matches"] = len(lexical_indices)
+    # ANN indexes pad with -1 when they find fewer results than requested
+    dense_ranking = [index for index in dense_indices.tolist() if index >= 0]
+    return reciprocal_rank_fusion([dense_ranking, lexical_indices.tolist()], k, rrf_k=rrf_k)
+
+
+def encode_queries(queries: list[str], model: "SentenceTransformer", query_cache: TTLCache = None) -> torch.Tensor:
+    """
+    Embeds queries normalized like the stored embeddings, reusing cached query embeddings.
+
+    Args:
+    - queries: The search queries.
+    - model: The SentenceTransformer model to embed the queries.
+    - query_cache: Optional cache of query embeddings keyed by whitespace-normalized query text.
+
+    Returns:
+    - A tensor of shape (len(queries), dim).
+    """
+    if query_cache is None:
+        return model.encode(queries, convert_to_tensor=True, normalize_embeddings=True)
+
+    # Look up every query first, then embed only the misses in one forward pass
+    keys = [" ".join(query.split()) for query in queries]
+    cached = [query_cache.get(key) for key in keys]
+    missing = [position for position, embedding in enumerate(cached) if embedding is None]
+    if missing:
+        new_embeddings = model.encode([queries[position] for position in missing],
+                                      convert_to_tensor=True, normalize_embeddings=True)
+        for position, embedding in zip(missing, new_embeddings):
+            cached[position] = embedding
+            query_cache.put(keys[position], embedding)
+
+    return torch.stack(cached)
+
 
 def retrieve_relevant_resources(query: str,
                                 embeddings: torch.tensor,
-                                model: SentenceTransformer,
+                                model: "SentenceTransformer",
                                 n_resources_to_return: int = 5,
-                                print_time: bool = True):
+                                metric: str = "cosine",
+                                index: VectorIndex = None,
+                                query_cache: TTLCache = None,
+                                lexical_index: BM25Index = None,
+                                num_candidates: int = 50,
+                                rrf_k: int = 60):
     """
-    Embeds a query using the model and retrieves the top-k relevant embeddings based on
-    dot product, cosine similarity, and Euclidean distance.
+    Embeds a query using the model and retrieves the top-k relevant embeddings for one
+    similarity metric, with a single similarity pass and a single partial top-k.
+
+    With a lexical index, retrieval is hybrid: the best `num_candidates` dense results and
+    the best `num_candidates` BM25 results are fused with reciprocal rank fusion before the
+    top-k cut, so chunks quoting exact terms (party names, clause numbers) are not missed.
 
     Args:
     - query: The search query from the user.
-    - embeddings: The pre-saved embeddings of the document.
+    - embeddings: The pre-saved, L2-normalized embeddings of the document.
     - model: The SentenceTransformer model to embed the query.
     - n_resources_to_return: Number of top results to return.
-    - print_time: Whether to print the time taken for computation.
+    - metric: Similarity metric, 'cosine' (default), 'dot' or 'euclidean'.
+    - index: Optional vector index (exact or ANN) over the embeddings. Defaults to exact search.
+    - query_cache: Optional cache of query embeddings, so repeated questions skip the model.
+    - lexical_index: Optional BM25 index over the same rows, enabling hybrid retrieval.
+    - num_candidates: Number of candidates taken from each retriever in hybrid retrieval.
+    - rrf_k: Reciprocal rank fusion constant of hybrid retrieval.
 
     Returns:
-    - scores, indices: Top-k dot product scores and their indices.
-    - scores_cos, indices_cos: Top-k cosine similarity scores and their indices.
-    - scores_e, indices_e: Top-k Euclidean similarity scores and their indices.
+    - scores, indices: Top-k scores of the requested metric and their indices
+      (reciprocal rank fusion scores in hybrid retrieval).
+    """
+    if metric not in SIMILARITY_METRICS:
+        raise ValueError(f"Unknown similarity metric '{metric}'. Choose from {SIMILARITY_METRICS}.")
+
+    # Embed the query using the SentenceTransformer model, normalized like the stored embeddings
+    with span("retrieval.embed_query", queries=1):
+        query_embedding = encode_queries([query], model, query_cache=query_cache)
+
+    # One inner-product pass and one partial top-k, timed by the 'retrieval.search' span
+    if index is None:
+        index = ExactIndex(embeddings)
+    depth = max(num_candidates, n_resources_to_return) if lexical_index is not None else n_resources_to_return
+    with span("retrieval.search", chunks=len(index), k=depth):
+        scores, indices = index.search(query_embedding, depth)
+    if lexical_index is not None:
+        scores, indices = hybrid_search(query, indices[0], lexical_index, n_resources_to_return,
+                                        num_candidates, rrf_k=rrf_k)
+    else:
+        scores, indices = convert_scores(scores[0], metric), indices[0]
+    return scores, indices
+
+
+def retrieve_relevant_resources_batch(queries: list[str],
+                                      embeddings: torch.tensor,
+                                      model: "SentenceTransformer",
+                                      n_resources_to_return: int = 5,
+                                      metric: str = "cosine",
+                                      index: VectorIndex = None,
+                                      query_cache: TTLCache = None,
+                                      lexical_index: BM25Index = None,
+                                      num_candidates: int = 50,
+                                      rrf_k: int = 60):
     """
+    Embeds many queries in one model call and scores them all with a single
+    matrix-matrix product, returning the top-k results of each query.
+
+    With a lexical index, each query's dense and BM25 candidates are fused like in
+    `retrieve_relevant_resources`.
+
+    Args:
+    - queries: The search queries.
+    - embeddings: The pre-saved, L2-normalized embeddings of the document.
+    - model: The SentenceTransformer model to embed the queries.
+    - n_resources_to_return: Number of top results to return per query.
+    - metric: Similarity metric, 'cosine' (default), 'dot' or 'euclidean'.
+    - index: Optional vector index (exact or ANN) over the embeddings. Defaults to exact search.
+    - query_cache: Optional cache of query embeddings; only uncached queries are embedded.
+    - lexical_index: Optional BM25 index over the same rows, enabling hybrid retrieval.
+    - num_candidates: Number of candidates taken from each retriever in hybrid retrieval.
+    - rrf_k: Reciprocal rank fusion constant of hybrid retrieval.
 
-    # Embed the query using the SentenceTransformer model
-    query_embedding = model.encode(query, convert_to_tensor=True)
+    Returns:
+    - scores, indices: One row of top-k results per query; tensors of shape (len(queries), k),
+      or lists of per-query tensors in hybrid retrieval, where queries can get fewer results.
+    """
+    if metric not in SIMILARITY_METRICS:
+        raise ValueError(f"Unknown similarity metric '{metric}'. Choose from {SIMILARITY_METRICS}.")
 
-    # Calculate similarity scores using dot product, cosine similarity, and Euclidean similarity
-    start_time = timer()
-    dot_scores = util.dot_score(query_embedding, embeddings)[0]
-    cos_score = util.cos_sim(query_embedding, embeddings)[0]
-    euc_score = util.euclidean_sim(query_embedding, embeddings)[0]
-    end_time = timer()
+    # Embed all uncached queries in one forward pass
+    with span("retrieval.embed_query", queries=len(queries)):
+        query_embeddings = encode_queries(queries, model, query_cache=query_cache)
 
-    # Optionally print time taken to calculate the scores
-    if print_time:
-        print(f"[INFO] Time taken to get scores on {len(embeddings)} embeddings: {end_time - start_time:.5f} seconds.")
+    # One (queries x chunks) product and one row-wise partial top-k, timed by the 'retrieval.search' span
+    if index is None:
+        index = ExactIndex(embeddings)
+    depth = max(num_candidates, n_resources_to_return) if lexical_index is not None else n_resources_to_return
+    with span("retrieval.search", chunks=len(index), k=depth, queries=len(queries)):
+        scores, indices = index.search(query_embeddings, depth)
+    if lexical_index is not None:
+        fused = [hybrid_search(query, query_indices, lexical_index, n_resources_to_return, num_candidates, rrf_k=rrf_k)
+                 for query, query_indices in zip(queries, indices)]
+        scores, indices = [query_scores for query_scores, _ in fused], [query_indices for _, query_indices in fused]
+    else:
+        scores = convert_scores(scores, metric)
+    return scores, indices
 
-    # Get the top-k results for each similarity measure
-    scores, indices = torch.topk(input=dot_scores, k=n_resources_to_return)
-    scores_cos, indices_cos = torch.topk(input=cos_score, k=n_resources_to_return)
-    scores_e, indices_e = torch.topk(input=euc_score, k=n_resources_to_return)
 
-    return scores, indices, scores_cos, indices_cos, scores_e, indices_e
+def format_results(scores: torch.Tensor, indices: torch.Tensor, pages_and_chunks: list[dict]) -> dict:
+    """
+    Turns the top-k scores and indices of one query into the result dictionary sent to the LLM.
+
+    Args:
+    - scores: Top-k scores of the query.
+    - indices: Top-k chunk indices of the query.
+    - pages_and_chunks: List of dictionaries containing the document's sentence chunks and page numbers.
+
+    Returns:
+    - result: A dictionary containing the top results, with sentence chunks and page numbers.
+    """
+    result = {}  # Initialize the result dictionary to store the top results
+
+    for i, (score, chunk_index) in enumerate(zip(scores.tolist(), indices.tolist())):
+        # ANN indexes pad with -1 when they find fewer results than requested
+        if chunk_index < 0:
+            break
+
+        # Add each result to the result dictionary
+        result[i] = {
+            "result_number": i,  # The rank of the result
+            "score": f"Score: {score:.4f}",  # Score rounded to 4 decimal places
+            "sentence_chunk": pages_and_chunks[chunk_index]["sentence_chunk"],  # The relevant sentence chunk
+            "page_number": f"Page number: {pages_and_chunks[chunk_index]['page_number']}",  # The corresponding page number
+            "entities": pages_and_chunks[chunk_index].get("entities")  # Entities extracted at ingestion, if stored
+        }
+
+    return result
 
 
 def print_top_results_and_scores(query: str,
                                  embeddings: torch.tensor,
                                  pages_and_chunks: list[dict],
-                                 embed_model: SentenceTransformer,
-                                 n_resources_to_return: int = 3):
+                                 embed_model: "SentenceTransformer",
+                                 n_resources_to_return: int = 3,
+                                 index: VectorIndex = None,
+                                 metric: str = "cosine",
+                                 query_cache: TTLCache = None,
+                                 lexical_index: BM25Index = None,
+                                 num_candidates: int = 50,
+                                 rrf_k: int = 60):
     """
-    Takes a query, retrieves the most relevant resources, and prints out the top results 
-    based on dot product similarity, along with the relevant sentence chunks.
+    Takes a query, retrieves the most relevant resources, and logs which similarity the top results
+    were ranked by, returning them along with the relevant sentence chunks.
 
     Args:
     - query: The search query from the user.
@@ -62,31 +275,32 @@ def print_top_results_and_scores(query: str,
     - pages_and_chunks: List of dictionaries containing the document's sentence chunks and page numbers.
     - embed_model: The SentenceTransformer model to embed the query.
     - n_resources_to_return: Number of top results to return.
+    - index: Optional vector index (exact or ANN) over the embeddings to search instead of brute force.
+    - metric: Similarity metric used to rank results, 'cosine' (default), 'dot' or 'euclidean'.
+    - query_cache: Optional cache of query embeddings.
+    - lexical_index: Optional BM25 index over the same rows, enabling hybrid retrieval.
+    - num_candidates: Number of candidates taken from each retriever in hybrid retrieval.
+    - rrf_k: Reciprocal rank fusion constant of hybrid retrieval.
     
     Returns:
     - result: A dictionary containing the top results, with sentence chunks and page numbers.
     """
 
-    # Retrieve the top scores and indices for dot product, cosine, and Euclidean similarity
-    scores, indices, scores_cos, indices_cos, scores_e, indices_e = retrieve_relevant_resources(
+    # Retrieve the top scores and indices for the requested similarity metric
+    scores, indices = retrieve_relevant_resources(
         query=query,
         embeddings=embeddings,
         model=embed_model,
-        n_resources_to_return=n_resources_to_return
+        n_resources_to_return=n_resources_to_return,
+        metric=metric,
+        index=index,
+        query_cache=query_cache,
+        lexical_index=lexical_index,
+        num_candidates=num_candidates,
+        rrf_k=rrf_k
     )
     
-    result = {}  # Initialize the result dictionary to store the top results
-
-    print("Results of Dot product:")
-    # Loop through the top-k dot product results
-    for i, (score, index) in enumerate(zip(scores, indices)):
-        # Add each result to the result dictionary
-        result[i] = {
-            "result_number": i,  # The rank of the result
-            "score": f"Score: {score:.4f}",  # Score rounded to 4 decimal places
-            "sentence_chunk": pages_and_chunks[index]["sentence_chunk"],  # The relevant sentence chunk
-            "page_number": f"Page number: {pages_and_chunks[index]['page_number']}"  # The corresponding page number
-        }
+    logger.info("Results of %s similarity%s", metric, " fused with BM25" if lexical_index is not None else "")
 
     # Return the result dictionary, which contains the top sentence chunks and scores
-    return result
+    return format_results(scores, indices, pages_and_chunks)
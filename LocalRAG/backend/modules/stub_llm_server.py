@@ -0,0 +1,57 @@
+# modules/stub_llm_server.py
+"""
+Minimal OpenAI-compatible chat completions server for local testing without an API key.
+
+It serves the answers of `StubBackend`: the model repeats the question and the first page
+number in the context, word by word when streaming. Questions mentioning a date trigger the
+`extract_effective_date` function call, like the real model usually does.
+
+    python -m modules.stub_llm_server [port] [token_delay_seconds]
+
+then set `llm_api_base: 'http://127.0.0.1:<port>/v1'` in config.yaml.
+"""
+import sys
+import json
+import time
+import asyncio
+from aiohttp import web
+from modules.llm_backends import StubBackend, message_deltas
+
+stub = StubBackend()
+
+
+async def chat_completions(request: web.Request) -> web.StreamResponse:
+    body = await request.json()
+    reply = stub.complete(body["messages"], body.get("functions"))
+    created = int(time.time())
+
+    if not body.get("stream"):
+        return web.json_response({
+            "id": "stub", "object": "chat.completion", "created": created, "model": body["model"],
+            "choices": [{"index": 0, "message": reply,
+                         "finish_reason": "function_call" if reply.get("function_call") else "stop"}]
+        })
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    for delta in [{"role": "assistant"}] + message_deltas(reply):
+        chunk = {"id": "stub", "object": "chat.completion.chunk", "created": created, "model": body["model"],
+                 "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        await asyncio.sleep(request.app["token_delay"])
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+def create_app(token_delay: float = 0.0) -> web.Application:
+    app = web.Application()
+    app["token_delay"] = token_delay
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8001
+    token_delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+    web.run_app(create_app(token_delay), host="127.0.0.1", port=port)
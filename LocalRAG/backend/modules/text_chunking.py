@@ -1,26 +1,51 @@
 from tqdm.auto import tqdm
 import re
 
-def split_list(input_list: list, slice_size: int) -> list[list[str]]:
+def split_list(input_list: list, slice_size: int, overlap: int = 2) -> list[list[str]]:
     """
-    Splits the input list into sublists of size slice_size (or as close as possible).
+    Splits the input list into sublists of size slice_size, each extended by `overlap` items
+    of the next sublist.
 
     Args:
         input_list (list): The list of sentences to be split.
-        slice_size (int): The size of each chunk.
+        slice_size (int): The number of new sentences in each chunk.
+        overlap (int): The number of sentences each chunk shares with the next one.
 
     Returns:
         list[list[str]]: A list of sublists, where each sublist contains a chunk of sentences.
     
     Example:
-        A list of 17 sentences would be split into two sublists: [[10 sentences], [7 sentences]].
+        With slice_size=10 and overlap=2, a list of 17 sentences would be split into two
+        sublists: [[sentences 0-11], [sentences 10-16]]. A trailing slice that would only
+        repeat the overlap of the previous one is not emitted.
     """
-    return [input_list[i:i + slice_size + 2 ] for i in range(0, len(input_list), slice_size)]
+    # Stop once a slice reaches the end, so the tail is never emitted twice
+    stop = max(len(input_list) - overlap, 1) if input_list else 0
+    return [input_list[i:i + slice_size + overlap] for i in range(0, stop, slice_size)]
 
 
+def iter_sentence_chunks(pages_and_texts, chunk_size: int, overlap: int = 2):
+    """
+    Lazily splits the sentences of each page into chunks of a given size.
+
+    Args:
+        pages_and_texts (iterable of dict): Page dictionaries, each with a 'sentences' key.
+        chunk_size (int): The number of sentences per chunk.
+        overlap (int): The number of sentences each chunk shares with the next one.
+
+    Yields:
+        dict: Each page dictionary with 'sentence_chunks' and 'num_chunks' keys added.
+    """
+    for item in pages_and_texts:
+        # Split sentences into chunks
+        item["sentence_chunks"] = split_list(input_list=item["sentences"], slice_size=chunk_size, overlap=overlap)
 
+        # Store the number of chunks
+        item["num_chunks"] = len(item["sentence_chunks"])
+        yield item
 
-def process_sentence_chunks(pages_and_texts: list[dict], chunk_size: int) -> list[dict]:
+
+def process_sentence_chunks(pages_and_texts: list[dict], chunk_size: int, overlap: int = 2) -> list[dict]:
     """
     Processes the text on each page by splitting sentences into chunks of a given size.
 
@@ -28,20 +53,19 @@ def process_sentence_chunks(pages_and_texts: list[dict], chunk_size: int) -> lis
         pages_and_texts (list[dict]): A list of dictionaries, where each dictionary contains 
                                       a 'sentences' key with the list of sentences for that page.
         chunk_size (int): The number of sentences per chunk. Default is 10.
+        overlap (int): The number of sentences each chunk shares with the next one.
 
     Returns:
         list[dict]: The updated list of dictionaries with 'sentence_chunks' and 'num_chunks' keys added.
     """
-    for item in tqdm(pages_and_texts, desc="Splitting sentences into chunks"):
-        # Split sentences into chunks
-        item["sentence_chunks"] = split_list(input_list=item["sentences"], slice_size=chunk_size)
-        
-        # Store the number of chunks
-        item["num_chunks"] = len(item["sentence_chunks"])
+    return list(tqdm(iter_sentence_chunks(pages_and_texts, chunk_size, overlap),
+                     total=len(pages_and_texts), desc="Splitting sentences into chunks"))
+
 
-    return pages_and_texts
 
 
+# A full stop directly followed by a capital letter, i.e. a missing space between sentences
+MISSING_SPACE_PATTERN = re.compile(r'\.([A-Z])')
 
 
 def join_and_clean_chunk(sentence_chunk: list[str]) -> str:
@@ -58,35 +82,257 @@ def join_and_clean_chunk(sentence_chunk: list[str]) -> str:
     joined_sentence_chunk = " ".join(sentence_chunk).replace("  ", " ").strip()
     
     # Add a space after full stops if followed by a capital letter
-    cleaned_chunk = re.sub(r'\.([A-Z])', r'. \1', joined_sentence_chunk)
+    cleaned_chunk = MISSING_SPACE_PATTERN.sub(r'. \1', joined_sentence_chunk)
     
     return cleaned_chunk
 
 
+class Chunk:
+    """
+    A chunk of text with its page number and statistics.
+
+    Instances use `__slots__`, so a document's chunks carry no per-instance dictionary.
+    Fields can also be read and set by key (`chunk["sentence_chunk"]`), like the chunk
+    dictionaries the embedding and storage steps were written against.
+    """
+    __slots__ = ("page_number", "sentence_chunk", "chunk_char_count", "chunk_word_count",
+                 "chunk_token_count", "entities", "embedding")
+
+    # Fields written to the vector store metadata, in order
+    RECORD_FIELDS = __slots__[:-1]
+
+    def __init__(self, page_number: int, sentence_chunk: str, token_count: int = None):
+        self.page_number = page_number
+        self.sentence_chunk = sentence_chunk
+        self.chunk_char_count = len(sentence_chunk)
+        self.chunk_word_count = sentence_chunk.count(" ") + 1  # Same as len(sentence_chunk.split(" "))
+        # Tokens counted by the embedding model's tokenizer, or approximated without one
+        self.chunk_token_count = token_count if token_count is not None else self.chunk_char_count / 4
+        # Dates, parties, amounts and clauses, set by `entities.annotate_entities` at ingestion
+        self.entities = None
+        self.embedding = None
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value):
+        try:
+            setattr(self, key, value)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __repr__(self):
+        return f"Chunk(page_number={self.page_number!r}, sentence_chunk={self.sentence_chunk[:40]!r}...)"
+
+    def to_record(self) -> dict:
+        """
+        Return the chunk's metadata as a dictionary, without the embedding.
+        """
+        return {field: getattr(self, field) for field in self.RECORD_FIELDS}
+
+
+def count_tokens(texts: list[str], tokenizer) -> list[int]:
+    """
+    Counts the tokens of each text in one batched tokenizer call, without special tokens
+    and without truncation.
+
+    Args:
+        texts (list[str]): The texts to measure.
+        tokenizer: A Hugging Face tokenizer, usually the embedding model's.
+
+    Returns:
+        list[int]: Token count of each text.
+    """
+    if not texts:
+        return []
+    encoded = tokenizer(texts, add_special_tokens=False, verbose=False)
+    return [len(input_ids) for input_ids in encoded["input_ids"]]
+
+
+def iter_chunks(pages_and_texts, tokenizer=None):
+    """
+    Lazily turns the sentence chunks of each page into chunk records with statistics.
+
+    Each chunk is joined and cleaned exactly once; its statistics are derived from that string.
+
+    Args:
+        pages_and_texts (iterable of dict): Page dictionaries, each with 'sentence_chunks'.
+        tokenizer (optional): Tokenizer used to count the tokens of each page's chunks in one
+                              batch. Without it, token counts are approximated from the length.
+
+    Yields:
+        Chunk: Page number, sentence chunk, character count, word count and token count of each chunk.
+    """
+    for item in pages_and_texts:
+        page_number = item["page_number"]
+        texts = [join_and_clean_chunk(sentence_chunk) for sentence_chunk in item["sentence_chunks"]]
+        token_counts = count_tokens(texts, tokenizer) if tokenizer is not None else [None] * len(texts)
+        for text, token_count in zip(texts, token_counts):
+            yield Chunk(page_number, text, token_count)
+
+
+def split_long_sentence(sentence: str, token_count: int, tokenizer, max_tokens: int) -> list[tuple[str, int]]:
+    """
+    Splits a sentence longer than `max_tokens` at token boundaries, so none of it is truncated.
+
+    Args:
+        sentence (str): The cleaned sentence.
+        token_count (int): Its token count.
+        tokenizer: A fast Hugging Face tokenizer; slow tokenizers cannot map tokens back to text,
+                   so the sentence is then kept whole.
+        max_tokens (int): The token budget of a chunk.
+
+    Returns:
+        list[tuple[str, int]]: The pieces of the sentence and their token counts.
+    """
+    if token_count <= max_tokens or not getattr(tokenizer, "is_fast", False):
+        return [(sentence, token_count)]
+
+    offsets = tokenizer(sentence, add_special_tokens=False, return_offsets_mapping=True,
+                        verbose=False)["offset_mapping"]
+    pieces = []
+    for start in range(0, len(offsets), max_tokens):
+        window = offsets[start:start + max_tokens]
+        pieces.append((sentence[window[0][0]:window[-1][1]], len(window)))
+    return pieces
+
+
+def pack_sentences(sentences: list[tuple[str, int]], max_tokens: int, overlap_tokens: int) -> list[list[tuple[str, int]]]:
+    """
+    Greedily packs consecutive sentences into chunks of at most `max_tokens` tokens.
+
+    Each chunk starts with the trailing sentences of the previous one, up to `overlap_tokens`
+    tokens, so a clause cut at a chunk boundary still appears whole in one chunk.
+
+    Args:
+        sentences (list[tuple[str, int]]): Sentences and their token counts, none above `max_tokens`.
+        max_tokens (int): The token budget of a chunk.
+        overlap_tokens (int): The maximum number of tokens a chunk shares with the next one.
+
+    Returns:
+        list[list[tuple[str, int]]]: The sentences of each chunk.
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+    for sentence, token_count in sentences:
+        if current and current_tokens + token_count > max_tokens:
+            chunks.append(current)
+
+            # Carry whole trailing sentences over, leaving room for the sentence that did not fit
+            carried = []
+            carried_tokens = 0
+            for previous, previous_count in reversed(current):
+                if carried_tokens + previous_count > min(overlap_tokens, max_tokens - token_count):
+                    break
+                carried.insert(0, (previous, previous_count))
+                carried_tokens += previous_count
+            current, current_tokens = carried, carried_tokens
+
+        current.append((sentence, token_count))
+        current_tokens += token_count
+
+    if current:
+        chunks.append(current)
+    return chunks
+
 
-def process_chunks(pages_and_texts: list[dict]) -> list[dict]:
+def iter_token_chunks(pages_and_texts, tokenizer, max_tokens: int, overlap_tokens: int = 0):
+    """
+    Lazily packs the sentences of each page into chunks that fill a token budget.
+
+    Sentence lengths are measured with the embedding model's tokenizer, one batched call per
+    page, so chunks neither overflow the model's window (and get truncated when embedded)
+    nor waste a forward pass on a few sentences. Chunks never span pages, so every chunk
+    keeps a single page number.
+
+    Args:
+        pages_and_texts (iterable of dict): Page dictionaries, each with a 'sentences' key.
+        tokenizer: A Hugging Face tokenizer, usually the embedding model's.
+        max_tokens (int): The token budget of a chunk, excluding special tokens.
+        overlap_tokens (int): The maximum number of tokens a chunk shares with the next one.
+
+    Yields:
+        Chunk: Page number, sentence chunk and statistics of each chunk, with exact token counts.
+    """
+    for item in pages_and_texts:
+        # Clean sentences up front, so the counted text is exactly the text that is embedded
+        sentences = [join_and_clean_chunk([sentence]) for sentence in item["sentences"]]
+        sentences = [sentence for sentence in sentences if sentence]
+
+        pieces = []
+        for sentence, token_count in zip(sentences, count_tokens(sentences, tokenizer)):
+            pieces.extend(split_long_sentence(sentence, token_count, tokenizer, max_tokens))
+
+        for chunk in pack_sentences(pieces, max_tokens, overlap_tokens):
+            yield Chunk(item["page_number"],
+                        " ".join(sentence for sentence, _ in chunk),
+                        sum(token_count for _, token_count in chunk))
+
+
+class ChunkReport:
+    """
+    Running statistics of chunk token counts against the embedding model's window.
+
+    A chunk above `max_tokens` is truncated when it is embedded, so its tail is never searchable;
+    a chunk below `min_fill * max_tokens` spends a whole forward pass on little text.
+    """
+
+    def __init__(self, max_tokens: int, min_fill: float = 0.5):
+        self.max_tokens = max_tokens
+        self.min_fill = min_fill
+        self.num_chunks = 0
+        self.total_tokens = 0
+        self.truncated_chunks = 0
+        self.truncated_tokens = 0
+        self.underfilled_chunks = 0
+
+    def add(self, token_count: float):
+        self.num_chunks += 1
+        self.total_tokens += token_count
+        if token_count > self.max_tokens:
+            self.truncated_chunks += 1
+            self.truncated_tokens += token_count - self.max_tokens
+        elif token_count < self.min_fill * self.max_tokens:
+            self.underfilled_chunks += 1
+
+    def track(self, chunks):
+        """
+        Pass a stream of chunks through, recording the token count of each.
+        """
+        for chunk in chunks:
+            self.add(chunk["chunk_token_count"])
+            yield chunk
+
+    def summary(self) -> dict:
+        num_chunks = max(self.num_chunks, 1)
+        return {
+            "num_chunks": self.num_chunks,
+            "max_tokens": self.max_tokens,
+            "mean_tokens": round(self.total_tokens / num_chunks, 1),
+            "fill_rate": round(self.total_tokens / num_chunks / self.max_tokens, 3),
+            "truncated_chunks": self.truncated_chunks,
+            "truncated_rate": round(self.truncated_chunks / num_chunks, 3),
+            "truncated_tokens": round(self.truncated_tokens),
+            "underfilled_chunks": self.underfilled_chunks,
+            "underfilled_rate": round(self.underfilled_chunks / num_chunks, 3)
+        }
+
+
+def process_chunks(pages_and_texts: list[dict], tokenizer=None) -> list[Chunk]:
     """
     Processes sentence chunks for each page and generates statistics for each chunk.
 
     Args:
         pages_and_texts (list[dict]): A list of dictionaries where each dictionary contains 
                                       'sentence_chunks' for each page.
+        tokenizer (optional): Tokenizer used to count the tokens of each chunk.
 
     Returns:
-        list[dict]: A list of dictionaries with chunk details like page number, sentence chunk, 
-                    character count, word count, and token count.
-    """
-    pages_and_chunks = []
-
-    for item in tqdm(pages_and_texts, desc="Processing sentence chunks"):
-        for sentence_chunk in item["sentence_chunks"]:
-            chunk_dict = {
-                "page_number": item["page_number"],
-                "sentence_chunk": join_and_clean_chunk(sentence_chunk),
-                "chunk_char_count": len(join_and_clean_chunk(sentence_chunk)),
-                "chunk_word_count": len(join_and_clean_chunk(sentence_chunk).split(" ")),
-                "chunk_token_count": len(join_and_clean_chunk(sentence_chunk)) / 4  # Approximate token count
-            }
-            pages_and_chunks.append(chunk_dict)
-
-    return pages_and_chunks
+        list[Chunk]: A list of chunk records with details like page number, sentence chunk, 
+                     character count, word count, and token count.
+    """
+    return list(iter_chunks(tqdm(pages_and_texts, desc="Processing sentence chunks"), tokenizer=tokenizer))
@@ -1,12 +1,13 @@
 # modules/utils.py
-from sentence_transformers import SentenceTransformer
 import yaml
 import torch
 import numpy as np
-import pandas as pd
 
 device = "cuda" if torch.cuda.is_available() else "cpu"
 
+# Name of the SentenceTransformer used for chunk and query embeddings
+EMBEDDING_MODEL_NAME = "all-mpnet-base-v2"
+
 
 def load_config(config_path):
     """
@@ -22,7 +23,9 @@ def embedding_model(device="cpu"):
     """
     Initialising the model
     """
-    return SentenceTransformer("all-mpnet-base-v2", device=device, tokenizer_kwargs={'clean_up_tokenization_spaces': True})
+    # Imported here: sentence_transformers pulls in transformers, which takes seconds to import
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL_NAME, device=device, tokenizer_kwargs={'clean_up_tokenization_spaces': True})
 
 
 
@@ -30,6 +33,7 @@ def save_embeddings(embeddings, filepath):
     """
     Save embeddings to a file.
     """
+    import pandas as pd
     df_embeds = pd.DataFrame(embeddings)
     df_embeds.to_csv(filepath, index=False)
     # with open(filepath, 'wb') as f:
@@ -49,6 +53,7 @@ def load_embeddings(csv_path: str):
         embeddings (torch.Tensor): Tensor of embeddings converted from NumPy arrays.
     """
     # Load the CSV file into a DataFrame
+    import pandas as pd
     text_chunks_and_embedding_df = pd.read_csv(csv_path)
     
     # Convert embedding column back to NumPy array
@@ -66,42 +71,6 @@ def load_embeddings(csv_path: str):
     
     return pages_and_chunks, embeddings
 
-def cosine_similarity_tensor(tensor1: torch.Tensor, tensor2: torch.Tensor, eps: float = 1e-8) -> torch.Tensor:
-    """
-    Compute cosine similarity between two tensors.
-    
-    Args:
-    tensor1 (torch.Tensor): First input tensor. Shape can be (n, d) or (d,).
-    tensor2 (torch.Tensor): Second input tensor. Shape can be (m, d) or (d,).
-    eps (float): Small value to avoid division by zero. Default is 1e-8.
-    
-    Returns:
-    torch.Tensor: Cosine similarity. Shape will be (n, m), (n,), or (,) depending on input shapes.
-    """
-    # Ensuring both tensors are at least 2D
-    if tensor1.dim() == 1:
-        tensor1 = tensor1.unsqueeze(0)
-    if tensor2.dim() == 1:
-        tensor2 = tensor2.unsqueeze(0)
-    
-    # Compute dot product
-    dot_product = torch.mm(tensor1, tensor2.t())
-    
-    # Compute L2 norms
-    norm1 = torch.sqrt(torch.sum(tensor1 ** 2, dim=1)).unsqueeze(1)
-    norm2 = torch.sqrt(torch.sum(tensor2 ** 2, dim=1)).unsqueeze(0)
-    
-    # Compute cosine similarity
-    cos_sim = dot_product / (norm1 * norm2 + eps)
-    
-    # If both inputs were 1D, return a scalar
-    if tensor1.size(0) == 1 and tensor2.size(0) == 1:
-        return cos_sim.item()
-    
-    print(cos_sim.squeeze().shape)
-    
-    return cos_sim.squeeze()
-
 def clean_text(data):
     """
     Recursively cleans all strings within a nested dictionary by removing non-breaking spaces (\xa0) 
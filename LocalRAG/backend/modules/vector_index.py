@@ -0,0 +1,499 @@
+# modules/vector_index.py
+import os
+import numpy as np
+import torch
+
+INDEX_FILENAMES = {"ivf": "index.ivf", "hnsw": "index.hnsw", "int8": "index.int8", "binary": "index.binary"}
+
+# Backends that keep compact codes in memory and rescore a shortlist against the float rows
+QUANTIZED_BACKENDS = ("int8", "binary")
+
+# Masks of the SWAR bit count, which counts set bits in each 64-bit word without a lookup table
+POPCOUNT_MASKS = [np.uint64(mask) for mask in (0x5555555555555555, 0x3333333333333333,
+                                               0x0F0F0F0F0F0F0F0F, 0x0101010101010101)]
+
+# Upper bound on the temporary float rows and scores materialised per block of rows during a scan
+SCAN_BLOCK_ELEMENTS = 1 << 22
+
+
+def as_query_matrix(query_embeddings) -> torch.Tensor:
+    """
+    Return query embeddings as a 2D float32 tensor of shape (num_queries, dim).
+    """
+    query_embeddings = torch.as_tensor(query_embeddings, dtype=torch.float32)
+    if query_embeddings.dim() == 1:
+        query_embeddings = query_embeddings.unsqueeze(0)
+    return query_embeddings.cpu()
+
+
+class VectorIndex:
+    """
+    Interface of a searchable set of embeddings scored by inner product.
+
+    Subclasses implement `search`; indexes that are expensive to build also implement
+    `save` and `load` so they can be persisted next to the embeddings they were built from.
+    """
+    backend = None
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def search(self, query_embeddings, k: int):
+        """
+        Find the k best rows for each query.
+
+        Args:
+            query_embeddings (torch.Tensor): Shape (dim,) or (num_queries, dim).
+            k (int): Number of results per query.
+
+        Returns:
+            scores (torch.Tensor), indices (torch.Tensor): Both of shape (num_queries, k), best first.
+        """
+        raise NotImplementedError
+
+    def save(self, path: str):
+        raise NotImplementedError
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Approximate memory held by the index itself, beyond the embeddings it was built from.
+        """
+        return 0
+
+
+class ExactIndex(VectorIndex):
+    """
+    Brute-force scoring against every embedding. Always exact, no build step.
+
+    float16 embeddings stay as stored (e.g. memory-mapped) and are upcast one block of rows
+    at a time while they are scored, so no float32 copy of the matrix is ever held.
+    """
+    backend = "exact"
+
+    def __init__(self, embeddings: torch.Tensor):
+        self.embeddings = embeddings
+
+    def __len__(self):
+        return self.embeddings.shape[0]
+
+    def search(self, query_embeddings, k: int):
+        query_embeddings = as_query_matrix(query_embeddings).to(self.embeddings.device)
+        if self.embeddings.dtype == torch.float32 or len(self) == 0:
+            scores = torch.mm(query_embeddings, self.embeddings.float().t())
+        else:
+            block_rows = max(1024, SCAN_BLOCK_ELEMENTS // self.embeddings.shape[1])
+            scores = torch.cat([torch.mm(query_embeddings, block.float().t())
+                                for block in self.embeddings.split(block_rows)], dim=1)
+        return torch.topk(scores, k=min(k, len(self)), dim=1)
+
+
+class IVFIndex(VectorIndex):
+    """
+    FAISS inverted-file index. Vectors are clustered into `nlist` lists and a query only scans
+    the `nprobe` closest lists; raising `nprobe` trades latency for recall.
+    """
+    backend = "ivf"
+
+    def __init__(self, faiss_index, nprobe: int = 8):
+        self.index = faiss_index
+        self.set_nprobe(nprobe)
+
+    @staticmethod
+    def _faiss():
+        try:
+            import faiss
+        except ImportError as error:
+            raise ImportError("The 'ivf' index backend requires faiss-cpu: pip install faiss-cpu") from error
+        return faiss
+
+    @classmethod
+    def build(cls, embeddings: torch.Tensor, nlist: int = 64, nprobe: int = 8):
+        faiss = cls._faiss()
+        vectors = np.ascontiguousarray(embeddings.cpu().numpy(), dtype=np.float32)
+
+        # FAISS wants roughly 39 training points per list; shrink nlist for small documents
+        nlist = max(1, min(nlist, len(vectors) // 39 or 1))
+        quantizer = faiss.IndexFlatIP(vectors.shape[1])
+        index = faiss.IndexIVFFlat(quantizer, vectors.shape[1], nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+        index.add(vectors)
+        return cls(index, nprobe=nprobe)
+
+    @classmethod
+    def load(cls, path: str, nprobe: int = 8):
+        return cls(cls._faiss().read_index(path), nprobe=nprobe)
+
+    def set_nprobe(self, nprobe: int):
+        self.index.nprobe = max(1, min(nprobe, self.index.nlist))
+
+    def __len__(self):
+        return self.index.ntotal
+
+    def save(self, path: str):
+        self._faiss().write_index(self.index, path)
+
+    @property
+    def nbytes(self):
+        return self.index.code_size * self.index.ntotal
+
+    def search(self, query_embeddings, k: int):
+        queries = np.ascontiguousarray(as_query_matrix(query_embeddings).numpy())
+        scores, indices = self.index.search(queries, min(k, len(self)))
+        return torch.from_numpy(scores), torch.from_numpy(indices)
+
+
+class HNSWIndex(VectorIndex):
+    """
+    hnswlib graph index. `m` and `ef_construction` set graph quality at build time;
+    `ef_search` trades latency for recall at query time.
+    """
+    backend = "hnsw"
+
+    def __init__(self, hnsw_index, ef_search: int = 64):
+        self.index = hnsw_index
+        self.ef_search = ef_search
+
+    @staticmethod
+    def _hnswlib():
+        try:
+            import hnswlib
+        except ImportError as error:
+            raise ImportError("The 'hnsw' index backend requires hnswlib: pip install chroma-hnswlib") from error
+        return hnswlib
+
+    @classmethod
+    def build(cls, embeddings: torch.Tensor, m: int = 32, ef_construction: int = 200, ef_search: int = 64):
+        vectors = np.ascontiguousarray(embeddings.cpu().numpy(), dtype=np.float32)
+        index = cls._hnswlib().Index(space="ip", dim=vectors.shape[1])
+        index.init_index(max_elements=max(len(vectors), 1), ef_construction=ef_construction, M=m)
+        index.add_items(vectors, np.arange(len(vectors)))
+        return cls(index, ef_search=ef_search)
+
+    @classmethod
+    def load(cls, path: str, dim: int, ef_search: int = 64):
+        index = cls._hnswlib().Index(space="ip", dim=dim)
+        index.load_index(path)
+        return cls(index, ef_search=ef_search)
+
+    def __len__(self):
+        return self.index.get_current_count()
+
+    def save(self, path: str):
+        self.index.save_index(path)
+
+    @property
+    def nbytes(self):
+        # Vector payload only; the graph links add roughly 8 * m bytes per row
+        return len(self) * self.index.dim * 4
+
+    def search(self, query_embeddings, k: int):
+        k = min(k, len(self))
+        # ef must be at least k for hnswlib to return k results
+        self.index.set_ef(max(self.ef_search, k))
+        labels, distances = self.index.knn_query(as_query_matrix(query_embeddings).numpy(), k=k)
+        # hnswlib reports inner-product distance as 1 - ip
+        return torch.from_numpy(1.0 - distances), torch.from_numpy(labels.astype(np.int64))
+
+
+class QuantizedIndex(VectorIndex):
+    """
+    Scores compact codes of the embeddings in a first pass, then rescores the best
+    `k * rescore_multiplier` candidates exactly against the float rows.
+
+    Only the codes need to be resident: the float rows stay memory-mapped from the vector
+    store and just the candidates' rows are read. Subclasses define the codes and `block_scores`.
+    """
+
+    def __init__(self, embeddings: torch.Tensor, codes: np.ndarray, rescore_multiplier: int = 8):
+        self.embeddings = embeddings
+        self.codes = codes
+        self.rescore_multiplier = rescore_multiplier
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+    def block_scores(self, query_embeddings: torch.Tensor, start: int, stop: int) -> torch.Tensor:
+        """
+        Approximate scores of rows start..stop for each query, higher is better.
+        """
+        raise NotImplementedError
+
+    def candidates(self, query_embeddings: torch.Tensor, num_candidates: int) -> torch.Tensor:
+        """
+        Indices of the best `num_candidates` rows per query by approximate score.
+        """
+        # Each block expands to (rows x dim) float codes plus (queries x rows) scores
+        block_rows = max(1024, SCAN_BLOCK_ELEMENTS // (query_embeddings.shape[0] + self.embeddings.shape[1]))
+
+        # Keep the best rows of every block, then pick the overall best among them
+        all_scores, all_indices = [], []
+        for start in range(0, len(self), block_rows):
+            stop = min(start + block_rows, len(self))
+            scores = self.block_scores(query_embeddings, start, stop)
+            top_scores, positions = torch.topk(scores, k=min(num_candidates, stop - start), dim=1)
+            all_scores.append(top_scores)
+            all_indices.append(positions + start)
+
+        scores = torch.cat(all_scores, dim=1)
+        indices = torch.cat(all_indices, dim=1)
+        _, positions = torch.topk(scores, k=min(num_candidates, scores.shape[1]), dim=1)
+        return torch.gather(indices, 1, positions)
+
+    def search(self, query_embeddings, k: int):
+        query_embeddings = as_query_matrix(query_embeddings)
+        k = min(k, len(self))
+        candidates = self.candidates(query_embeddings, min(k * self.rescore_multiplier, len(self)))
+
+        # Exact inner products against the float rows of the shortlist only
+        rows = self.embeddings[candidates].float()  # (num_queries, num_candidates, dim)
+        exact_scores = torch.bmm(rows, query_embeddings.unsqueeze(2)).squeeze(2)
+        top_scores, positions = torch.topk(exact_scores, k=k, dim=1)
+        return top_scores, torch.gather(candidates, 1, positions)
+
+    def save(self, path: str):
+        with open(path, "wb") as file:
+            np.save(file, self.codes)
+
+    @classmethod
+    def iter_blocks(cls, embeddings: torch.Tensor, block_rows: int = 65536):
+        """
+        Yield the float rows of a (possibly memory-mapped) matrix a block at a time.
+        """
+        for start in range(0, embeddings.shape[0], block_rows):
+            yield embeddings[start:start + block_rows].float().numpy()
+
+
+class Int8Index(QuantizedIndex):
+    """
+    Scalar int8 quantization: each dimension is scaled by its largest absolute value in the
+    document, so codes take a quarter of the memory of float32 rows.
+    """
+    backend = "int8"
+
+    def __init__(self, embeddings: torch.Tensor, codes: np.ndarray, scale: np.ndarray, rescore_multiplier: int = 8):
+        super().__init__(embeddings, codes, rescore_multiplier)
+        self.scale = torch.from_numpy(scale)
+
+    @classmethod
+    def build(cls, embeddings: torch.Tensor, rescore_multiplier: int = 8):
+        max_abs = np.zeros(embeddings.shape[1], dtype=np.float32)
+        for block in cls.iter_blocks(embeddings):
+            max_abs = np.maximum(max_abs, np.abs(block).max(axis=0))
+        scale = np.maximum(max_abs, 1e-12) / 127
+
+        codes = np.concatenate([np.clip(np.rint(block / scale), -127, 127).astype(np.int8)
+                                for block in cls.iter_blocks(embeddings)])
+        return cls(embeddings, codes, scale.astype(np.float32), rescore_multiplier)
+
+    @classmethod
+    def load(cls, path: str, embeddings: torch.Tensor, rescore_multiplier: int = 8):
+        with open(path, "rb") as file:
+            codes = np.load(file)
+            scale = np.load(file)
+        return cls(embeddings, codes, scale, rescore_multiplier)
+
+    def save(self, path: str):
+        with open(path, "wb") as file:
+            np.save(file, self.codes)
+            np.save(file, self.scale.numpy())
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.scale.numel() * 4
+
+    def block_scores(self, query_embeddings, start, stop):
+        # Folding the scale into the query dequantizes the codes inside the matmul
+        block = torch.from_numpy(self.codes[start:stop]).float()
+        return torch.mm(query_embeddings * self.scale, block.t())
+
+
+def popcount64(words: np.ndarray) -> np.ndarray:
+    """
+    Number of set bits in every element of a uint64 array.
+    """
+    m1, m2, m4, h01 = POPCOUNT_MASKS
+    words = words - ((words >> np.uint64(1)) & m1)
+    words = (words & m2) + ((words >> np.uint64(2)) & m2)
+    words = (words + (words >> np.uint64(4))) & m4
+    return (words * h01) >> np.uint64(56)
+
+
+def pack_signs(vectors: np.ndarray) -> np.ndarray:
+    """
+    Pack the sign bit of every dimension, padded to whole 64-bit words.
+    """
+    bits = np.packbits(vectors > 0, axis=1)
+    return np.pad(bits, ((0, 0), (0, -bits.shape[1] % 8)))
+
+
+class BinaryIndex(QuantizedIndex):
+    """
+    Binary quantization: one sign bit per dimension, so codes take 1/32 of the memory of
+    float32 rows. Candidates are the rows with the smallest Hamming distance to the query's signs.
+    """
+    backend = "binary"
+
+    @classmethod
+    def build(cls, embeddings: torch.Tensor, rescore_multiplier: int = 8):
+        codes = np.concatenate([pack_signs(block) for block in cls.iter_blocks(embeddings)])
+        return cls(embeddings, codes, rescore_multiplier)
+
+    @classmethod
+    def load(cls, path: str, embeddings: torch.Tensor, rescore_multiplier: int = 8):
+        with open(path, "rb") as file:
+            return cls(embeddings, np.load(file), rescore_multiplier)
+
+    def block_scores(self, query_embeddings, start, stop):
+        query_words = pack_signs(query_embeddings.numpy()).view(np.uint64)
+        row_words = self.codes[start:stop].view(np.uint64)
+        # One query at a time keeps the temporaries at the size of the block's codes
+        hamming = np.stack([popcount64(row_words ^ query).sum(axis=1) for query in query_words])
+        return -torch.from_numpy(hamming.astype(np.float32))
+
+
+QUANTIZED_INDEXES = {"int8": Int8Index, "binary": BinaryIndex}
+
+
+class ShardedIndex(VectorIndex):
+    """
+    Searches several indexes over consecutive row ranges and merges their results,
+    so a corpus can be queried without rebuilding per-document indexes into one.
+    """
+    backend = "sharded"
+
+    def __init__(self, shards: list[tuple[int, VectorIndex]]):
+        self.shards = shards  # (row offset, index) pairs
+
+    def __len__(self):
+        return sum(len(index) for _, index in self.shards)
+
+    @property
+    def nbytes(self):
+        return sum(index.nbytes for _, index in self.shards)
+
+    def search(self, query_embeddings, k: int):
+        query_embeddings = as_query_matrix(query_embeddings)
+        all_scores, all_indices = [], []
+        for offset, index in self.shards:
+            if len(index) == 0:
+                continue
+            scores, indices = index.search(query_embeddings, k)
+            # FAISS pads missing results with index -1; keep them at the bottom of the merge
+            scores = scores.float().masked_fill(indices < 0, float("-inf"))
+            all_scores.append(scores)
+            all_indices.append(torch.where(indices < 0, indices.long(), indices.long() + offset))
+
+        if not all_scores:
+            empty = torch.empty((query_embeddings.shape[0], 0))
+            return empty, empty.long()
+
+        scores = torch.cat(all_scores, dim=1)
+        indices = torch.cat(all_indices, dim=1)
+        top_scores, positions = torch.topk(scores, k=min(k, scores.shape[1]), dim=1)
+        return top_scores, torch.gather(indices, 1, positions)
+
+
+def build_index(embeddings: torch.Tensor, config: dict) -> VectorIndex:
+    """
+    Build the index selected by `config['index_backend']` ('exact', 'ivf', 'hnsw', 'int8' or 'binary').
+    """
+    backend = config.get("index_backend", "exact")
+    if backend == "exact" or embeddings.shape[0] == 0:
+        return ExactIndex(embeddings)
+    if backend == "ivf":
+        return IVFIndex.build(embeddings, nlist=config["ivf_nlist"], nprobe=config["ivf_nprobe"])
+    if backend == "hnsw":
+        return HNSWIndex.build(embeddings, m=config["hnsw_m"],
+                               ef_construction=config["hnsw_ef_construction"],
+                               ef_search=config["hnsw_ef_search"])
+    if backend in QUANTIZED_INDEXES:
+        return QUANTIZED_INDEXES[backend].build(embeddings, rescore_multiplier=config["rescore_multiplier"])
+    raise ValueError(f"Unknown index backend '{backend}'. Choose from 'exact', 'ivf', 'hnsw', 'int8' or 'binary'.")
+
+
+def save_index(index: VectorIndex, store_dir: str):
+    """
+    Persist an ANN index next to the embeddings it was built from. Exact indexes need no file.
+    """
+    if index.backend in INDEX_FILENAMES:
+        index.save(os.path.join(store_dir, INDEX_FILENAMES[index.backend]))
+
+
+def load_or_build_index(store_dir: str, embeddings: torch.Tensor, config: dict) -> VectorIndex:
+    """
+    Load the persisted index of a store, building and saving it first if it is missing.
+    """
+    backend = config.get("index_backend", "exact")
+    if backend not in INDEX_FILENAMES or embeddings.shape[0] == 0:
+        return build_index(embeddings, config)
+
+    path = os.path.join(store_dir, INDEX_FILENAMES[backend])
+    if os.path.exists(path):
+        if backend == "ivf":
+            return IVFIndex.load(path, nprobe=config["ivf_nprobe"])
+        if backend == "hnsw":
+            return HNSWIndex.load(path, dim=embeddings.shape[1], ef_search=config["hnsw_ef_search"])
+        return QUANTIZED_INDEXES[backend].load(path, embeddings, rescore_multiplier=config["rescore_multiplier"])
+
+    index = build_index(embeddings, config)
+    save_index(index, store_dir)
+    return index
+
+
+def recall_at_k(index: VectorIndex, exact_index: VectorIndex, query_embeddings, k: int = 10) -> float:
+    """
+    Fraction of the exact top-k results that the index also returns, averaged over queries.
+
+    Args:
+        index (VectorIndex): The approximate index under test.
+        exact_index (VectorIndex): The exact index over the same embeddings.
+        query_embeddings (torch.Tensor): Queries of shape (num_queries, dim).
+        k (int): Number of results compared per query.
+
+    Returns:
+        float: Recall@k between 0 and 1.
+    """
+    _, approximate = index.search(query_embeddings, k)
+    _, exact = exact_index.search(query_embeddings, k)
+
+    hits = 0
+    for approximate_row, exact_row in zip(approximate.tolist(), exact.tolist()):
+        hits += len(set(approximate_row) & set(exact_row))
+    return hits / max(exact.numel(), 1)
+
+
+if __name__ == "__main__":
+    # Recall check of the configured backend against exact search, per document in the corpus:
+    #   python -m modules.vector_index [num_queries] [k]
+    import sys
+    import time
+    from modules.utils import load_config
+    from modules.corpus import Corpus
+    from modules.vector_store import load_vector_store
+
+    config = load_config("config.yaml")
+    num_queries = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else config["top_k"]
+    corpus = Corpus(config["corpus_dir"])
+
+    for document_id, entry in sorted(corpus.documents().items()):
+        store_dir = os.path.join(corpus.corpus_dir, entry["store"])
+        _, embeddings = load_vector_store(store_dir)
+        if embeddings.shape[0] == 0:
+            continue
+
+        # Stored chunks, slightly perturbed, stand in for real queries
+        sample = embeddings[torch.randperm(embeddings.shape[0])[:num_queries]]
+        queries = sample + 0.01 * torch.randn_like(sample)
+
+        index = load_or_build_index(store_dir, embeddings, config)
+        start_time = time.perf_counter()
+        recall = recall_at_k(index, ExactIndex(embeddings), queries, k=k)
+        elapsed = time.perf_counter() - start_time
+        print(f"{document_id}: {config['index_backend']} recall@{k} = {recall:.3f} "
+              f"over {len(queries)} queries ({elapsed * 1000 / len(queries):.2f} ms/query incl. exact)")
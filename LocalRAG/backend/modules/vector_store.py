@@ -0,0 +1,322 @@
+# modules/vector_store.py
+import os
+import json
+import struct
+import logging
+import numpy as np
+import torch
+from modules.utils import load_embeddings
+
+logger = logging.getLogger(__name__)
+
+# Binary layout of the embeddings file: a fixed-size header followed by a row-major matrix
+STORE_MAGIC = b"LRAGVEC\x00"
+STORE_VERSION = 2  # Version 2 stores L2-normalized rows; version 1 files are upgraded by `upgrade_store`
+SUPPORTED_VERSIONS = (1, 2)
+HEADER_FORMAT = "<8sIIQQ"  # magic, version, dtype code, number of rows, embedding dimension
+HEADER_SIZE = 64  # Header is padded so the matrix starts on an aligned offset
+
+EMBEDDINGS_FILENAME = "embeddings.bin"
+METADATA_FILENAME = "chunks.jsonl"
+PAGES_FILENAME = "pages.json"
+
+# Supported on-disk dtypes and their codes in the header
+DTYPE_CODES = {"float32": 1, "float16": 2}
+CODE_DTYPES = {code: name for name, code in DTYPE_CODES.items()}
+
+
+def vector_store_exists(store_dir: str) -> bool:
+    """
+    Check whether a vector store has been written to the given directory.
+    """
+    return (os.path.exists(os.path.join(store_dir, EMBEDDINGS_FILENAME))
+            and os.path.exists(os.path.join(store_dir, METADATA_FILENAME)))
+
+
+def write_header(file, dtype: str, num_rows: int, dim: int):
+    """
+    Write the fixed-size store header at the current position of an open binary file.
+
+    Args:
+        file: File object opened in binary write mode.
+        dtype (str): The on-disk dtype of the vectors ('float32' or 'float16').
+        num_rows (int): Number of embedding rows in the file.
+        dim (int): Dimension of each embedding.
+    """
+    header = struct.pack(HEADER_FORMAT, STORE_MAGIC, STORE_VERSION, DTYPE_CODES[dtype], num_rows, dim)
+    file.write(header.ljust(HEADER_SIZE, b"\x00"))
+
+
+def read_header(embeddings_path: str) -> tuple[str, int, int, int]:
+    """
+    Read and validate the header of an embeddings file.
+
+    Args:
+        embeddings_path (str): Path to the binary embeddings file.
+
+    Returns:
+        tuple[str, int, int, int]: The dtype name, number of rows, embedding dimension and file version.
+    """
+    with open(embeddings_path, "rb") as file:
+        raw_header = file.read(HEADER_SIZE)
+
+    if len(raw_header) < HEADER_SIZE:
+        raise ValueError(f"Embeddings file {embeddings_path} is truncated.")
+
+    magic, version, dtype_code, num_rows, dim = struct.unpack_from(HEADER_FORMAT, raw_header)
+    if magic != STORE_MAGIC:
+        raise ValueError(f"{embeddings_path} is not a LocalRAG embeddings file.")
+    if version not in SUPPORTED_VERSIONS:
+        raise ValueError(f"Unsupported embeddings file version {version} (expected one of {SUPPORTED_VERSIONS}).")
+    if dtype_code not in CODE_DTYPES:
+        raise ValueError(f"Unknown dtype code {dtype_code} in {embeddings_path}.")
+
+    return CODE_DTYPES[dtype_code], num_rows, dim, version
+
+
+class VectorStoreWriter:
+    """
+    Streams chunks and their embeddings into a vector store without holding the document in memory.
+
+    Rows are L2-normalized and appended to temporary files as they arrive; `close()` patches the
+    header with the final row count and renames each file into place. Normalizing once here lets
+    retrieval score cosine with a single matmul.
+
+    The two renames are not atomic together, so a store must be written to a directory nobody
+    reads yet (`Corpus.new_store_dir`) and published only once `close()` has returned, which
+    `Corpus.commit_document` does by switching the manifest over to it.
+
+    Usage:
+        with VectorStoreWriter(store_dir, dtype="float32") as writer:
+            for batch in batches:
+                writer.append(batch)
+    """
+
+    def __init__(self, store_dir: str, dtype: str = "float32"):
+        if dtype not in DTYPE_CODES:
+            raise ValueError(f"Unsupported embedding dtype '{dtype}'. Choose from {list(DTYPE_CODES)}.")
+
+        os.makedirs(store_dir, exist_ok=True)
+        self.dtype = dtype
+        self.embeddings_path = os.path.join(store_dir, EMBEDDINGS_FILENAME)
+        self.metadata_path = os.path.join(store_dir, METADATA_FILENAME)
+        self.num_rows = 0
+        self.dim = 0
+
+        self._embeddings_file = open(self.embeddings_path + ".tmp", "wb")
+        self._metadata_file = open(self.metadata_path + ".tmp", "w", encoding="utf-8")
+        write_header(self._embeddings_file, dtype, 0, 0)  # Placeholder, rewritten on close
+
+    def append(self, pages_and_chunks: list[dict]):
+        """
+        Append a batch of chunks (`Chunk` records or dictionaries), each with an 'embedding'.
+        """
+        if not pages_and_chunks:
+            return
+
+        # Write the batch as one contiguous block of unit-length rows in the on-disk dtype
+        matrix = np.stack([np.asarray(item["embedding"], dtype=np.float32) for item in pages_and_chunks])
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        if self.num_rows and matrix.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension changed from {self.dim} to {matrix.shape[1]}.")
+        matrix.astype(self.dtype).tofile(self._embeddings_file)
+        self.dim = matrix.shape[1]
+        self.num_rows += matrix.shape[0]
+
+        # Write one compact JSON object per chunk, without the embedding itself
+        for item in pages_and_chunks:
+            if hasattr(item, "to_record"):
+                record = item.to_record()
+            else:
+                record = {key: value for key, value in item.items() if key != "embedding"}
+            self._metadata_file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def close(self):
+        """
+        Finalise the header and rename both files into place, one after the other.
+
+        Each rename is atomic, but a crash between them can leave the new embeddings next to
+        the old metadata; see the class docstring for how stores are published safely.
+        """
+        self._embeddings_file.seek(0)
+        write_header(self._embeddings_file, self.dtype, self.num_rows, self.dim)
+        self._embeddings_file.close()
+        self._metadata_file.close()
+
+        os.replace(self.embeddings_path + ".tmp", self.embeddings_path)
+        os.replace(self.metadata_path + ".tmp", self.metadata_path)
+
+    def abort(self):
+        """
+        Discard everything written so far, leaving any existing store untouched.
+        """
+        self._embeddings_file.close()
+        self._metadata_file.close()
+        os.remove(self.embeddings_path + ".tmp")
+        os.remove(self.metadata_path + ".tmp")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def save_vector_store(pages_and_chunks: list[dict], store_dir: str, dtype: str = "float32"):
+    """
+    Save chunk embeddings as a binary matrix and chunk metadata as JSON lines.
+
+    Args:
+        pages_and_chunks (list[dict]): List of chunk dictionaries, each with an 'embedding' key.
+        store_dir (str): Directory where the store files are written.
+        dtype (str): On-disk dtype of the vectors, 'float32' (default) or 'float16'.
+    """
+    with VectorStoreWriter(store_dir, dtype=dtype) as writer:
+        writer.append(pages_and_chunks)
+
+
+def normalize_store_file(embeddings_path: str, dtype: str, num_rows: int, dim: int, block_rows: int = 65536):
+    """
+    Rewrite a version 1 embeddings file in the current version, with L2-normalized rows.
+
+    Rows are normalized a block at a time and the new file atomically replaces the old one,
+    so the matrix is never held in memory and readers still mapping the old file are unaffected.
+    The temporary file is private to this process, so concurrent upgrades cannot interleave.
+    """
+    source = np.memmap(embeddings_path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=(num_rows, dim))
+    temporary_path = f"{embeddings_path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as file:
+        write_header(file, dtype, num_rows, dim)
+        for block in normalized_blocks(source, block_rows):
+            block.astype(dtype).tofile(file)
+    del source
+    os.replace(temporary_path, embeddings_path)
+
+
+def normalized_blocks(matrix: np.ndarray, block_rows: int = 65536):
+    """
+    Yield the rows of a matrix L2-normalized in float32, a block of rows at a time.
+    """
+    for start in range(0, matrix.shape[0], block_rows):
+        # A copy: the rows of a float32 memory map would otherwise be a read-only view
+        block = np.array(matrix[start:start + block_rows], dtype=np.float32)
+        block /= np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+        yield block
+
+
+def upgrade_store(store_dir: str) -> bool:
+    """
+    Rewrite a version 1 store in the current version, with L2-normalized rows.
+
+    Run once per store when the corpus is opened (see `Corpus.upgrade_stores`), so loading a
+    store never writes to it.
+
+    Returns:
+        bool: True if the store was rewritten.
+    """
+    embeddings_path = os.path.join(store_dir, EMBEDDINGS_FILENAME)
+    dtype, num_rows, dim, version = read_header(embeddings_path)
+    if version >= STORE_VERSION:
+        return False
+    normalize_store_file(embeddings_path, dtype, num_rows, dim)
+    logger.info("Normalized the %d embeddings of %s to store version %d", num_rows, store_dir, STORE_VERSION)
+    return True
+
+
+def load_vector_store(store_dir: str, device: str = "cpu"):
+    """
+    Load a vector store, memory-mapping the embedding matrix into a torch tensor.
+
+    Stores are mapped zero-copy in their on-disk dtype (copy-on-write, so the file is never
+    modified): float16 rows stay float16 and are upcast by the indexes a block at a time
+    while scoring. Rows always come back L2-normalized. Loading never writes: a version 1
+    store not upgraded yet by `upgrade_store` (e.g. in a read-only corpus) is normalized
+    into memory instead of being mapped.
+
+    Args:
+        store_dir (str): Directory containing the store files.
+        device (str): Device to move the embeddings to.
+
+    Returns:
+        pages_and_chunks (list of dict): List of chunk metadata dictionaries.
+        embeddings (torch.Tensor): Tensor of shape (num_chunks, dim) with unit-length rows,
+                                   float32 or float16 like the store.
+    """
+    embeddings_path = os.path.join(store_dir, EMBEDDINGS_FILENAME)
+    metadata_path = os.path.join(store_dir, METADATA_FILENAME)
+
+    dtype, num_rows, dim, version = read_header(embeddings_path)
+
+    # Empty files cannot be memory-mapped
+    if num_rows == 0:
+        embeddings = torch.empty((0, dim), dtype=torch.float32)
+    else:
+        matrix = np.memmap(embeddings_path, dtype=dtype, mode="c", offset=HEADER_SIZE, shape=(num_rows, dim))
+        if version < 2:
+            logger.warning("%s predates store version %d; normalizing its %d embeddings in memory",
+                           store_dir, STORE_VERSION, num_rows)
+            normalized = np.empty((num_rows, dim), dtype=dtype)
+            start = 0
+            for block in normalized_blocks(matrix):
+                normalized[start:start + len(block)] = block
+                start += len(block)
+            matrix = normalized
+        embeddings = torch.from_numpy(matrix)
+
+    with open(metadata_path, "r", encoding="utf-8") as file:
+        pages_and_chunks = [json.loads(line) for line in file if line.strip()]
+
+    if len(pages_and_chunks) != num_rows:
+        raise ValueError(f"Store at {store_dir} is inconsistent: {num_rows} embeddings "
+                         f"but {len(pages_and_chunks)} metadata records.")
+
+    return pages_and_chunks, embeddings.to(device)
+
+
+def save_page_index(store_dir: str, pages: list[dict]):
+    """
+    Save the fingerprint and chunk rows of every page of a store's document.
+
+    Args:
+        store_dir (str): Directory of the store.
+        pages (list[dict]): One entry per page, in page order, with 'page_number', 'sha256'
+                            and the [start, stop) rows of its chunks.
+    """
+    path = os.path.join(store_dir, PAGES_FILENAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(pages, file, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+
+def load_page_index(store_dir: str):
+    """
+    Load the page fingerprints saved with a store.
+
+    Returns:
+        list[dict]: The entries written by `save_page_index`, or None for stores written without one.
+    """
+    path = os.path.join(store_dir, PAGES_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def migrate_csv_to_vector_store(csv_path: str, store_dir: str, dtype: str = "float32"):
+    """
+    One-shot migration of a legacy embeddings CSV into the binary vector store.
+
+    The CSV is renamed with a '.migrated' suffix afterwards so it is not converted again.
+
+    Args:
+        csv_path (str): Path to the legacy CSV written by `save_embeddings`.
+        store_dir (str): Directory where the new store is written.
+        dtype (str): On-disk dtype of the vectors.
+    """
+    pages_and_chunks, _ = load_embeddings(csv_path)
+    save_vector_store(pages_and_chunks, store_dir, dtype=dtype)
+    os.replace(csv_path, csv_path + ".migrated")
+    logger.info("Migrated %d embeddings from %s to %s", len(pages_and_chunks), csv_path, store_dir)
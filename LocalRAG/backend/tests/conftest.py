@@ -0,0 +1,7 @@
+# tests/conftest.py
+import os
+import sys
+
+# Tests import the backend's modules the way the app does: `from modules.x import y`
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
@@ -0,0 +1,82 @@
+# tests/test_corpus.py
+import gc
+import os
+import threading
+import time
+import numpy as np
+from modules.corpus import Corpus
+from modules.index_registry import IndexRegistry
+from modules.vector_store import VectorStoreWriter
+
+
+def commit_version(corpus, document_id, text):
+    store_dir = corpus.new_store_dir(document_id)
+    with VectorStoreWriter(store_dir) as writer:
+        writer.append([{"sentence_chunk": text, "page_number": 0, "embedding": np.array([1.0, 0.0], dtype=np.float32)}])
+    corpus.commit_document(document_id, store_dir)
+    return store_dir
+
+
+def test_unread_store_is_deleted_when_replaced(tmp_path):
+    corpus = Corpus(str(tmp_path))
+    first = commit_version(corpus, "doc", "first")
+    second = commit_version(corpus, "doc", "second")
+
+    assert not os.path.exists(first)
+    assert os.path.exists(second)
+
+
+def test_replaced_store_outlives_the_snapshot_serving_it(tmp_path):
+    corpus = Corpus(str(tmp_path))
+    registry = IndexRegistry()
+    first = commit_version(corpus, "doc", "first")
+    snapshot = registry.load(corpus.load)
+
+    second = commit_version(corpus, "doc", "second")
+    assert os.path.exists(first)
+    assert snapshot.pages_and_chunks[0]["sentence_chunk"] == "first"
+
+    # Still kept once the registry has swapped, as long as a reader holds the old snapshot
+    registry.load(corpus.load)
+    assert os.path.exists(first)
+
+    del snapshot
+    gc.collect()
+    assert not os.path.exists(first)
+    assert os.path.exists(second)
+
+
+def test_removed_store_is_deleted_when_its_lease_is_released(tmp_path):
+    corpus = Corpus(str(tmp_path))
+    store_dir = commit_version(corpus, "doc", "only")
+    entries, lease = corpus.lease_documents(["doc", "missing"])
+    assert list(entries) == ["doc"]
+
+    with lease:
+        assert corpus.remove_document("doc")
+        assert os.path.exists(store_dir)
+    assert not os.path.exists(store_dir)
+
+    lease.release()  # Releasing twice is harmless
+    assert corpus.documents() == {}
+
+
+def test_jobs_on_the_same_document_run_one_at_a_time(tmp_path):
+    corpus = Corpus(str(tmp_path))
+    running = {"doc": 0, "other": 0}
+    overlaps = []
+
+    def job(document_id):
+        with corpus.document_lock(document_id):
+            running[document_id] += 1
+            overlaps.append(running[document_id] > 1)
+            time.sleep(0.01)
+            running[document_id] -= 1
+
+    threads = [threading.Thread(target=job, args=(document_id,)) for document_id in ["doc", "other"] * 4]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(overlaps) == 8 and not any(overlaps)
@@ -0,0 +1,131 @@
+# tests/test_ingestion.py
+import hashlib
+import os
+import shutil
+import numpy as np
+import pytest
+from modules.pdf_processing import page_record
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.yaml")
+
+# Pages of the first version; chunks are separated by "|" and page 3 has no text
+FIRST_VERSION = ["a1 a1|a2", "b1", "c1|c2 c2 c2|c3", "", "e1|e2"]
+
+
+@pytest.fixture(scope="module")
+def main(tmp_path_factory):
+    # modules.main reads config.yaml and opens the corpus and embedding cache in the working directory
+    work_dir = tmp_path_factory.mktemp("ingestion")
+    shutil.copy(CONFIG_PATH, work_dir)
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(work_dir)
+        import modules.main as main
+    return main
+
+
+class FakePipeline:
+    """
+    Stands in for PDF extraction, chunking and the embedding model, recording which pages were chunked.
+    The "PDF" is the list of its page texts.
+    """
+
+    def __init__(self, monkeypatch, main):
+        self.chunked_pages = []
+        monkeypatch.setattr(main, "text_formatter", lambda pdf_path: pdf_path)
+        monkeypatch.setattr(main, "iter_pdf_pages", self.iter_pdf_pages)
+        monkeypatch.setattr(main, "iter_page_chunks", self.iter_page_chunks)
+        monkeypatch.setattr(main, "iter_embedded_chunks", self.iter_embedded_chunks)
+        monkeypatch.setattr(main, "embed_model", main.LazySingleton("embedding_model", object))
+
+    def iter_pdf_pages(self, texts, num_workers=1):
+        for page_number, text in enumerate(texts):
+            yield page_record(page_number, text)
+
+    def iter_page_chunks(self, pages, config, clock=None):
+        for page in pages:
+            self.chunked_pages.append(page["page_number"])
+            for part in page["text"].split("|"):
+                if part:
+                    yield {"page_number": page["page_number"], "sentence_chunk": part,
+                           "chunk_token_count": len(part.split())}
+
+    def iter_embedded_chunks(self, chunks, model, batch_size=32, max_batch_tokens=8192, window_size=256, cache=None):
+        # Windows of two chunks, so windows cross page boundaries
+        window = []
+        for chunk in chunks:
+            digest = hashlib.sha256(chunk["sentence_chunk"].encode("utf-8")).digest()
+            window.append({**chunk, "embedding": np.frombuffer(digest, dtype=np.uint8).astype(np.float32)})
+            if len(window) == 2:
+                yield window
+                window = []
+        if window:
+            yield window
+
+
+def ingest(main, texts, previous=None):
+    page_index = []
+    windows = list(main.iter_pdf_embeddings(texts, main.config, previous=previous, page_index=page_index))
+    return [chunk for window in windows for chunk in window], page_index
+
+
+def stored_pages(chunks, page_index):
+    """
+    What `previous_page_chunks` returns for a stored version: records without embeddings and embedding rows.
+    """
+    records = [{key: value for key, value in chunk.items() if key != "embedding"} for chunk in chunks]
+    embeddings = np.stack([chunk["embedding"] for chunk in chunks])
+    return {page["sha256"]: (records[page["start"]:page["stop"]], embeddings[page["start"]:page["stop"]])
+            for page in page_index}
+
+
+def comparable(chunks):
+    return [(chunk["page_number"], chunk["sentence_chunk"], chunk["embedding"].tolist()) for chunk in chunks]
+
+
+@pytest.mark.parametrize("second_version, expected_chunked", [
+    (FIRST_VERSION, []),                                               # unchanged
+    (["a1 a1|a2", "b1", "c1|cX|c3", "", "e1|e2"], [2]),                # edited page
+    (["a1 a1|aX", "b1", "c1|c2 c2 c2|c3", "", "e1|e2"], [0]),          # edited first page
+    (["a1 a1|a2", "b1", "c1|c2 c2 c2|c3", "", "e1|eX|e3"], [4]),       # edited last page
+    (["a1 a1|a2", "new1|new2", "b1", "c1|c2 c2 c2|c3", "", "e1|e2"], [1]),  # inserted page
+    (["a1 a1|a2", "c1|c2 c2 c2|c3", "", "e1|e2"], []),                 # deleted page
+    (["b1", "c1|c2 c2 c2|c3", "", "e1|e2", "f1"], [4]),                # deleted first page, appended last
+    (["a1 a1|a2", "b1", "c1|c2 c2 c2|c3", "d1", "e1|e2"], [3]),        # empty page filled
+    (["a1 a1|a2", "", "c1|c2 c2 c2|c3", "", "e1|e2"], []),             # page emptied
+    (["x1|x2", "y1", "z1|z2"], [0, 1, 2]),                             # nothing reused
+])
+def test_spliced_revision_matches_fresh_ingestion(monkeypatch, main, second_version, expected_chunked):
+    pipeline = FakePipeline(monkeypatch, main)
+    previous = stored_pages(*ingest(main, FIRST_VERSION))
+
+    pipeline.chunked_pages.clear()
+    chunks, page_index = ingest(main, second_version, previous=previous)
+    assert pipeline.chunked_pages == expected_chunked
+
+    fresh_chunks, fresh_page_index = ingest(main, second_version)
+    assert comparable(chunks) == comparable(fresh_chunks)
+    assert page_index == fresh_page_index
+
+
+def test_page_index_rows_are_contiguous(monkeypatch, main):
+    FakePipeline(monkeypatch, main)
+    chunks, page_index = ingest(main, FIRST_VERSION)
+
+    assert [page["page_number"] for page in page_index] == list(range(len(FIRST_VERSION)))
+    assert page_index[0]["start"] == 0 and page_index[-1]["stop"] == len(chunks)
+    for previous_page, page in zip(page_index, page_index[1:]):
+        assert page["start"] == previous_page["stop"]
+    for page in page_index:
+        assert all(chunk["page_number"] == page["page_number"] for chunk in chunks[page["start"]:page["stop"]])
+
+
+def test_reused_records_take_their_new_page_number(monkeypatch, main):
+    pipeline = FakePipeline(monkeypatch, main)
+    previous = stored_pages(*ingest(main, FIRST_VERSION))
+
+    pipeline.chunked_pages.clear()
+    chunks, _ = ingest(main, ["new"] + FIRST_VERSION, previous=previous)
+
+    assert pipeline.chunked_pages == [0]
+    assert [(chunk["page_number"], chunk["sentence_chunk"]) for chunk in chunks] == [
+        (0, "new"), (1, "a1 a1"), (1, "a2"), (2, "b1"), (3, "c1"), (3, "c2 c2 c2"), (3, "c3"), (5, "e1"), (5, "e2")]
@@ -0,0 +1,88 @@
+# tests/test_lexical_index.py
+import numpy as np
+import pytest
+from modules.lexical_index import BM25Index, ShardedLexicalIndex, tokenize
+
+# Three chunks of lengths 3, 3 and 1 (average 7/3); "cat" is in two of them, "dog" and "bird" in one
+TEXTS = ["The cat sat on a mat", "cat cat dog", "bird"]
+
+# Okapi BM25 with k1 = 1.2 and b = 0.75, worked out by hand:
+#   idf(t)    = ln(1 + (N - df + 0.5) / (df + 0.5))          -> cat: ln(1.6), dog and bird: ln(3.0)
+#   weight    = tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average_length))
+#   cat in d0 = ln(1.6) * 2.2 / (1 + 1.2 * (0.25 + 0.75 * 9 / 7))
+#   cat in d1 = ln(1.6) * 4.4 / (2 + 1.2 * (0.25 + 0.75 * 9 / 7))
+#   dog in d1 = ln(3.0) * 2.2 / (1 + 1.2 * (0.25 + 0.75 * 9 / 7))
+#   bird in d2 = ln(3.0) * 2.2 / (1 + 1.2 * (0.25 + 0.75 * 3 / 7))
+CAT_D0 = 0.42081720292932145
+CAT_D1 = 0.5981864372218454
+DOG_D1 = 0.8781843311849178
+BIRD_D2 = 1.2800652963034398
+
+
+@pytest.fixture
+def index():
+    return BM25Index.build(TEXTS, k1=1.2, b=0.75)
+
+
+def test_tokenize_drops_stopwords_and_keeps_clause_numbers():
+    assert tokenize("The cat sat on a mat") == ["cat", "sat", "mat"]
+    assert tokenize("See clause 4.2.1 of the Agreement") == ["see", "clause", "4.2.1", "agreement"]
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("cat", [CAT_D0, CAT_D1, 0.0]),
+    ("dog", [0.0, DOG_D1, 0.0]),
+    ("bird", [0.0, 0.0, BIRD_D2]),
+    ("cat dog", [CAT_D0, CAT_D1 + DOG_D1, 0.0]),
+    # Repeated query terms and stopwords do not change the scores
+    ("the cat and the cat", [CAT_D0, CAT_D1, 0.0]),
+    ("fish", [0.0, 0.0, 0.0]),
+])
+def test_scores_match_hand_computed_bm25(index, query, expected):
+    np.testing.assert_allclose(index.scores(query), expected, rtol=1e-6)
+
+
+def test_search_returns_only_matching_chunks_best_first(index):
+    scores, indices = index.search("cat dog", 10)
+    assert indices.tolist() == [1, 0]
+    np.testing.assert_allclose(scores, [CAT_D1 + DOG_D1, CAT_D0], rtol=1e-6)
+
+    scores, indices = index.search("cat dog", 1)
+    assert indices.tolist() == [1]
+
+    scores, indices = index.search("fish", 10)
+    assert len(scores) == len(indices) == 0
+
+
+def test_saved_index_scores_the_same(index, tmp_path):
+    path = str(tmp_path / "lexical.npz")
+    index.save(path)
+    loaded = BM25Index.load(path, k1=1.2, b=0.75)
+
+    assert loaded.terms == index.terms
+    for query in ("cat", "cat dog", "bird mat"):
+        np.testing.assert_array_equal(loaded.scores(query), index.scores(query))
+
+
+def test_sharded_search_scores_with_corpus_statistics(index):
+    other_texts = ["cat dog", "mat"]
+    other = BM25Index.build(other_texts, k1=1.2, b=0.75)
+    sharded = ShardedLexicalIndex([(0, index), (len(index), other)])
+    whole = BM25Index.build(TEXTS + other_texts, k1=1.2, b=0.75)
+
+    for query in ("cat", "cat dog", "mat", "dog bird", "fish"):
+        scores, indices = sharded.search(query, 10)
+        expected_scores, expected_indices = whole.search(query, 10)
+        assert indices.tolist() == expected_indices.tolist()
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-6)
+
+    # Scored within the small shard alone, "cat dog" (row 3) would look rarer and outrank row 1
+    assert sharded.search("cat", 10)[1].tolist() == [1, 3, 0]
+    assert sharded.search("cat", 1)[1].tolist() == [1]
+
+
+def test_single_shard_search_matches_its_index(index):
+    scores, indices = ShardedLexicalIndex([(5, index)]).search("cat dog", 10)
+    expected_scores, expected_indices = index.search("cat dog", 10)
+    assert indices.tolist() == (expected_indices + 5).tolist()
+    np.testing.assert_array_equal(scores, expected_scores)
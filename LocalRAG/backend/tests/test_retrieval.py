@@ -0,0 +1,46 @@
+# tests/test_retrieval.py
+import pytest
+import torch
+from modules.lexical_index import BM25Index
+from modules.retrieval import reciprocal_rank_fusion, hybrid_search
+
+
+def test_fused_order_follows_summed_reciprocal_ranks():
+    # 1: 1/61 + 1/62, 3: 1/63 + 1/61, 2: 1/62, 4: 1/63
+    scores, indices = reciprocal_rank_fusion([[1, 2, 3], [3, 1, 4]], k=10)
+
+    assert indices.tolist() == [1, 3, 2, 4]
+    expected = [1 / 61 + 1 / 62, 1 / 63 + 1 / 61, 1 / 62, 1 / 63]
+    assert torch.allclose(scores, torch.tensor(expected), atol=1e-7)
+    assert scores.dtype == torch.float32 and indices.dtype == torch.long
+
+
+def test_item_in_both_rankings_beats_a_single_top_rank():
+    _, indices = reciprocal_rank_fusion([[7, 5], [8, 5]], k=10)
+    assert indices.tolist()[0] == 5
+
+
+def test_fusion_keeps_only_the_k_best():
+    scores, indices = reciprocal_rank_fusion([[1, 2, 3], [3, 1, 4]], k=2)
+    assert indices.tolist() == [1, 3]
+    assert len(scores) == 2
+
+
+@pytest.mark.parametrize("rrf_k", [1, 60])
+def test_single_ranking_keeps_its_order(rrf_k):
+    _, indices = reciprocal_rank_fusion([[4, 0, 2]], k=3, rrf_k=rrf_k)
+    assert indices.tolist() == [4, 0, 2]
+
+
+def test_no_rankings_give_empty_results():
+    scores, indices = reciprocal_rank_fusion([[], []], k=5)
+    assert len(scores) == len(indices) == 0
+
+
+def test_hybrid_search_ignores_dense_padding():
+    lexical_index = BM25Index.build(["alpha", "beta", "gamma", "delta"])
+    # The ANN index found two candidates and padded the rest with -1
+    _, indices = hybrid_search("gamma", torch.tensor([1, 0, -1, -1]), lexical_index, k=10, num_candidates=10)
+    # The top dense and the top lexical result tie at 1/61, ahead of the second dense one
+    assert sorted(indices.tolist()[:2]) == [1, 2]
+    assert indices.tolist()[2:] == [0]
@@ -0,0 +1,143 @@
+# tests/test_text_chunking.py
+import re
+import pytest
+from modules.text_chunking import split_list, split_long_sentence, pack_sentences, iter_token_chunks, ChunkReport
+
+SENTENCES = [f"s{i}" for i in range(30)]
+
+
+def test_docstring_example():
+    chunks = split_list(SENTENCES[:17], slice_size=10, overlap=2)
+    assert chunks == [SENTENCES[0:12], SENTENCES[10:17]]
+
+
+@pytest.mark.parametrize("length", [0, 1, 2, 3, 9, 10, 11, 12, 13, 20, 21, 22, 23, 30])
+@pytest.mark.parametrize("slice_size, overlap", [(10, 2), (10, 0), (5, 4), (3, 1)])
+def test_every_sentence_is_covered_in_order_without_repeated_tails(length, slice_size, overlap):
+    sentences = SENTENCES[:length]
+    chunks = split_list(sentences, slice_size=slice_size, overlap=overlap)
+
+    # Chunks start every slice_size sentences and extend `overlap` sentences into the next one
+    for position, chunk in enumerate(chunks):
+        start = position * slice_size
+        assert chunk == sentences[start:start + slice_size + overlap]
+
+    # Together they cover every sentence, the last one ending the list
+    assert {sentence for chunk in chunks for sentence in chunk} == set(sentences)
+    if sentences:
+        assert chunks[-1][-1] == sentences[-1]
+
+    # No chunk only repeats what the previous one already holds
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert not set(chunk) <= set(previous)
+
+
+def test_empty_list_gives_no_chunks():
+    assert split_list([], slice_size=10, overlap=2) == []
+
+
+def test_list_no_longer_than_the_overlap_is_one_chunk():
+    assert split_list(SENTENCES[:2], slice_size=10, overlap=2) == [SENTENCES[:2]]
+    assert split_list(SENTENCES[:1], slice_size=10, overlap=2) == [SENTENCES[:1]]
+
+
+def test_list_ending_inside_the_overlap_is_not_split_again():
+    # Sentences 10 and 11 are already the overlap of the first chunk
+    assert split_list(SENTENCES[:12], slice_size=10, overlap=2) == [SENTENCES[:12]]
+    assert split_list(SENTENCES[:13], slice_size=10, overlap=2) == [SENTENCES[:12], SENTENCES[10:13]]
+
+
+def test_no_overlap_splits_at_slice_boundaries():
+    assert split_list(SENTENCES[:20], slice_size=10, overlap=0) == [SENTENCES[:10], SENTENCES[10:20]]
+    assert split_list(SENTENCES[:21], slice_size=10, overlap=0) == [SENTENCES[:10], SENTENCES[10:20], SENTENCES[20:21]]
+
+
+class WordTokenizer:
+    """
+    A fast-tokenizer stand-in with one token per word, so token counts can be worked out by hand.
+    """
+    is_fast = True
+
+    def __call__(self, texts, add_special_tokens=False, return_offsets_mapping=False, verbose=False):
+        if isinstance(texts, str):
+            spans = [match.span() for match in re.finditer(r"\S+", texts)]
+            return {"input_ids": list(range(len(spans))), "offset_mapping": spans}
+        return {"input_ids": [text.split() for text in texts]}
+
+
+def token_chunks(sentences, max_tokens, overlap_tokens=0):
+    pages = [{"page_number": 3, "sentences": sentences}]
+    return [(chunk["sentence_chunk"], chunk["chunk_token_count"], chunk["page_number"])
+            for chunk in iter_token_chunks(pages, WordTokenizer(), max_tokens, overlap_tokens)]
+
+
+# Sentences of 3, 2, 4 and 1 tokens
+SENTENCES_3_2_4_1 = ["one two three.", "four five.", "six seven eight nine.", "ten."]
+
+
+def test_sentences_are_packed_up_to_the_token_budget():
+    assert token_chunks(SENTENCES_3_2_4_1, max_tokens=6) == [
+        ("one two three. four five.", 5, 3),
+        ("six seven eight nine. ten.", 5, 3),
+    ]
+    # A budget that fits everything gives one chunk
+    assert token_chunks(SENTENCES_3_2_4_1, max_tokens=10) == [
+        ("one two three. four five. six seven eight nine. ten.", 10, 3)]
+
+
+def test_overlap_carries_trailing_sentences_within_the_budget():
+    assert token_chunks(SENTENCES_3_2_4_1, max_tokens=6, overlap_tokens=2) == [
+        ("one two three. four five.", 5, 3),
+        # "four five." is carried over; the 4-token sentence after it still fits in 6 tokens
+        ("four five. six seven eight nine.", 6, 3),
+        # Carrying "six seven eight nine." would exceed the 2-token overlap
+        ("ten.", 1, 3),
+    ]
+
+
+def test_overlap_never_pushes_a_chunk_over_the_budget():
+    sentences = [(f"s{i}", count) for i, count in enumerate([2, 2, 2, 5, 1, 3, 3])]
+    for max_tokens in (5, 6, 8):
+        for overlap_tokens in (0, 2, 4, 8):
+            chunks = pack_sentences(sentences, max_tokens, overlap_tokens)
+            assert all(sum(count for _, count in chunk) <= max_tokens for chunk in chunks)
+            # Every sentence appears, and consecutive chunks share at most overlap_tokens
+            assert {sentence for chunk in chunks for sentence in chunk} == set(sentences)
+            for previous, chunk in zip(chunks, chunks[1:]):
+                shared = [sentence for sentence in chunk if sentence in previous]
+                assert sum(count for _, count in shared) <= overlap_tokens
+
+
+def test_sentence_longer_than_the_budget_is_split_at_token_boundaries():
+    sentence = "a b c d e f g h i j"
+    assert split_long_sentence(sentence, 10, WordTokenizer(), max_tokens=4) == [
+        ("a b c d", 4), ("e f g h", 4), ("i j", 2)]
+    assert split_long_sentence(sentence, 10, WordTokenizer(), max_tokens=10) == [(sentence, 10)]
+
+    assert token_chunks(["x y.", sentence + "."], max_tokens=4) == [
+        ("x y.", 2, 3), ("a b c d", 4, 3), ("e f g h", 4, 3), ("i j.", 2, 3)]
+
+
+def test_chunk_report_rates_on_known_token_counts():
+    report = ChunkReport(max_tokens=100, min_fill=0.5)
+    # One truncated by 20 tokens, one full, one at the fill threshold and two below it
+    chunks = [{"chunk_token_count": count} for count in (120, 100, 50, 40, 10)]
+    assert list(report.track(chunks)) == chunks
+
+    assert report.summary() == {
+        "num_chunks": 5,
+        "max_tokens": 100,
+        "mean_tokens": 64.0,
+        "fill_rate": 0.64,
+        "truncated_chunks": 1,
+        "truncated_rate": 0.2,
+        "truncated_tokens": 20,
+        "underfilled_chunks": 2,
+        "underfilled_rate": 0.4,
+    }
+
+
+def test_empty_chunk_report():
+    summary = ChunkReport(max_tokens=384).summary()
+    assert summary["num_chunks"] == 0
+    assert summary["truncated_rate"] == summary["underfilled_rate"] == 0
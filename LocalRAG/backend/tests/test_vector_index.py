@@ -0,0 +1,86 @@
+# tests/test_vector_index.py
+import numpy as np
+import pytest
+import torch
+from modules.vector_index import ExactIndex, Int8Index, BinaryIndex, ShardedIndex
+
+
+def clustered_embeddings(num_rows=2000, dim=32, num_clusters=20, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    centres = torch.randn(num_clusters, dim, generator=generator)
+    vectors = centres[torch.randint(0, num_clusters, (num_rows,), generator=generator)]
+    vectors = vectors + 0.5 * torch.randn(num_rows, dim, generator=generator)
+    return torch.nn.functional.normalize(vectors, dim=1)
+
+
+@pytest.fixture
+def embeddings():
+    return clustered_embeddings()
+
+
+@pytest.fixture
+def queries(embeddings):
+    # Stored rows with a little noise, like questions close to a chunk
+    noisy = embeddings[:16] + 0.05 * torch.randn(16, embeddings.shape[1], generator=torch.Generator().manual_seed(1))
+    return torch.nn.functional.normalize(noisy, dim=1)
+
+
+@pytest.mark.parametrize("index_class", [Int8Index, BinaryIndex])
+def test_rescored_scores_are_exact_inner_products(index_class, embeddings, queries):
+    index = index_class.build(embeddings, rescore_multiplier=4)
+    scores, indices = index.search(queries, 10)
+
+    expected = torch.einsum("qd,qkd->qk", queries, embeddings[indices])
+    assert torch.allclose(scores, expected, atol=1e-5)
+    # Best first, like ExactIndex
+    assert torch.all(scores[:, :-1] >= scores[:, 1:])
+
+
+@pytest.mark.parametrize("index_class", [Int8Index, BinaryIndex])
+def test_rescoring_every_row_matches_exact_search(index_class, embeddings, queries):
+    # With a shortlist as long as the corpus, the first pass cannot lose any row
+    index = index_class.build(embeddings, rescore_multiplier=len(embeddings))
+    exact_scores, exact_indices = ExactIndex(embeddings).search(queries, 10)
+    scores, indices = index.search(queries, 10)
+
+    assert torch.equal(indices, exact_indices)
+    assert torch.allclose(scores, exact_scores, atol=1e-5)
+
+
+def test_int8_shortlist_keeps_exact_top_results(embeddings, queries):
+    _, exact_indices = ExactIndex(embeddings).search(queries, 5)
+    _, indices = Int8Index.build(embeddings, rescore_multiplier=8).search(queries, 5)
+    recall = np.mean([len(set(a.tolist()) & set(b.tolist())) / 5 for a, b in zip(indices, exact_indices)])
+    assert recall >= 0.95
+
+
+@pytest.mark.parametrize("index_class", [Int8Index, BinaryIndex])
+def test_saved_codes_give_the_same_results(index_class, embeddings, queries, tmp_path):
+    index = index_class.build(embeddings, rescore_multiplier=4)
+    path = str(tmp_path / "index")
+    index.save(path)
+    loaded = index_class.load(path, embeddings, rescore_multiplier=4)
+
+    scores, indices = index.search(queries, 10)
+    loaded_scores, loaded_indices = loaded.search(queries, 10)
+    assert torch.equal(indices, loaded_indices)
+    assert torch.allclose(scores, loaded_scores)
+
+
+def test_float16_rows_are_rescored_like_float32(embeddings, queries):
+    scores, indices = Int8Index.build(embeddings, rescore_multiplier=8).search(queries, 10)
+    half_scores, half_indices = Int8Index.build(embeddings.half(), rescore_multiplier=8).search(queries, 10)
+
+    assert (half_indices == indices).float().mean() >= 0.95
+    assert torch.allclose(half_scores, scores, atol=2e-3)
+
+
+def test_sharded_quantized_indexes_return_global_rows(embeddings, queries):
+    split = 1200
+    sharded = ShardedIndex([(0, Int8Index.build(embeddings[:split], rescore_multiplier=len(embeddings))),
+                            (split, Int8Index.build(embeddings[split:], rescore_multiplier=len(embeddings)))])
+    exact_scores, exact_indices = ExactIndex(embeddings).search(queries, 10)
+    scores, indices = sharded.search(queries, 10)
+
+    assert torch.equal(indices, exact_indices)
+    assert torch.allclose(scores, exact_scores, atol=1e-5)
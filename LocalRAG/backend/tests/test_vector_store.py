@@ -0,0 +1,84 @@
+# tests/test_vector_store.py
+import os
+import struct
+import numpy as np
+import pytest
+import torch
+from modules.corpus import Corpus
+from modules.vector_store import (VectorStoreWriter, load_vector_store, read_header, upgrade_store,
+                                  EMBEDDINGS_FILENAME, HEADER_FORMAT, HEADER_SIZE, STORE_MAGIC, DTYPE_CODES, STORE_VERSION)
+
+ROWS = np.array([[3.0, 4.0], [0.0, 2.0], [1.0, 1.0]], dtype=np.float32)
+UNIT_ROWS = ROWS / np.linalg.norm(ROWS, axis=1, keepdims=True)
+
+
+def write_version_1_store(store_dir, dtype="float32"):
+    """
+    A store as written before version 2: rows as embedded, not normalized.
+    """
+    with VectorStoreWriter(store_dir, dtype=dtype) as writer:
+        writer.append([{"sentence_chunk": f"chunk {i}", "page_number": i, "embedding": row} for i, row in enumerate(ROWS)])
+    path = os.path.join(store_dir, EMBEDDINGS_FILENAME)
+    with open(path, "r+b") as file:
+        file.write(struct.pack(HEADER_FORMAT, STORE_MAGIC, 1, DTYPE_CODES[dtype], len(ROWS), ROWS.shape[1]).ljust(HEADER_SIZE, b"\x00"))
+        file.write(ROWS.astype(dtype).tobytes())
+    return path
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+def test_loading_a_version_1_store_normalizes_in_memory_without_writing(tmp_path, caplog, dtype):
+    path = write_version_1_store(str(tmp_path / "store"), dtype)
+    before = open(path, "rb").read()
+
+    chunks, embeddings = load_vector_store(str(tmp_path / "store"))
+
+    assert open(path, "rb").read() == before
+    assert sorted(os.listdir(tmp_path / "store")) == ["chunks.jsonl", "embeddings.bin"]
+    assert embeddings.dtype == getattr(torch, dtype)
+    np.testing.assert_allclose(embeddings.float().numpy(), UNIT_ROWS, atol=1e-3)
+    assert [chunk["page_number"] for chunk in chunks] == [0, 1, 2]
+    assert "normalizing its 3 embeddings in memory" in caplog.text
+
+
+def test_upgrade_rewrites_a_version_1_store_once(tmp_path, caplog):
+    store_dir = str(tmp_path / "store")
+    path = write_version_1_store(store_dir)
+
+    assert upgrade_store(store_dir) is True
+    assert read_header(path) == ("float32", len(ROWS), ROWS.shape[1], STORE_VERSION)
+    assert upgrade_store(store_dir) is False
+
+    # Memory-mapped from the upgraded file rather than normalized in memory
+    _, embeddings = load_vector_store(store_dir)
+    np.testing.assert_allclose(embeddings.numpy(), UNIT_ROWS, atol=1e-6)
+    assert "in memory" not in caplog.text
+
+
+def test_corpus_upgrades_the_stores_it_lists(tmp_path):
+    corpus = Corpus(str(tmp_path))
+    for document_id in ("old", "new"):
+        store_dir = corpus.new_store_dir(document_id)
+        if document_id == "old":
+            write_version_1_store(store_dir)
+        else:
+            with VectorStoreWriter(store_dir) as writer:
+                writer.append([{"sentence_chunk": "chunk", "page_number": 0, "embedding": ROWS[0]}])
+        corpus.commit_document(document_id, store_dir)
+
+    assert corpus.upgrade_stores() == 1
+    assert corpus.upgrade_stores() == 0
+
+
+def test_read_only_corpus_keeps_serving_its_version_1_stores(tmp_path, monkeypatch):
+    corpus = Corpus(str(tmp_path))
+    store_dir = corpus.new_store_dir("old")
+    write_version_1_store(store_dir)
+    corpus.commit_document("old", store_dir)
+
+    def read_only(*args, **kwargs):
+        raise PermissionError(13, "Permission denied")
+    monkeypatch.setattr("modules.vector_store.normalize_store_file", read_only)
+
+    assert corpus.upgrade_stores() == 0
+    _, embeddings = load_vector_store(store_dir)
+    np.testing.assert_allclose(embeddings.numpy(), UNIT_ROWS, atol=1e-6)
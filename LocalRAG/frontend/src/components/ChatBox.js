@@ -1,5 +1,4 @@
 import React, { useState } from 'react';
-import axios from 'axios';
 import { marked } from 'marked'; // Markdown parser for AI responses
 import Logo from './Logo';  // AI logo component
 import UserImage from './UserImage';  // User image component
@@ -27,8 +26,36 @@ const ChatBox = ({ userMessage, setUserMessage, aiMessage, setAiMessage, loading
       setLoading(true);  // Set loading state
       loadingRef.current.continuousStart();  // Start the loading bar
 
-      const response = await axios.post(`${backendUrl}/chatbot/`, new URLSearchParams({ query }));
-      setAiMessage(response.data.answer);  // Set AI's response
+      // Stream the answer as server-sent events and show it as it is generated
+      const response = await fetch(`${backendUrl}/chatbot/stream/`, {
+        method: "POST",
+        body: new URLSearchParams({ query }),
+      });
+      if (!response.ok) throw new Error(`Request failed with status ${response.status}`);
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let answer = "";
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line; keep any incomplete event in the buffer
+        const events = buffer.split("\n\n");
+        buffer = events.pop();
+        for (const event of events) {
+          const name = event.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(event.match(/^data: (.*)$/m)?.[1] ?? "null");
+          if (name === "token") {
+            answer += data.text;
+            setAiMessage(answer);  // Show the answer so far
+          } else if (name === "error") {
+            throw new Error(data.detail);
+          }
+        }
+      }
       setQuery("");  // Clear the input field
     } catch (error) {
       console.error("Error querying chatbot:", error);  // Log error and update AI message with failure notice
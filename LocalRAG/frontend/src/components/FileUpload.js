@@ -17,6 +17,16 @@ const FileUpload = ({ setLoading, loading, loadingRef }) => {
     }
   };
 
+  // Poll the ingestion job of an upload until it succeeds or fails
+  const waitForJob = async (jobId) => {
+    while (true) {
+      const { data: job } = await axios.get(`${backendUrl}/jobs/${jobId}`);
+      if (job.status === "succeeded") return job;
+      if (job.status === "failed") throw new Error(job.error);
+      await new Promise((resolve) => setTimeout(resolve, 1000));  // Check again in a second
+    }
+  };
+
   // Handle the file upload process
   const handleFileUpload = async () => {
     // If no file is selected, alert the user
@@ -39,6 +49,9 @@ const FileUpload = ({ setLoading, loading, loadingRef }) => {
         },
       });
 
+      // The backend embeds the file in the background; wait until it is ready to be queried
+      await waitForJob(response.data.job_id);
+
       // Alert the user on successful upload
       alert(`File uploaded successfully: ${response.data.filename}`);
     } catch (error) {